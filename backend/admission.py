@@ -0,0 +1,345 @@
+"""
+Admission Control and Fair Queuing
+
+Per-client token-bucket rate limits and a fair-share scheduler that sits in
+front of the inference stage. Clients are identified by API key when they
+send one of the configured keys, otherwise by IP address. Inference slots are handed out round-robin
+across clients with waiting requests, so one heavy integration cannot starve
+interactive users of the web frontend.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import math
+import time
+import logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Collection, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is refused by rate limiting or queue limits."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class ClientUsage:
+    """Usage counters for a single client."""
+
+    requests: int = 0
+    rate_limited: int = 0
+    queue_rejected: int = 0
+    completed: int = 0
+    in_flight: int = 0
+    queued: int = 0
+    busy_seconds: float = 0.0
+    last_seen: float = field(default_factory=time.time)
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate` tokens per second."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_consume(self, tokens: float = 1.0) -> float:
+        """
+        Take tokens from the bucket if available.
+
+        Returns:
+            0 if the tokens were taken, otherwise seconds until they will be
+        """
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+    def is_full(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+def client_id_from(api_key: Optional[str], forwarded_for: Optional[str],
+                   remote_addr: Optional[str], trust_forwarded: bool = False,
+                   trusted_proxies: int = 1, api_keys: Collection[str] = ()) -> str:
+    """
+    Derive a stable client identifier from request metadata.
+
+    An API key identifies the client only if it is one of `api_keys`;
+    otherwise a client could send a fresh key per request and get a new
+    rate-limit bucket and scheduler lane each time, so unknown keys are
+    ignored. Keys are hashed so they never appear in usage output or logs.
+
+    Behind proxies, the client controls every X-Forwarded-For hop except
+    those appended by the proxies themselves, so the address is taken
+    `trusted_proxies` hops from the right: the one our outermost trusted
+    proxy saw the connection come from.
+
+    Args:
+        api_key: Value of the API key header, if any
+        forwarded_for: Value of X-Forwarded-For, if any
+        remote_addr: Peer address of the connection
+        trust_forwarded: Use X-Forwarded-For (behind a proxy)
+        trusted_proxies: Number of proxies in front of the app that append a hop
+        api_keys: Issued API keys; an empty collection ignores the header
+
+    Returns:
+        Identifier such as 'key:1a2b3c4d5e6f' or 'ip:203.0.113.7'
+    """
+    if api_key and any(hmac.compare_digest(api_key.encode(), key.encode()) for key in api_keys):
+        return f"key:{hashlib.sha256(api_key.encode()).hexdigest()[:12]}"
+    if trust_forwarded and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(',') if hop.strip()]
+        if hops:
+            return f"ip:{hops[max(len(hops) - max(trusted_proxies, 1), 0)]}"
+    return f"ip:{remote_addr or 'unknown'}"
+
+
+class FairScheduler:
+    """
+    Bounded inference slots granted round-robin across clients.
+
+    Each client has its own FIFO of waiters. When a slot frees up, the next
+    client in rotation that has a waiter gets it, so every active client
+    receives an equal share of inference capacity regardless of how many
+    requests it has queued. Must be used from a single event loop; only
+    `queued`, a plain counter, may be read from other threads.
+    """
+
+    def __init__(self, slots: int, max_queued_per_client: int):
+        self.slots = slots
+        self.max_queued_per_client = max_queued_per_client
+        self._available = slots
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._queued = 0  # waiters across all clients, kept in step with _waiters
+        self._service_time = 0.5  # EWMA of slot hold time, seconds
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    def estimated_wait(self, position: int) -> int:
+        """Rough seconds until a request at `position` in line gets a slot."""
+        return max(1, math.ceil(self._service_time * (position + 1) / max(self.slots, 1)))
+
+    async def acquire(self, client_id: str) -> None:
+        """
+        Wait for an inference slot on behalf of a client.
+
+        Raises:
+            AdmissionRejected: If the client already has too many queued requests
+        """
+        if self._available > 0 and not self._waiters:
+            self._available -= 1
+            return
+
+        queue = self._waiters.get(client_id)
+        if queue is not None and len(queue) >= self.max_queued_per_client:
+            raise AdmissionRejected('queue_full', self.estimated_wait(self.queued))
+
+        if queue is None:
+            queue = self._waiters[client_id] = deque()
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        self._queued += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Slot was granted just as the request went away
+                self.release()
+            else:
+                self._discard(client_id, waiter)
+            raise
+
+    def _discard(self, client_id: str, waiter: asyncio.Future) -> None:
+        queue = self._waiters.get(client_id)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+            self._queued -= 1
+        except ValueError:
+            pass
+        if not queue:
+            del self._waiters[client_id]
+
+    def release(self, held_for: Optional[float] = None) -> None:
+        """Return a slot, handing it to the next client in rotation if any are waiting."""
+        if held_for is not None:
+            self._service_time = 0.8 * self._service_time + 0.2 * held_for
+
+        while self._waiters:
+            client_id, queue = next(iter(self._waiters.items()))
+            waiter = queue.popleft()
+            self._queued -= 1
+            # Rotate the client to the back so others go next
+            if queue:
+                self._waiters.move_to_end(client_id)
+            else:
+                del self._waiters[client_id]
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+        self._available += 1
+
+
+class AdmissionController:
+    """Per-client rate limiting, fair scheduling and usage accounting."""
+
+    MAX_TRACKED_CLIENTS = 10000
+
+    def __init__(self, rate_per_minute: float, burst: int, inference_slots: int,
+                 max_queued_per_client: int):
+        """
+        Args:
+            rate_per_minute: Sustained requests per minute per client (0 disables)
+            burst: Bucket capacity, i.e. requests allowed back to back
+            inference_slots: Requests allowed in the inference stage at once
+            max_queued_per_client: Requests a client may have waiting for a slot
+        """
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.scheduler = FairScheduler(inference_slots, max_queued_per_client)
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._usage: Dict[str, ClientUsage] = {}
+
+    def _usage_for(self, client_id: str) -> ClientUsage:
+        usage = self._usage.get(client_id)
+        if usage is None:
+            if len(self._usage) >= self.MAX_TRACKED_CLIENTS:
+                self._prune()
+            usage = self._usage[client_id] = ClientUsage()
+        usage.last_seen = time.time()
+        return usage
+
+    def _prune(self) -> None:
+        """Forget idle clients whose buckets have fully refilled."""
+        for client_id in list(self._usage):
+            usage = self._usage[client_id]
+            bucket = self._buckets.get(client_id)
+            if usage.in_flight == 0 and usage.queued == 0 and (bucket is None or bucket.is_full()):
+                self._usage.pop(client_id, None)
+                self._buckets.pop(client_id, None)
+
+    def check_rate(self, client_id: str, cost: int = 1) -> None:
+        """
+        Charge a request against the client's token bucket.
+
+        Args:
+            client_id: Client identifier
+            cost: Tokens to charge, e.g. the number of images in a batch
+
+        Raises:
+            AdmissionRejected: If the client is over its rate limit, or with
+                reason 'cost_exceeds_burst' if the cost is more than a full
+                bucket holds, so the request could never be admitted
+        """
+        usage = self._usage_for(client_id)
+        usage.requests += 1
+        if self.rate <= 0:
+            return
+
+        if cost > self.burst:
+            usage.rate_limited += 1
+            raise AdmissionRejected('cost_exceeds_burst', 0)
+        wait = self._bucket_for(client_id).try_consume(cost)
+        if wait > 0:
+            usage.rate_limited += 1
+            raise AdmissionRejected('rate_limited', max(1, math.ceil(wait)))
+
+    async def wait_for_rate(self, client_id: str, cost: int = 1) -> None:
+        """
+        Charge a request against the client's token bucket, waiting for tokens if needed.
+
+        For callers with their own flow control, such as a WebSocket session
+        that stops reading while its frames wait here, so a long worklist is
+        slowed to the client's rate instead of failing partway.
+
+        Raises:
+            AdmissionRejected: With reason 'cost_exceeds_burst' if the cost is
+                more than a full bucket holds
+        """
+        usage = self._usage_for(client_id)
+        usage.requests += 1
+        if self.rate <= 0:
+            return
+
+        if cost > self.burst:
+            usage.rate_limited += 1
+            raise AdmissionRejected('cost_exceeds_burst', 0)
+        bucket = self._bucket_for(client_id)
+        wait = bucket.try_consume(cost)
+        if wait > 0:
+            usage.rate_limited += 1
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = bucket.try_consume(cost)
+
+    def _bucket_for(self, client_id: str) -> TokenBucket:
+        bucket = self._buckets.get(client_id)
+        if bucket is None:
+            bucket = self._buckets[client_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    @asynccontextmanager
+    async def inference_slot(self, client_id: str):
+        """
+        Hold a fair-share inference slot for the duration of a `with` block.
+
+        Raises:
+            AdmissionRejected: If the client's queue is full
+        """
+        usage = self._usage_for(client_id)
+        usage.queued += 1
+        try:
+            await self.scheduler.acquire(client_id)
+        except AdmissionRejected:
+            usage.queue_rejected += 1
+            raise
+        finally:
+            usage.queued -= 1
+
+        usage.in_flight += 1
+        start = time.perf_counter()
+        try:
+            yield
+            usage.completed += 1
+        finally:
+            held_for = time.perf_counter() - start
+            usage.in_flight -= 1
+            usage.busy_seconds += held_for
+            self.scheduler.release(held_for)
+
+    def usage_snapshot(self) -> dict:
+        """Current usage counters for every tracked client."""
+        return {
+            'inference_slots': self.scheduler.slots,
+            'queued': self.scheduler.queued,
+            'rate_limit_per_minute': self.rate * 60,
+            'burst': self.burst,
+            'clients': {
+                client_id: {k: round(v, 3) if isinstance(v, float) else v
+                            for k, v in asdict(usage).items()}
+                for client_id, usage in self._usage.items()
+            },
+        }
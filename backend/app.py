@@ -5,31 +5,59 @@ FastAPI application for pneumonia detection from chest X-ray images.
 This is for educational and research purposes only - NOT for clinical use.
 """
 
+import io
 import os
+import hmac
+import re
+import time
+import cProfile
+import contextvars
+import hashlib
+import threading
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple, Union
 import tempfile
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Request, WebSocket
+from starlette.requests import HTTPConnection
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import tensorflow as tf
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing.image import load_img, img_to_array
+from fastapi.responses import JSONResponse, FileResponse, PlainTextResponse
 import numpy as np
+from PIL import Image
 from dotenv import load_dotenv
 from pydantic import BaseModel
 from model_downloader import ensure_model_exists
 from image_validator import ChestXRayValidator
+from serving_config import (configure_tensorflow, build_inference_function, build_embedding_inference_function,
+                            build_graph_decoder, embedding_size)
+from admission import AdmissionController, AdmissionRejected, client_id_from
+from explain import (Explanation, ExplanationCache, ExplanationInputStore, build_gradcam_function,
+                     default_explanation_store_path)
+from phash import NearDuplicateIndex, compute_phash, compute_thumbnail, thumbnails_match
+from profiling import ProfileStore, default_profile_dir
+from streaming import StreamSession
+from shadow import ShadowEvaluator
+from model_server import ModelServerClient
+from tta import TestTimeAugmentation
+from result_cache import ResultCache, default_result_cache_path, model_file_version
+from similarity import SimilarityIndex, CASE_ID_PATTERN, default_similarity_dir
+from jobs import (JobItem, JobRunner, JobStore, RetryLater, JOB_ID_PATTERN, default_job_db_path,
+                  validate_callback_url)
+from request_logging import setup_logging, stop_logging, begin_request, request_id_var, stage
+from inference import BatchBufferPool, decode_image, load_image_into, write_image_into
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Configure logging (queue-based; records are written by a background thread)
+setup_logging(
+    level=os.getenv('LOG_LEVEL', 'INFO'),
+    log_format=os.getenv('LOG_FORMAT', 'json').lower(),
 )
 logger = logging.getLogger(__name__)
 
@@ -53,11 +81,82 @@ class Config:
     MODEL_URL = os.getenv('MODEL_URL', None)  # URL to download model from if not present
     MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+    TENSOR_CONTENT_TYPES = {'application/x-npy', 'application/octet-stream'}
+    # Uploads are analysed at most at this size; advertised so clients can shrink before upload
+    UPLOAD_MAX_DIMENSION = int(os.getenv('UPLOAD_MAX_DIMENSION', 0))  # 0 = full resolution
     TARGET_SIZE = (150, 150)
     PREDICTION_THRESHOLD = float(os.getenv('PREDICTION_THRESHOLD', 0.5))
     PORT = int(os.getenv('PORT', 8000))
     HOST = os.getenv('HOST', '0.0.0.0')
     ALLOWED_ORIGINS = os.getenv('ALLOWED_ORIGINS', '*').split(',')
+    TF_INTRA_OP_THREADS = int(os.getenv('TF_INTRA_OP_THREADS', 0))  # 0 = match CPU quota
+    TF_INTER_OP_THREADS = int(os.getenv('TF_INTER_OP_THREADS', 0))  # 0 = auto
+    TF_XLA_JIT = os.getenv('TF_XLA_JIT', 'false').lower() == 'true'
+    MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', 16))
+    BATCH_BUFFER_POOL_SIZE = int(os.getenv('BATCH_BUFFER_POOL_SIZE', 4))
+    # 'sequential' validates before predicting, 'concurrent' overlaps the two
+    PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'concurrent').lower()
+    # 'pil' decodes uploads with PIL, 'graph' with TensorFlow ops (outside the GIL);
+    # either way validation and inference share the one decoded image
+    PREPROCESS_MODE = os.getenv('PREPROCESS_MODE', 'pil').lower()
+    WORKER_THREADS = int(os.getenv('WORKER_THREADS', 4))
+    API_KEY_HEADER = os.getenv('API_KEY_HEADER', 'X-API-Key')
+    # Comma-separated issued keys; the header is ignored for keys not listed (empty = always)
+    API_KEYS = frozenset(key.strip() for key in os.getenv('API_KEYS', '').split(',') if key.strip())
+    TRUST_FORWARDED_FOR = os.getenv('TRUST_FORWARDED_FOR', 'false').lower() == 'true'
+    TRUSTED_PROXY_COUNT = int(os.getenv('TRUSTED_PROXY_COUNT', 1))  # proxies appending X-Forwarded-For hops
+    RATE_LIMIT_PER_MINUTE = float(os.getenv('RATE_LIMIT_PER_MINUTE', 60))  # 0 = unlimited
+    RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', 10))
+    INFERENCE_SLOTS = int(os.getenv('INFERENCE_SLOTS', WORKER_THREADS))
+    MAX_QUEUED_PER_CLIENT = int(os.getenv('MAX_QUEUED_PER_CLIENT', 8))
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', None)  # Enables admin endpoints when set
+    EXPLANATION_CACHE_SIZE = int(os.getenv('EXPLANATION_CACHE_SIZE', 256))
+    # Model inputs of accepted predictions, for heatmaps fetched after a plain prediction
+    EXPLANATION_STORE_SIZE = int(os.getenv('EXPLANATION_STORE_SIZE', 2000))  # 0 = only with explain=true
+    EXPLANATION_STORE_PATH = os.getenv('EXPLANATION_STORE_PATH', default_explanation_store_path())
+    NEAR_DUPLICATE_INDEX_SIZE = int(os.getenv('NEAR_DUPLICATE_INDEX_SIZE', 0))  # 0 = disabled
+    NEAR_DUPLICATE_MAX_DISTANCE = int(os.getenv('NEAR_DUPLICATE_MAX_DISTANCE', 0))  # bits of 64
+    PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+    PROFILE_DIR = os.getenv('PROFILE_DIR', default_profile_dir())
+    PROFILE_MAX_TRACES = int(os.getenv('PROFILE_MAX_TRACES', 20))
+    PROFILE_TENSORFLOW = os.getenv('PROFILE_TENSORFLOW', 'false').lower() == 'true'
+    WS_MAX_OUTSTANDING = int(os.getenv('WS_MAX_OUTSTANDING', 8))
+    LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 0.1))  # share of requests with detail logs
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))  # 0 disables the job API
+    JOB_DB_PATH = os.getenv('JOB_DB_PATH', default_job_db_path())
+    JOB_MAX_IMAGES = int(os.getenv('JOB_MAX_IMAGES', 100))
+    JOB_RETENTION_HOURS = float(os.getenv('JOB_RETENTION_HOURS', 72))
+    # Empty disables callbacks; '*' allows any host resolving to public addresses
+    JOB_CALLBACK_HOSTS = [h.strip().lower() for h in os.getenv('JOB_CALLBACK_HOSTS', '').split(',') if h.strip()]
+    JOB_CALLBACK_ALLOW_PRIVATE = os.getenv('JOB_CALLBACK_ALLOW_PRIVATE', 'false').lower() == 'true'
+    JOB_CALLBACK_SECRET = os.getenv('JOB_CALLBACK_SECRET', None)
+    # 0 = disabled; /api/similar returns other clients' cases and predictions, so opt in
+    SIMILARITY_INDEX_SIZE = int(os.getenv('SIMILARITY_INDEX_SIZE', 0))
+    SIMILARITY_INDEX_DIR = os.getenv('SIMILARITY_INDEX_DIR', default_similarity_dir())
+    SIMILARITY_IVF_THRESHOLD = int(os.getenv('SIMILARITY_IVF_THRESHOLD', 20000))
+    SIMILARITY_NPROBE = int(os.getenv('SIMILARITY_NPROBE', 8))
+    SIMILARITY_MAX_K = 50
+    SHADOW_MODEL_PATH = os.getenv('SHADOW_MODEL_PATH', None)  # candidate model; unset disables shadow mode
+    SHADOW_SAMPLE_RATE = float(os.getenv('SHADOW_SAMPLE_RATE', 0.1))
+    SHADOW_QUEUE_SIZE = int(os.getenv('SHADOW_QUEUE_SIZE', 64))
+    # Test-time augmentation: scores averaged per image (<= MAX_BATCH_SIZE; 0 or 1 = disabled),
+    # run on request (?tta=true) or automatically within TTA_BAND of the threshold
+    TTA_SAMPLES = min(int(os.getenv('TTA_SAMPLES', 8)), MAX_BATCH_SIZE)
+    TTA_BAND = float(os.getenv('TTA_BAND', 0))  # 0 = only on request
+    RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', 100000))  # 0 = disabled
+    RESULT_CACHE_PATH = os.getenv('RESULT_CACHE_PATH', default_result_cache_path())
+    # Unix socket of a shared model server (model_server.py); unset = model loaded in this process
+    MODEL_SERVER_SOCKET = os.getenv('MODEL_SERVER_SOCKET', None)
+    MODEL_SERVER_SLOTS = int(os.getenv('MODEL_SERVER_SLOTS', 32))  # images in flight per worker
+
+
+# Size TensorFlow's thread pools before the runtime initializes. With a model
+# server, this process never imports TensorFlow.
+serving_settings = None if Config.MODEL_SERVER_SOCKET else configure_tensorflow(
+    intra_op_threads=Config.TF_INTRA_OP_THREADS,
+    inter_op_threads=Config.TF_INTER_OP_THREADS,
+    enable_xla=Config.TF_XLA_JIT,
+)
 
 
 # Enable CORS
@@ -69,8 +168,99 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+@app.middleware("http")
+async def request_logging_middleware(request: Request, call_next):
+    """Assign a request ID and log one structured summary record per request."""
+    supplied = request.headers.get('X-Request-ID', '')
+    stages = begin_request(
+        supplied if REQUEST_ID_PATTERN.match(supplied) else None,
+        Config.LOG_SAMPLE_RATE,
+    )
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        response.headers['X-Request-ID'] = request_id_var.get()
+        return response
+    finally:
+        logger.info(
+            "%s %s %d", request.method, request.url.path, status_code,
+            extra={
+                'always': True,
+                'method': request.method,
+                'path': request.url.path,
+                'status': status_code,
+                'duration_ms': round(1000 * (time.perf_counter() - start), 2),
+                'stages': stages,
+            },
+        )
+
+
 # Global model variable
 model = None
+inference_fn = None  # Maps a uint8 batch to scores; runs on the model server when one is configured
+model_client: Optional[ModelServerClient] = None
+graph_decoder = None  # Decodes uploads with TensorFlow; only built when PREPROCESS_MODE is 'graph'
+embedding_inference_fn = None  # Also returns embeddings; only built with the similarity index
+similarity_index = None
+shadow_evaluator: Optional[ShadowEvaluator] = None  # Candidate model scoring sampled traffic
+result_cache: Optional[ResultCache] = None  # Results shared by all worker processes; opened with the model
+gradcam_fn = None  # Built on the first explanation request
+gradcam_lock = threading.Lock()
+explanation_cache = ExplanationCache(max_entries=Config.EXPLANATION_CACHE_SIZE)
+# Shared by all worker processes; opened with an in-process model, which Grad-CAM needs
+explanation_store: Optional[ExplanationInputStore] = None
+
+# Perceptual-hash index of earlier results for near-duplicate uploads
+near_duplicate_index = (
+    NearDuplicateIndex(max_entries=Config.NEAR_DUPLICATE_INDEX_SIZE)
+    if Config.NEAR_DUPLICATE_INDEX_SIZE > 0 else None
+)
+
+# On-disk ring of per-request profiles (only when profiling is switched on)
+profile_store = (
+    ProfileStore(Config.PROFILE_DIR, max_traces=Config.PROFILE_MAX_TRACES)
+    if Config.PROFILING_ENABLED else None
+)
+
+# Augmented copies for test-time augmentation, written into the batch buffers
+tta_augmentation = (
+    TestTimeAugmentation(Config.TARGET_SIZE, samples=Config.TTA_SAMPLES)
+    if Config.TTA_SAMPLES > 1 else None
+)
+
+# Preallocated uint8 input buffers reused across requests
+buffer_pool = BatchBufferPool(
+    max_batch_size=Config.MAX_BATCH_SIZE,
+    image_shape=(*Config.TARGET_SIZE, 3),
+    pool_size=Config.BATCH_BUFFER_POOL_SIZE,
+)
+
+# Runs validation and inference off the event loop
+executor = ThreadPoolExecutor(max_workers=Config.WORKER_THREADS, thread_name_prefix="pneumoscan")
+
+
+def run_in_worker(fn, *args) -> asyncio.Future:
+    """Run fn on the worker pool, carrying the request's logging context with it."""
+    context = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(executor, context.run, fn, *args)
+
+
+# Persistent queue for asynchronous jobs; workers start with the app
+job_store = JobStore(Config.JOB_DB_PATH) if Config.JOB_WORKERS > 0 else None
+job_runner: Optional[JobRunner] = None
+
+# Per-client rate limits and fair share of inference slots
+admission = AdmissionController(
+    rate_per_minute=Config.RATE_LIMIT_PER_MINUTE,
+    burst=Config.RATE_LIMIT_BURST,
+    inference_slots=Config.INFERENCE_SLOTS,
+    max_queued_per_client=Config.MAX_QUEUED_PER_CLIENT,
+)
 
 
 # Pydantic models
@@ -81,6 +271,33 @@ class PredictionResponse(BaseModel):
     disclaimer: str
     validation_confidence: int = 100
     validation_warning: str = None
+    explanation_id: Optional[str] = None
+    near_duplicate: bool = False
+    near_duplicate_distance: Optional[int] = None
+    trace_id: Optional[str] = None
+    case_id: Optional[str] = None
+    tta_score: Optional[float] = None
+    tta_variance: Optional[float] = None
+    tta_samples: Optional[int] = None
+
+
+class TensorPrediction(BaseModel):
+    prediction: str
+    confidence: float
+    raw_score: float
+
+
+class TensorPredictionResponse(BaseModel):
+    results: List[TensorPrediction]
+    count: int
+    disclaimer: str
+
+
+class ExplanationResponse(BaseModel):
+    explanation_id: str
+    prediction: str
+    raw_score: float
+    overlay: str
 
 
 class ModelInfo(BaseModel):
@@ -90,6 +307,50 @@ class ModelInfo(BaseModel):
     classes: list
     accuracy: str
     threshold: float
+    upload_max_dimension: int
+    upload_formats: list
+
+
+class JobSubmitResponse(BaseModel):
+    job_id: str
+    status: str
+    total: int
+    status_url: str
+
+
+class JobItemResult(BaseModel):
+    index: int
+    filename: Optional[str] = None
+    status: str
+    result: Optional[PredictionResponse] = None
+    error: Optional[dict] = None
+
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    status: str
+    total: int
+    completed: int
+    failed: int
+    created: float
+    updated: float
+    callback_status: Optional[str] = None
+    results: List[JobItemResult]
+
+
+class SimilarCase(BaseModel):
+    case_id: str
+    similarity: float
+    prediction: str
+    confidence: float
+    raw_score: float
+    analysed_at: float
+
+
+class SimilarCasesResponse(BaseModel):
+    case_id: Optional[str] = None
+    prediction: Optional[PredictionResponse] = None
+    neighbors: List[SimilarCase]
 
 
 class HealthResponse(BaseModel):
@@ -103,6 +364,11 @@ def load_ml_model():
     Load the trained Keras model.
     If model doesn't exist locally but MODEL_URL is provided, downloads it first.
 
+    With MODEL_SERVER_SOCKET set, connects to the shared model server
+    instead; inference then runs there, and features that need the model in
+    this process (explanations, similar-case search, in-graph
+    preprocessing) are unavailable.
+
     Returns:
         Loaded Keras model
 
@@ -110,12 +376,15 @@ def load_ml_model():
         FileNotFoundError: If model file doesn't exist and can't be downloaded
         Exception: If model loading fails
     """
-    global model
+    global model, inference_fn, graph_decoder, embedding_inference_fn, similarity_index, explanation_store
 
-    if model is not None:
+    if inference_fn is not None:
         logger.info("Model already loaded")
         return model
 
+    if Config.MODEL_SERVER_SOCKET:
+        return connect_model_server()
+
     model_path = Config.MODEL_PATH
 
     # Ensure model exists (download if necessary)
@@ -129,8 +398,28 @@ def load_ml_model():
         )
 
     try:
+        from tensorflow.keras.models import load_model
+
         logger.info(f"Loading model from {model_path}")
         model = load_model(model_path)
+        inference_fn = build_inference_function(model, jit_compile=Config.TF_XLA_JIT)
+        if Config.SIMILARITY_INDEX_SIZE > 0:
+            embedding_inference_fn = build_embedding_inference_function(model, jit_compile=Config.TF_XLA_JIT)
+            similarity_index = SimilarityIndex(
+                Config.SIMILARITY_INDEX_DIR,
+                dim=embedding_size(model),
+                model_id=f"{os.path.basename(model_path)}:{os.path.getsize(model_path)}",
+                max_entries=Config.SIMILARITY_INDEX_SIZE,
+                ivf_threshold=Config.SIMILARITY_IVF_THRESHOLD,
+                nprobe=Config.SIMILARITY_NPROBE,
+            )
+        if Config.PREPROCESS_MODE == 'graph':
+            graph_decoder = build_graph_decoder(Config.UPLOAD_MAX_DIMENSION)
+        if Config.EXPLANATION_STORE_SIZE > 0:
+            explanation_store = ExplanationInputStore(
+                Config.EXPLANATION_STORE_PATH, max_entries=Config.EXPLANATION_STORE_SIZE
+            )
+        open_result_cache(model_file_version(model_path))
         logger.info("Model loaded successfully")
         return model
     except Exception as e:
@@ -138,82 +427,746 @@ def load_ml_model():
         raise
 
 
-def preprocess_image(image_path: str, target_size: tuple = (150, 150)) -> np.ndarray:
+def connect_model_server() -> None:
+    """Route inference to the shared model server named by MODEL_SERVER_SOCKET."""
+    global inference_fn, model_client
+
+    try:
+        logger.info(f"Connecting to model server at {Config.MODEL_SERVER_SOCKET}")
+        model_client = ModelServerClient(
+            Config.MODEL_SERVER_SOCKET,
+            image_shape=(*Config.TARGET_SIZE, 3),
+            slots=Config.MODEL_SERVER_SLOTS,
+        )
+        open_result_cache(model_client.server_info.get('model_version', 'model-server'))
+        inference_fn = model_client.infer
+        logger.info("Connected to model server")
+    except Exception as e:
+        logger.error(f"Error connecting to model server: {e}")
+        raise
+
+
+def open_result_cache(model_version: str) -> None:
+    """Open the persistent result cache for the loaded model, if enabled."""
+    global result_cache
+
+    if Config.RESULT_CACHE_SIZE > 0 and result_cache is None:
+        # Results depend on the weights and on the settings that shape them,
+        # including whether they carry a similarity case_id or near-duplicate fields
+        result_cache = ResultCache(
+            Config.RESULT_CACHE_PATH,
+            model_version=(f"{model_version}:{Config.PREDICTION_THRESHOLD}:"
+                           f"{Config.UPLOAD_MAX_DIMENSION}:{Config.PREPROCESS_MODE}:"
+                           f"{Config.TTA_SAMPLES}:{Config.TTA_BAND}:"
+                           f"{Config.NEAR_DUPLICATE_INDEX_SIZE}:{Config.NEAR_DUPLICATE_MAX_DISTANCE}:"
+                           f"{Config.SIMILARITY_INDEX_SIZE}"),
+            max_entries=Config.RESULT_CACHE_SIZE,
+        )
+
+
+def load_shadow_model() -> None:
+    """
+    Load the candidate model named by SHADOW_MODEL_PATH and start shadow scoring.
+
+    The candidate sees exactly the model input of the primary model. Failure
+    to load it is logged and leaves shadow mode off; primary serving is
+    unaffected. Shadow mode is refused with MODEL_SERVER_SOCKET, where
+    loading the candidate would bring TensorFlow back into every worker.
+    """
+    global shadow_evaluator
+
+    if not Config.SHADOW_MODEL_PATH or shadow_evaluator is not None:
+        return
+    if Config.MODEL_SERVER_SOCKET:
+        logger.warning("SHADOW_MODEL_PATH is ignored with MODEL_SERVER_SOCKET; shadow mode disabled")
+        return
+
+    try:
+        from tensorflow.keras.models import load_model
+
+        logger.info(f"Loading shadow model from {Config.SHADOW_MODEL_PATH}")
+        candidate = load_model(Config.SHADOW_MODEL_PATH)
+        candidate_fn = build_inference_function(candidate, jit_compile=Config.TF_XLA_JIT)
+    except Exception as e:
+        logger.error(f"Failed to load shadow model, shadow mode disabled: {e}")
+        return
+
+    def score(model_input: np.ndarray) -> float:
+        return float(candidate_fn(model_input[None])[0][0])
+
+    shadow_evaluator = ShadowEvaluator(
+        score,
+        threshold=Config.PREDICTION_THRESHOLD,
+        sample_rate=Config.SHADOW_SAMPLE_RATE,
+        queue_size=Config.SHADOW_QUEUE_SIZE,
+        busy=lambda: admission.scheduler.queued > 0,
+        name=os.path.basename(Config.SHADOW_MODEL_PATH),
+    )
+    logger.info("Shadow model loaded, scoring %.0f%% of requests", 100 * Config.SHADOW_SAMPLE_RATE)
+
+
+def preprocess_image(image: Union[str, Image.Image], out: np.ndarray) -> np.ndarray:
     """
-    Load and preprocess an image for model inference.
+    Load an image for model inference into a preallocated uint8 buffer.
+
+    Pixels stay uint8; normalization to [0, 1] happens inside the
+    inference function.
 
     Args:
-        image_path: Path to the image file
-        target_size: Target dimensions (width, height)
+        image: Path to the image file, or an already decoded PIL Image
+        out: uint8 batch buffer whose first slot receives the image
 
     Returns:
-        Preprocessed image array ready for prediction
+        View of `out` holding a batch of one image, ready for prediction
 
     Raises:
         ValueError: If image cannot be loaded or processed
     """
     try:
-        # Load image
-        img = load_img(image_path, target_size=target_size)
+        if isinstance(image, Image.Image):
+            write_image_into(image, out[0])
+        else:
+            load_image_into(image, out[0])
+        return out[:1]
 
-        # Convert to array
-        img_array = img_to_array(img)
+    except Exception as e:
+        logger.error(f"Error preprocessing image: {e}")
+        raise ValueError(f"Failed to preprocess image: {str(e)}")
 
-        # Normalize pixel values to [0, 1]
-        img_array = img_array / 255.0
 
-        # Add batch dimension
-        img_array = np.expand_dims(img_array, axis=0)
+@dataclass
+class PendingPrediction:
+    """
+    Prediction of one image, with what it leaves behind once accepted.
 
-        logger.info(f"Image preprocessed successfully: shape={img_array.shape}")
-        return img_array
+    In concurrent mode inference starts before validation has accepted the
+    image, so nothing that outlives the request is recorded until
+    accept_prediction runs for an accepted image.
+    """
 
-    except Exception as e:
-        logger.error(f"Error preprocessing image: {e}")
-        raise ValueError(f"Failed to preprocess image: {str(e)}")
+    result: Dict[str, Any]
+    model_input: Optional[np.ndarray] = None  # Copy of the uint8 input, for Grad-CAM and the shadow model
+    embedding: Optional[np.ndarray] = None  # Penultimate-layer embedding for the similarity index
+    raw_score: Optional[float] = None  # Score of the unaugmented input, compared by the shadow model
 
 
-def predict_pneumonia(image_path: str) -> Dict[str, Any]:
+def predict_pneumonia(image: Union[str, Image.Image], tta: bool = False) -> PendingPrediction:
     """
     Predict pneumonia from chest X-ray image.
 
+    With the similarity index enabled, the penultimate-layer embedding from
+    the same forward pass is returned for accept_prediction to index.
+
+    With test-time augmentation, the prediction and confidence come from the
+    mean score over TTA_SAMPLES augmented copies (the input included), and
+    the result also carries that mean and its variance; raw_score stays the
+    score of the unaugmented input.
+
     Args:
-        image_path: Path to the X-ray image file
+        image: Path to the X-ray image file or an already decoded PIL Image
+        tta: Always run test-time augmentation; otherwise it runs only when
+            the raw score is within TTA_BAND of the threshold
 
     Returns:
-        Dictionary containing prediction result and confidence score
+        Pending prediction; its result dict holds the prediction and confidence score
 
     Raises:
         ValueError: If prediction fails
     """
     try:
-        # Preprocess image
-        preprocessed_image = preprocess_image(image_path, target_size=Config.TARGET_SIZE)
+        model_input = None
+        forced_tta = tta and tta_augmentation is not None
+        tta_scores = None
+
+        with buffer_pool.acquire() as buffer:
+            # Preprocess image
+            with stage('preprocess'):
+                preprocessed_image = preprocess_image(image, buffer)
+
+            # Make prediction; requested TTA scores the input with its copies in one batch
+            infer = embedding_inference_fn or inference_fn
+            if forced_tta:
+                with stage('tta'):
+                    tta_augmentation.augment_into(buffer[0], buffer[1:tta_augmentation.samples])
+                with stage('inference'):
+                    outputs = infer(buffer[:tta_augmentation.samples])
+            else:
+                with stage('inference'):
+                    outputs = infer(preprocessed_image)
+            prediction, embeddings = split_outputs(outputs)
+            confidence = float(prediction[0][0])
+            if forced_tta:
+                tta_scores = np.asarray(prediction)[:, 0]
+            elif needs_tta(confidence):
+                tta_scores = run_tta(buffer, confidence)
+
+            if explanation_store is not None or shadow_evaluator is not None:
+                # The buffer returns to the pool; keep a copy for a later heatmap or the candidate
+                model_input = preprocessed_image[0].copy()
+
+        if tta_scores is not None:
+            aggregate = tta_augmentation.aggregate(tta_scores)
+            result = build_prediction_result(aggregate['mean'])
+            result.update(
+                raw_score=round(confidence, 4),
+                tta_score=round(aggregate['mean'], 4),
+                tta_variance=round(aggregate['variance'], 6),
+                tta_samples=len(tta_scores),
+            )
+        else:
+            result = build_prediction_result(confidence)
+        embedding = embeddings[0].numpy() if embeddings is not None else None
 
-        # Make prediction
-        prediction = model.predict(preprocessed_image, verbose=0)
-        confidence = float(prediction[0][0])
+        logger.info("Prediction: %s", result)
+        return PendingPrediction(result, model_input, embedding, confidence)
 
-        # Determine class label
-        class_label = 'Pneumonia' if confidence > Config.PREDICTION_THRESHOLD else 'Normal'
+    except Exception as e:
+        logger.error(f"Error during prediction: {e}")
+        raise ValueError(f"Prediction failed: {str(e)}")
 
-        # Adjust confidence for display (closer to 1 means more confident)
-        display_confidence = confidence if class_label == 'Pneumonia' else 1 - confidence
 
-        result = {
-            'prediction': class_label,
-            'confidence': round(display_confidence, 4),
-            'raw_score': round(confidence, 4)
-        }
+def split_outputs(outputs) -> Tuple[Any, Any]:
+    """Scores and embeddings (None without the similarity index) of an inference call."""
+    if similarity_index is not None:
+        return outputs
+    return outputs, None
+
+
+def needs_tta(confidence: float) -> bool:
+    """Whether a raw score is close enough to the threshold for automatic TTA."""
+    return (tta_augmentation is not None and Config.TTA_BAND > 0
+            and abs(confidence - Config.PREDICTION_THRESHOLD) <= Config.TTA_BAND)
+
+
+def run_tta(buffer: np.ndarray, confidence: float) -> np.ndarray:
+    """
+    Score the augmented copies of the image in buffer[0] in one batched call.
+
+    Args:
+        buffer: Batch buffer holding the model input in its first slot
+        confidence: Raw score of that input, counted as the first sample
+
+    Returns:
+        Scores of all samples, the raw score first
+    """
+    copies = buffer[1:tta_augmentation.samples]
+    with stage('tta'):
+        tta_augmentation.augment_into(buffer[0], copies)
+        scores = np.asarray(inference_fn(copies))[:, 0]
+    return np.concatenate([[confidence], scores])
+
+
+def build_prediction_result(confidence: float) -> Dict[str, Any]:
+    """
+    Turn a raw model score into a prediction result.
+
+    Args:
+        confidence: Sigmoid output of the model
+
+    Returns:
+        Dictionary containing prediction label, display confidence and raw score
+    """
+    # Determine class label
+    class_label = 'Pneumonia' if confidence > Config.PREDICTION_THRESHOLD else 'Normal'
+
+    # Adjust confidence for display (closer to 1 means more confident)
+    display_confidence = confidence if class_label == 'Pneumonia' else 1 - confidence
+
+    return {
+        'prediction': class_label,
+        'confidence': round(display_confidence, 4),
+        'raw_score': round(confidence, 4)
+    }
+
 
-        logger.info(f"Prediction: {result}")
-        return result
+def get_gradcam_fn():
+    """Build the Grad-CAM function on first use so plain predictions never pay for it."""
+    global gradcam_fn
+
+    if model is None:
+        raise ValueError("Explanations need the model in the API process and are "
+                         "unavailable with MODEL_SERVER_SOCKET")
+    with gradcam_lock:
+        if gradcam_fn is None:
+            gradcam_fn = build_gradcam_function(model, threshold=Config.PREDICTION_THRESHOLD)
+        return gradcam_fn
+
+
+def explain_pneumonia(image: Union[str, Image.Image], explanation_id: str) -> PendingPrediction:
+    """
+    Predict pneumonia and compute a Grad-CAM heatmap in one gradient pass.
+
+    The raw heatmap and model input are cached in this process under
+    `explanation_id`; the overlay image is rendered only when the
+    explanation is fetched.
+
+    Args:
+        image: Path to the X-ray image file, or an already decoded PIL Image
+        explanation_id: Cache key, the hash of the uploaded image
+
+    Returns:
+        Pending prediction; its result dict holds the prediction and confidence score
+
+    Raises:
+        ValueError: If prediction fails
+    """
+    cached = explanation_cache.get(explanation_id)
+    if cached is not None:
+        return PendingPrediction(dict(cached.result), cached.image)
+
+    try:
+        with buffer_pool.acquire() as buffer:
+            with stage('preprocess'):
+                preprocessed_image = preprocess_image(image, buffer)
+            model_input = preprocessed_image[0].copy()
+        explanation = compute_explanation(explanation_id, model_input)
+
+        logger.info("Prediction with explanation: %s", explanation.result)
+        return PendingPrediction(dict(explanation.result), model_input)
 
     except Exception as e:
-        logger.error(f"Error during prediction: {e}")
+        logger.error(f"Error during explained prediction: {e}")
         raise ValueError(f"Prediction failed: {str(e)}")
 
 
+def compute_explanation(explanation_id: str, model_input: np.ndarray) -> Explanation:
+    """
+    Run the Grad-CAM pass on one uint8 model input and cache it in this process.
+
+    The pass also yields the model's score, so the explanation carries the
+    prediction it explains.
+    """
+    with stage('inference_gradcam'):
+        scores, heatmaps = get_gradcam_fn()(model_input[None])
+    explanation = Explanation(
+        image=model_input, heatmap=heatmaps[0].numpy(), result=build_prediction_result(float(scores[0]))
+    )
+    explanation_cache.put(explanation_id, explanation)
+    return explanation
+
+
+async def accept_prediction(pending: PendingPrediction, explanation_id: Optional[str]) -> Dict[str, Any]:
+    """
+    Record a prediction once validation has accepted its image.
+
+    The embedding is added to the similarity index, which gives the result
+    its case_id, and sampled inputs are queued for the shadow model; rejected
+    uploads never become searchable cases or shadow comparisons. The model
+    input goes to the shared explanation store in the background, so
+    /api/explain/{explanation_id} can compute the heatmap on any worker
+    without the image being sent again.
+
+    Args:
+        pending: Prediction returned by predict_pneumonia or explain_pneumonia
+        explanation_id: Hash of the upload, or None when the caller has none
+
+    Returns:
+        The prediction result, with its explanation_id when a heatmap can be fetched
+    """
+    result = pending.result
+    if pending.embedding is not None and similarity_index is not None:
+        with stage('similarity_index'):
+            result['case_id'] = await run_in_worker(similarity_index.add, pending.embedding, dict(result))
+    if (shadow_evaluator is not None and pending.model_input is not None and pending.raw_score is not None
+            and shadow_evaluator.should_sample()):
+        shadow_evaluator.submit(pending.model_input, pending.raw_score)
+    if explanation_id is not None and pending.model_input is not None:
+        if explanation_store is not None:
+            run_in_worker(explanation_store.put, explanation_id, pending.model_input)
+        result['explanation_id'] = explanation_id
+    return result
+
+
+def predict_tensor_batch(images: np.ndarray) -> List[Dict[str, Any]]:
+    """
+    Predict pneumonia for a batch of already resized uint8 images.
+
+    Runs in chunks of MAX_BATCH_SIZE. Three-channel input is passed to the
+    model as is; single-channel input is broadcast to RGB in a pooled buffer.
+
+    Args:
+        images: uint8 array of shape (N, height, width, 1 or 3)
+
+    Returns:
+        List of prediction results, one per image
+
+    Raises:
+        ValueError: If prediction fails
+    """
+    try:
+        results = []
+        for start in range(0, len(images), Config.MAX_BATCH_SIZE):
+            chunk = images[start:start + Config.MAX_BATCH_SIZE]
+            if chunk.shape[-1] == 3:
+                scores = np.asarray(inference_fn(chunk))[:, 0]
+            else:
+                with buffer_pool.acquire() as buffer:
+                    np.copyto(buffer[:len(chunk)], chunk)
+                    scores = np.asarray(inference_fn(buffer[:len(chunk)]))[:, 0]
+            results.extend(build_prediction_result(float(score)) for score in scores)
+
+        logger.info("Batch prediction: %d images", len(results))
+        return results
+
+    except Exception as e:
+        logger.error(f"Error during batch prediction: {e}")
+        raise ValueError(f"Prediction failed: {str(e)}")
+
+
+def load_tensor_batch(content: bytes) -> np.ndarray:
+    """
+    Parse an NPY payload of pre-resized images.
+
+    Args:
+        content: Bytes of a .npy file
+
+    Returns:
+        uint8 array of shape (N, height, width, 1 or 3)
+
+    Raises:
+        ValueError: If the payload is not a valid image batch
+    """
+    try:
+        images = np.load(io.BytesIO(content), allow_pickle=False)
+    except Exception as e:
+        raise ValueError(f"Body is not a valid NPY array: {str(e)}")
+
+    expected = f"(N, {Config.TARGET_SIZE[0]}, {Config.TARGET_SIZE[1]}, 1 or 3)"
+    if images.dtype != np.uint8:
+        raise ValueError(f"Expected dtype uint8, got {images.dtype}")
+    if images.ndim != 4 or images.shape[1:3] != Config.TARGET_SIZE or images.shape[3] not in (1, 3):
+        raise ValueError(f"Expected shape {expected}, got {images.shape}")
+    if len(images) == 0:
+        raise ValueError("Batch is empty")
+    return images
+
+
+def decode_upload(source: Union[str, bytes]) -> Image.Image:
+    """
+    Decode an upload at UPLOAD_MAX_DIMENSION, recording its duration as a request stage.
+
+    With PREPROCESS_MODE=graph the pixels are decoded by TensorFlow and
+    wrapped, without a second decode, in the PIL Image that validation and
+    preprocessing share.
+    """
+    with stage('decode'):
+        if graph_decoder is None:
+            return decode_image(source, Config.UPLOAD_MAX_DIMENSION)
+        try:
+            pixels = graph_decoder(source if isinstance(source, bytes) else Path(source).read_bytes())
+        except Exception as e:
+            raise ValueError(f"Failed to decode image: {str(e)}")
+        return Image.fromarray(pixels[..., 0] if pixels.shape[-1] == 1 else pixels)
+
+
+def validate_image(image: Image.Image) -> Dict[str, Any]:
+    """Run chest X-ray validation, recording its duration as a request stage."""
+    with stage('validation'):
+        return ChestXRayValidator.validate_image(image)
+
+
+async def validate_and_predict(image: Image.Image, predict_fn=predict_pneumonia, *predict_args,
+                               explanation_id: Optional[str] = None
+                               ) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """
+    Run chest X-ray validation and model inference on a decoded image.
+
+    In 'sequential' mode inference starts only after validation accepts the
+    image. In 'concurrent' mode both are submitted to the worker pool at
+    once; validation still gates the response, and for rejected images the
+    prediction future is cancelled: a queued inference never runs, one that
+    is already running finishes on its worker and its result (or error) is
+    dropped. Either way only accepted predictions reach accept_prediction.
+
+    Args:
+        image: Decoded PIL Image
+        predict_fn: Prediction function called as predict_fn(image, *predict_args),
+            returning a PendingPrediction
+        explanation_id: Hash of the upload, passed on to accept_prediction
+
+    Returns:
+        Tuple of (validation result, prediction result or None if rejected)
+    """
+    validation = run_in_worker(validate_image, image)
+
+    if Config.PIPELINE_MODE != 'concurrent':
+        validation_result = await validation
+        if not validation_result['is_likely_xray']:
+            return validation_result, None
+        pending = await run_in_worker(predict_fn, image, *predict_args)
+        return validation_result, await accept_prediction(pending, explanation_id)
+
+    prediction = run_in_worker(predict_fn, image, *predict_args)
+    try:
+        validation_result = await validation
+    except BaseException:
+        prediction.cancel()
+        raise
+
+    if not validation_result['is_likely_xray']:
+        prediction.cancel()
+        return validation_result, None
+
+    return validation_result, await accept_prediction(await prediction, explanation_id)
+
+
+def get_client_id(request: HTTPConnection) -> str:
+    """Identify the caller (HTTP request or WebSocket) by issued API key, falling back to IP address."""
+    return client_id_from(
+        api_key=request.headers.get(Config.API_KEY_HEADER),
+        forwarded_for=request.headers.get('x-forwarded-for'),
+        remote_addr=request.client.host if request.client else None,
+        trust_forwarded=Config.TRUST_FORWARDED_FOR,
+        trusted_proxies=Config.TRUSTED_PROXY_COUNT,
+        api_keys=Config.API_KEYS,
+    )
+
+
+def check_rate_limit(client_id: str, cost: int = 1) -> None:
+    """
+    Charge a request against the client's rate limit.
+
+    Raises:
+        HTTPException: 429 with Retry-After if the client is over its limit,
+            413 if the request costs more than RATE_LIMIT_BURST
+    """
+    try:
+        admission.check_rate(client_id, cost)
+    except AdmissionRejected as e:
+        if e.reason == 'cost_exceeds_burst':
+            raise HTTPException(
+                status_code=413,
+                detail={
+                    "error": "Batch too large",
+                    "message": f"A request may carry at most {Config.RATE_LIMIT_BURST} images; split the batch"
+                }
+            )
+        logger.warning(f"Rate limited {client_id}, retry after {e.retry_after}s")
+        raise too_many_requests(e)
+
+
+def invalid_image_error(validation_result: Dict[str, Any], trace_id: Optional[str] = None) -> HTTPException:
+    """Build the 400 response for an image that failed chest X-ray validation."""
+    # Image doesn't appear to be a chest X-ray
+    logger.warning(f"Invalid image type detected: {validation_result['message']}")
+    return HTTPException(
+        status_code=400,
+        detail={
+            "error": "Invalid Image Type",
+            "message": validation_result['message'],
+            "suggestion": "Please upload a chest X-ray image. The uploaded image appears to be a document, photo, or other non-medical image.",
+            "validation_details": validation_result['checks'],
+            "trace_id": trace_id,
+        }
+    )
+
+
+def ensure_model_loaded() -> None:
+    """Load the model if startup preloading failed."""
+    if inference_fn is None:
+        logger.info("Loading model for first prediction")
+        load_ml_model()
+
+
+def too_many_requests(e: AdmissionRejected) -> HTTPException:
+    """Build a 429 response carrying Retry-After for a rejected request."""
+    message = (
+        "Rate limit exceeded for this client."
+        if e.reason == 'rate_limited'
+        else "Too many requests from this client are already waiting for analysis."
+    )
+    return HTTPException(
+        status_code=429,
+        detail={"error": "Too many requests", "message": message, "retry_after": e.retry_after},
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def is_admin(request: Request) -> bool:
+    """Whether the request carries the configured admin token."""
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(Config.ADMIN_TOKEN) and hmac.compare_digest(token, Config.ADMIN_TOKEN)
+
+
+def require_admin(request: Request) -> None:
+    """
+    Reject the request unless it carries the configured admin token.
+
+    Raises:
+        HTTPException: 403 if admin endpoints are disabled or the token is wrong
+    """
+    if not is_admin(request):
+        raise HTTPException(status_code=403, detail={"error": "Forbidden"})
+
+
+def get_profile_store() -> ProfileStore:
+    """Profile store, or a 404 when profiling is switched off."""
+    if profile_store is None:
+        raise HTTPException(status_code=404, detail={"error": "Profiling is disabled"})
+    return profile_store
+
+
+async def analyze_image(image: Image.Image, explanation_id: Optional[str] = None, tta: bool = False,
+                        explain: bool = False) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """
+    Validate and predict a decoded image, reusing results for near-duplicates.
+
+    Args:
+        image: Decoded PIL Image
+        explanation_id: Hash of the upload; an accepted prediction's heatmap
+            can be fetched under it from /api/explain/{explanation_id}
+        tta: Run test-time augmentation (ignored with an explanation); the
+            result of a near-duplicate is not reused, as it may lack TTA
+        explain: Compute the Grad-CAM explanation now, in the prediction's
+            gradient pass (needs explanation_id)
+
+    Returns:
+        Tuple of (validation result, prediction result or None if rejected)
+    """
+    if explain and explanation_id is not None:
+        return await validate_and_predict(image, explain_pneumonia, explanation_id,
+                                          explanation_id=explanation_id)
+
+    if tta:
+        return await validate_and_predict(image, predict_pneumonia, True, explanation_id=explanation_id)
+    if near_duplicate_index is None:
+        return await validate_and_predict(image, explanation_id=explanation_id)
+
+    with stage('phash'):
+        image_hash, thumbnail = await run_in_worker(near_duplicate_fingerprint, image)
+        match = near_duplicate_index.lookup(image_hash, Config.NEAR_DUPLICATE_MAX_DISTANCE)
+        # Similar anatomy can share a hash; only reuse a result whose pixels agree too
+        verified = match is not None and thumbnails_match(match.value[2], thumbnail)
+    if verified:
+        validation_result, result, _ = match.value
+        logger.info("Near-duplicate upload (distance %d), reusing earlier result", match.distance)
+        if result is not None:
+            result = dict(result, near_duplicate=True, near_duplicate_distance=match.distance)
+        return validation_result, result
+
+    validation_result, result = await validate_and_predict(image, explanation_id=explanation_id)
+    near_duplicate_index.add(image_hash, (validation_result, result and dict(result), thumbnail))
+    return validation_result, result
+
+
+def near_duplicate_fingerprint(image: Image.Image) -> Tuple[int, np.ndarray]:
+    """Perceptual hash and verification thumbnail of a decoded upload."""
+    return compute_phash(image), compute_thumbnail(image)
+
+
+async def cached_analysis(content: bytes, variant: str = ''
+                          ) -> Tuple[Optional[bytes], Optional[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]]:
+    """
+    Look up an upload in the persistent result cache.
+
+    Args:
+        content: Encoded upload bytes
+        variant: Distinguishes analyses of the same upload with different
+            options (e.g. 'tta')
+
+    Returns:
+        Tuple of (cache key, (validation result, prediction result) or None);
+        the key is None when the cache is disabled
+    """
+    if result_cache is None:
+        return None, None
+    with stage('result_cache'):
+        key, value = await run_in_worker(result_cache.lookup, content, variant)
+    if value is None:
+        return key, None
+    logger.info("Result cache hit, reusing earlier result")
+    return key, (value['validation'], value['result'])
+
+
+def store_analysis(key: Optional[bytes], validation_result: Dict[str, Any],
+                   result: Optional[Dict[str, Any]]) -> None:
+    """
+    Write an analysis to the result cache in the background; the response does not wait.
+
+    Results reused from a near-duplicate upload are not stored: they were
+    computed for a different image, and the cache is keyed by exact bytes.
+    """
+    if result is not None and result.get('near_duplicate'):
+        return
+    if key is not None and result_cache is not None:
+        run_in_worker(result_cache.put, key, {'validation': validation_result, 'result': result})
+
+
+def profiled_analysis(image_path: str, explanation_id: Optional[str], explain: bool, trace_id: str,
+                      capture_tensorflow: bool) -> Tuple[Dict[str, Any], Optional[PendingPrediction]]:
+    """
+    Decode, validate and predict one upload under cProfile.
+
+    Runs the stages sequentially on a single worker thread, since cProfile
+    only observes the thread it is enabled on. The trace is written to the
+    profile store under `trace_id`.
+
+    Args:
+        image_path: Path to the uploaded image file
+        explanation_id: Hash of the upload
+        explain: Also compute a Grad-CAM explanation under explanation_id
+        trace_id: ID the trace is stored under
+        capture_tensorflow: Also capture a TensorFlow profiler trace of inference
+
+    Returns:
+        Tuple of (validation result, pending prediction or None if rejected);
+        the caller passes the prediction to accept_prediction
+    """
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    validation_result, pending = None, None
+    profiler.enable()
+    try:
+        image = decode_upload(image_path)
+        validation_result = ChestXRayValidator.validate_image(image)
+        if validation_result['is_likely_xray']:
+            trace = profile_store.tensorflow_trace(trace_id) if capture_tensorflow else nullcontext()
+            with trace:
+                if explain:
+                    pending = explain_pneumonia(image, explanation_id)
+                else:
+                    pending = predict_pneumonia(image)
+        return validation_result, pending
+    finally:
+        profiler.disable()
+        profile_store.save(trace_id, profiler, {
+            'duration_ms': round(1000 * (time.perf_counter() - start), 2),
+            'file_size': os.path.getsize(image_path),
+            'accepted': bool(validation_result and validation_result['is_likely_xray']),
+        })
+        logger.info(f"Saved profile trace {trace_id}")
+
+
+def build_prediction_response(validation_result: Dict[str, Any],
+                              result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Add the disclaimer and validation details to an accepted prediction.
+
+    Args:
+        validation_result: Result of chest X-ray validation
+        result: Prediction result
+
+    Returns:
+        Fields of a PredictionResponse
+    """
+    result = dict(result)
+
+    # Add medical disclaimer
+    result['disclaimer'] = (
+        "This prediction is for educational/research purposes only. "
+        "Always consult a qualified healthcare professional for medical diagnosis."
+    )
+
+    # Add validation confidence
+    result['validation_confidence'] = validation_result['confidence']
+
+    # Add warning if validation confidence is low
+    if validation_result['confidence'] < 80:
+        result['validation_warning'] = validation_result['message']
+
+    return result
+
+
 # API Routes
 
 @app.get("/", tags=["Root"])
@@ -227,7 +1180,12 @@ async def root():
         "endpoints": {
             "health": "/health",
             "predict": "/api/predict (POST)",
+            "predict_raw": "/api/predict/raw (POST, application/octet-stream)",
+            "predict_tensor": "/api/predict/tensor (POST, NPY uint8 batch)",
+            "predict_stream": "/ws/predict (WebSocket)",
+            "explain": "/api/explain/{explanation_id}",
             "model_info": "/api/model/info",
+            "usage": "/api/usage (admin)",
             "docs": "/docs",
             "redoc": "/redoc"
         }
@@ -239,12 +1197,12 @@ async def health_check():
     """Health check endpoint."""
     try:
         # Check if model is loaded
-        if model is None:
+        if inference_fn is None:
             load_ml_model()
 
         return HealthResponse(
             status="healthy",
-            model_loaded=model is not None,
+            model_loaded=inference_fn is not None,
             model_path=Config.MODEL_PATH
         )
 
@@ -257,7 +1215,7 @@ async def health_check():
 async def model_info():
     """Get information about the loaded model."""
     try:
-        if model is None:
+        if inference_fn is None:
             load_ml_model()
 
         return ModelInfo(
@@ -266,7 +1224,9 @@ async def model_info():
             input_size=Config.TARGET_SIZE,
             classes=["Normal", "Pneumonia"],
             accuracy="89.67%",
-            threshold=Config.PREDICTION_THRESHOLD
+            threshold=Config.PREDICTION_THRESHOLD,
+            upload_max_dimension=Config.UPLOAD_MAX_DIMENSION,
+            upload_formats=["image/png", "image/jpeg"]
         )
 
     except Exception as e:
@@ -274,17 +1234,218 @@ async def model_info():
         raise HTTPException(status_code=500, detail={"error": str(e)})
 
 
+@app.get("/api/usage", tags=["Admin"])
+async def usage_endpoint(request: Request):
+    """Per-client request and inference usage counters (requires X-Admin-Token)."""
+    require_admin(request)
+    return admission.usage_snapshot()
+
+
+@app.get("/api/explain/{explanation_id}", response_model=ExplanationResponse, tags=["Prediction"])
+async def explanation_endpoint(request: Request, explanation_id: str):
+    """
+    Fetch the Grad-CAM heatmap overlay for an accepted prediction.
+
+    Explanations computed with `explain=true` are served from this worker's
+    cache. Otherwise the Grad-CAM pass runs now on the model input stored
+    with the prediction, so the image is not uploaded, decoded, validated or
+    charged against the rate limit again; the pass takes a fair-share
+    inference slot like any other model call.
+
+    Args:
+        explanation_id: The explanation_id returned by /api/predict
+
+    Returns:
+        JPEG heatmap overlay as a data URL, with the prediction it explains
+    """
+    explanation = explanation_cache.get(explanation_id)
+    if explanation is None and explanation_store is not None:
+        model_input = await run_in_worker(explanation_store.get, explanation_id)
+        if model_input is not None:
+            client_id = get_client_id(request)
+            try:
+                async with admission.inference_slot(client_id):
+                    explanation = await run_in_worker(compute_explanation, explanation_id, model_input)
+            except AdmissionRejected as e:
+                raise too_many_requests(e)
+    if explanation is None:
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "error": "Explanation not found",
+                "message": "The explanation has expired. Analyze the image again with explain=true."
+            }
+        )
+
+    overlay = await run_in_worker(explanation_cache.overlay_data_url, explanation_id)
+
+    return ExplanationResponse(
+        explanation_id=explanation_id,
+        prediction=explanation.result['prediction'],
+        raw_score=explanation.result['raw_score'],
+        overlay=overlay,
+    )
+
+
+@app.get("/api/shadow/stats", tags=["Admin"])
+async def shadow_stats_endpoint(request: Request):
+    """
+    Agreement, score deltas and latency of the shadow candidate model (requires X-Admin-Token).
+
+    Score deltas are candidate minus primary score over the sampled requests
+    the candidate has scored so far.
+    """
+    require_admin(request)
+    if shadow_evaluator is None:
+        raise HTTPException(status_code=404, detail={"error": "Shadow mode is disabled"})
+    return shadow_evaluator.stats()
+
+
+def get_similarity_index() -> SimilarityIndex:
+    """Similarity index, or a 404 when similar-case search is switched off."""
+    ensure_model_loaded()
+    if similarity_index is None:
+        raise HTTPException(status_code=404, detail={"error": "Similar-case search is disabled"})
+    return similarity_index
+
+
+@app.post("/api/similar", response_model=SimilarCasesResponse, tags=["Similar Cases"])
+async def similar_cases_for_upload(request: Request, file: UploadFile = File(...), k: int = 5):
+    """
+    Analyse an uploaded chest X-ray and find the most similar past cases.
+
+    The upload is validated and predicted like /api/predict and becomes a
+    case itself, so later searches can find it.
+
+    Args:
+        file: Uploaded image file (PNG, JPG, JPEG)
+        k: Number of similar cases to return (at most 50)
+
+    Returns:
+        The upload's case_id and prediction, and its nearest past cases
+    """
+    index = get_similarity_index()
+    client_id = get_client_id(request)
+    check_rate_limit(client_id)
+
+    file_ext = Path(file.filename or '').suffix.lower().replace('.', '')
+    if file_ext not in Config.ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail={"error": "Invalid file type", "message": f"Allowed types: {', '.join(Config.ALLOWED_EXTENSIONS)}"}
+        )
+    content = await file.read()
+    if not content:
+        raise HTTPException(status_code=400, detail={"error": "No image data provided"})
+
+    prediction = await predict_from_bytes(client_id, content)
+    neighbors = []
+    if prediction.case_id is not None:
+        neighbors = await run_in_worker(
+            index.search_case, prediction.case_id, min(max(k, 1), Config.SIMILARITY_MAX_K)
+        ) or []
+
+    return SimilarCasesResponse(case_id=prediction.case_id, prediction=prediction, neighbors=neighbors)
+
+
+@app.get("/api/similar/{case_id}", response_model=SimilarCasesResponse, tags=["Similar Cases"])
+async def similar_cases_for_case(case_id: str, k: int = 5):
+    """
+    Find the past cases most similar to an earlier analysed case.
+
+    Args:
+        case_id: The case_id returned by /api/predict
+        k: Number of similar cases to return (at most 50)
+
+    Returns:
+        The nearest past cases, most similar first
+    """
+    index = get_similarity_index()
+    neighbors = None
+    if CASE_ID_PATTERN.match(case_id):
+        neighbors = await run_in_worker(index.search_case, case_id, min(max(k, 1), Config.SIMILARITY_MAX_K))
+    if neighbors is None:
+        raise HTTPException(
+            status_code=404,
+            detail={"error": "Case not found", "message": "The case is unknown or has been evicted from the index."}
+        )
+
+    return SimilarCasesResponse(case_id=case_id, neighbors=neighbors)
+
+
+@app.get("/api/cache/stats", tags=["Admin"])
+async def cache_stats_endpoint(request: Request):
+    """Near-duplicate, similarity index and result cache statistics (requires X-Admin-Token)."""
+    require_admin(request)
+    return {
+        "near_duplicate": near_duplicate_index.stats() if near_duplicate_index else None,
+        "max_distance": Config.NEAR_DUPLICATE_MAX_DISTANCE,
+        "similarity": similarity_index.stats() if similarity_index else None,
+        "result_cache": await run_in_worker(result_cache.stats) if result_cache else None,
+    }
+
+
+@app.get("/api/profiles", tags=["Admin"])
+async def list_profiles_endpoint(request: Request):
+    """List stored request profiles, newest first (requires X-Admin-Token)."""
+    require_admin(request)
+    return {"traces": get_profile_store().list()}
+
+
+@app.get("/api/profiles/{trace_id}", tags=["Admin"])
+async def download_profile_endpoint(request: Request, trace_id: str, format: str = "prof"):
+    """
+    Download a stored request profile (requires X-Admin-Token).
+
+    Args:
+        trace_id: The trace_id returned by a profiled /api/predict call
+        format: 'prof' for the pstats dump, 'text' for a cumulative-time
+            summary, 'tensorflow' for the zipped TensorFlow profiler trace
+    """
+    require_admin(request)
+    store = get_profile_store()
+    not_found = HTTPException(status_code=404, detail={"error": "Trace not found"})
+    try:
+        if format == "text":
+            summary = store.summary(trace_id)
+            if summary is None:
+                raise not_found
+            return PlainTextResponse(summary)
+        if format == "tensorflow":
+            archive = store.tensorflow_archive(trace_id)
+            if archive is None:
+                raise not_found
+            return FileResponse(archive, media_type="application/zip", filename=archive.name)
+        path = store.profile_path(trace_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail={"error": "Invalid trace ID"})
+    if path is None:
+        raise not_found
+    return FileResponse(path, media_type="application/octet-stream", filename=path.name)
+
+
 @app.post("/api/predict", response_model=PredictionResponse, tags=["Prediction"])
-async def predict_endpoint(file: UploadFile = File(...)):
+async def predict_endpoint(request: Request, file: UploadFile = File(...), explain: bool = False,
+                           profile: bool = False, tta: bool = False):
     """
     Predict pneumonia from uploaded chest X-ray image.
 
     Args:
         file: Uploaded image file (PNG, JPG, JPEG)
+        explain: Compute the Grad-CAM heatmap in the prediction's gradient pass; without
+            it the heatmap is computed when first fetched from /api/explain/{explanation_id}
+        tta: Average the score over augmented copies of the image, returned
+            with its variance (done automatically for borderline scores)
+        profile: Profile this request (admin only, requires PROFILING_ENABLED);
+            the X-Profile header has the same effect. One request is profiled
+            at a time; others get a 409 meanwhile
 
     Returns:
         Prediction result with confidence score
     """
+    client_id = get_client_id(request)
+    check_rate_limit(client_id)
+
     try:
         # Validate file
         if not file:
@@ -302,57 +1463,69 @@ async def predict_endpoint(file: UploadFile = File(...)):
             )
 
         # Ensure model is loaded
-        if model is None:
-            logger.info("Loading model for first prediction")
-            load_ml_model()
+        ensure_model_loaded()
 
         # Create temporary file
         with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_ext}") as temp_file:
             temp_path = temp_file.name
-            content = await file.read()
+            with stage('upload'):
+                content = await file.read()
             temp_file.write(content)
-            logger.info(f"File saved to temporary path: {temp_path}")
+            logger.info("File saved to temporary path: %s", temp_path)
 
+        trace_id = None
         try:
-            # Validate if image is a chest X-ray
-            validation_result = ChestXRayValidator.validate_chest_xray(temp_path)
+            if profile_store is not None and (profile or request.headers.get('X-Profile')) and is_admin(request):
+                if not profile_store.try_begin_profile():
+                    raise HTTPException(
+                        status_code=409,
+                        detail={"error": "Profiler busy", "message": "Another request is being profiled. Retry shortly."}
+                    )
+                trace_id = profile_store.new_trace_id()
+
+            # Heatmaps are fetched by upload hash, on any worker, without sending the image again
+            explanation_id = hashlib.sha256(content).hexdigest()
+
+            # Explained and profiled requests always run the pipeline
+            cache_key, cached = (None, None)
+            if not explain and trace_id is None:
+                cache_key, cached = await cached_analysis(content, 'tta' if tta else '')
+
+            # Validate if image is a chest X-ray (and predict, per PIPELINE_MODE)
+            try:
+                if cached is not None:
+                    validation_result, result = cached
+                else:
+                    async with admission.inference_slot(client_id):
+                        if trace_id is not None:
+                            validation_result, pending = await run_in_worker(
+                                profiled_analysis, temp_path, explanation_id, explain, trace_id,
+                                Config.PROFILE_TENSORFLOW
+                            )
+                            result = pending and await accept_prediction(pending, explanation_id)
+                        else:
+                            # Decode once; validation and inference share the image
+                            image = await run_in_worker(decode_upload, temp_path)
+                            validation_result, result = await analyze_image(image, explanation_id, tta, explain)
+                    store_analysis(cache_key, validation_result, result)
+            except AdmissionRejected as e:
+                logger.warning(f"Inference queue full for {client_id}")
+                raise too_many_requests(e)
 
             if not validation_result['is_likely_xray']:
-                # Image doesn't appear to be a chest X-ray
-                logger.warning(f"Invalid image type detected: {validation_result['message']}")
-                raise HTTPException(
-                    status_code=400,
-                    detail={
-                        "error": "Invalid Image Type",
-                        "message": validation_result['message'],
-                        "suggestion": "Please upload a chest X-ray image. The uploaded image appears to be a document, photo, or other non-medical image.",
-                        "validation_details": validation_result['checks']
-                    }
-                )
-
-            # Make prediction
-            result = predict_pneumonia(temp_path)
-
-            # Add medical disclaimer
-            result['disclaimer'] = (
-                "This prediction is for educational/research purposes only. "
-                "Always consult a qualified healthcare professional for medical diagnosis."
-            )
+                raise invalid_image_error(validation_result, trace_id)
 
-            # Add validation confidence
-            result['validation_confidence'] = validation_result['confidence']
-
-            # Add warning if validation confidence is low
-            if validation_result['confidence'] < 80:
-                result['validation_warning'] = validation_result['message']
-
-            return PredictionResponse(**result)
+            return PredictionResponse(
+                **build_prediction_response(validation_result, result), trace_id=trace_id
+            )
 
         finally:
+            if trace_id is not None:
+                profile_store.end_profile()
             # Clean up temporary file
             if os.path.exists(temp_path):
                 os.remove(temp_path)
-                logger.info(f"Temporary file deleted: {temp_path}")
+                logger.info("Temporary file deleted: %s", temp_path)
 
     except HTTPException:
         raise
@@ -367,10 +1540,328 @@ async def predict_endpoint(file: UploadFile = File(...)):
         )
 
 
+async def read_body(request: Request) -> bytes:
+    """
+    Read a raw request body, enforcing MAX_CONTENT_LENGTH.
+
+    Raises:
+        HTTPException: 400 for an empty body, 413 if it is too large
+    """
+    declared = request.headers.get('content-length')
+    if declared and declared.isdigit() and int(declared) > Config.MAX_CONTENT_LENGTH:
+        raise HTTPException(status_code=413, detail={"error": "Payload too large"})
+
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > Config.MAX_CONTENT_LENGTH:
+            raise HTTPException(status_code=413, detail={"error": "Payload too large"})
+        chunks.append(chunk)
+
+    if size == 0:
+        raise HTTPException(status_code=400, detail={"error": "No image data provided"})
+    return b''.join(chunks)
+
+
+@app.post("/api/predict/raw", response_model=PredictionResponse, tags=["Prediction"])
+async def predict_raw_endpoint(request: Request, explain: bool = False, tta: bool = False):
+    """
+    Predict pneumonia from an image sent as the raw request body.
+
+    For server-side integrations: send the encoded PNG/JPEG bytes with
+    Content-Type application/octet-stream (or image/png, image/jpeg). The
+    image is decoded in memory, with no multipart parsing or temporary file.
+
+    Args:
+        explain: Compute the Grad-CAM heatmap in the prediction's gradient pass; without
+            it the heatmap is computed when first fetched from /api/explain/{explanation_id}
+        tta: Average the score over augmented copies of the image, returned
+            with its variance (done automatically for borderline scores)
+
+    Returns:
+        Prediction result with confidence score
+    """
+    client_id = get_client_id(request)
+    check_rate_limit(client_id)
+    content = await read_body(request)
+    return await predict_from_bytes(client_id, content, explain, tta)
+
+
+async def predict_from_bytes(client_id: str, content: bytes, explain: bool = False,
+                             tta: bool = False) -> PredictionResponse:
+    """
+    Validate and predict an encoded image held in memory.
+
+    Shared by the raw-body and WebSocket endpoints; the caller has already
+    charged the client's rate limit.
+
+    Args:
+        client_id: Client identifier for fair scheduling
+        content: Encoded PNG/JPEG bytes
+        explain: Compute the Grad-CAM explanation with the prediction
+        tta: Always run test-time augmentation
+
+    Returns:
+        Prediction result with confidence score
+
+    Raises:
+        HTTPException: For invalid images, full queues and processing errors
+    """
+    try:
+        ensure_model_loaded()
+
+        explanation_id = hashlib.sha256(content).hexdigest()
+        cache_key, cached = (
+            await cached_analysis(content, 'tta' if tta else '') if not explain else (None, None)
+        )
+        try:
+            if cached is not None:
+                validation_result, result = cached
+            else:
+                async with admission.inference_slot(client_id):
+                    image = await run_in_worker(decode_upload, content)
+                    validation_result, result = await analyze_image(image, explanation_id, tta, explain)
+                store_analysis(cache_key, validation_result, result)
+        except AdmissionRejected as e:
+            logger.warning(f"Inference queue full for {client_id}")
+            raise too_many_requests(e)
+
+        if not validation_result['is_likely_xray']:
+            raise invalid_image_error(validation_result)
+
+        return PredictionResponse(**build_prediction_response(validation_result, result))
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        logger.error(f"Validation error: {e}")
+        raise HTTPException(status_code=400, detail={"error": "Processing error", "message": str(e)})
+    except Exception as e:
+        logger.error(f"Unexpected error in prediction: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail={"error": "Internal server error", "message": "An unexpected error occurred"}
+        )
+
+
+@app.post("/api/predict/tensor", response_model=TensorPredictionResponse, tags=["Prediction"])
+async def predict_tensor_endpoint(request: Request):
+    """
+    Predict pneumonia for a batch of already resized images sent as NPY.
+
+    The body is a .npy file holding a uint8 array of shape (N, 150, 150, 3)
+    or (N, 150, 150, 1). Decoding, resizing and the chest X-ray validation
+    check are skipped: the array goes straight into batched inference, so
+    callers are responsible for sending chest X-rays. Every image is charged
+    against the client's rate limit; a batch of more than RATE_LIMIT_BURST
+    images gets a 413.
+
+    Returns:
+        One prediction per image, in input order
+    """
+    client_id = get_client_id(request)
+
+    content_type = request.headers.get('content-type', '').split(';')[0].strip()
+    if content_type not in Config.TENSOR_CONTENT_TYPES:
+        raise HTTPException(
+            status_code=415,
+            detail={
+                "error": "Unsupported media type",
+                "message": f"Allowed types: {', '.join(sorted(Config.TENSOR_CONTENT_TYPES))}"
+            }
+        )
+
+    try:
+        images = load_tensor_batch(await read_body(request))
+        check_rate_limit(client_id, cost=len(images))
+        ensure_model_loaded()
+
+        try:
+            async with admission.inference_slot(client_id):
+                with stage('inference'):
+                    results = await run_in_worker(predict_tensor_batch, images)
+        except AdmissionRejected as e:
+            logger.warning(f"Inference queue full for {client_id}")
+            raise too_many_requests(e)
+
+        return TensorPredictionResponse(
+            results=[TensorPrediction(**result) for result in results],
+            count=len(results),
+            disclaimer=(
+                "These predictions are for educational/research purposes only. "
+                "Always consult a qualified healthcare professional for medical diagnosis."
+            ),
+        )
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        logger.error(f"Tensor batch error: {e}")
+        raise HTTPException(status_code=400, detail={"error": "Processing error", "message": str(e)})
+    except Exception as e:
+        logger.error(f"Unexpected error in tensor prediction endpoint: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail={"error": "Internal server error", "message": "An unexpected error occurred"}
+        )
+
+
+@app.websocket("/ws/predict")
+async def predict_stream_endpoint(websocket: WebSocket):
+    """
+    Stream chest X-ray images over one WebSocket connection.
+
+    Send an optional text frame {"id": "..."} followed by a binary frame
+    with the encoded image, as many times as needed. Each result (or error)
+    comes back as a JSON text frame tagged with that id, in completion order.
+    At most WS_MAX_OUTSTANDING frames are processed at once per session.
+    """
+    origin = websocket.headers.get('origin')
+    if origin and '*' not in Config.ALLOWED_ORIGINS and origin not in Config.ALLOWED_ORIGINS:
+        await websocket.close(code=1008)
+        return
+
+    client_id = get_client_id(websocket)
+    await websocket.accept()
+
+    async def predict(content: bytes) -> Dict[str, Any]:
+        # Each frame runs in its own task, so it gets its own request ID and sampling
+        begin_request(None, Config.LOG_SAMPLE_RATE)
+        # Over the rate limit the frame waits for tokens while holding its
+        # credit, so the session stops reading instead of failing frames
+        await admission.wait_for_rate(client_id)
+        response = await predict_from_bytes(client_id, content)
+        return response.model_dump()
+
+    session = StreamSession(
+        websocket,
+        predict,
+        max_outstanding=Config.WS_MAX_OUTSTANDING,
+        max_frame_bytes=Config.MAX_CONTENT_LENGTH,
+    )
+    await session.run()
+
+
+def get_job_store() -> JobStore:
+    """Job store, or a 404 when the job API is switched off."""
+    if job_store is None:
+        raise HTTPException(status_code=404, detail={"error": "Job API is disabled"})
+    return job_store
+
+
+async def process_job_item(item: JobItem) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Run one image of a job through the regular prediction pipeline.
+
+    Jobs share the submitting client's rate limit and fair-share inference
+    slots with its interactive requests: each image is charged as it runs,
+    and when the client is over its limit or its queue is full the item is
+    put back and retried later.
+
+    Returns:
+        Tuple of (prediction response, None) or (None, error with status and detail)
+    """
+    begin_request(f"job-{item.job_id[:12]}-{item.index}", Config.LOG_SAMPLE_RATE)
+    try:
+        admission.check_rate(item.client_id)
+    except AdmissionRejected as e:
+        raise RetryLater(e.retry_after)
+    try:
+        response = await predict_from_bytes(item.client_id, item.content)
+    except HTTPException as e:
+        if e.status_code == 429:
+            raise RetryLater(int((e.headers or {}).get('Retry-After', 1)))
+        return None, {"status": e.status_code, "detail": e.detail}
+    return response.model_dump(), None
+
+
+@app.post("/api/jobs", response_model=JobSubmitResponse, status_code=202, tags=["Jobs"])
+async def submit_job(request: Request, files: List[UploadFile] = File(...),
+                     callback_url: Optional[str] = Form(None)):
+    """
+    Queue one or many chest X-ray images for asynchronous analysis.
+
+    Returns at once with a job ID. Poll /api/jobs/{job_id} for progress and
+    results, or pass callback_url to have the finished job POSTed to it.
+    Each image is charged against the client's rate limit when it is
+    analysed, so a large job runs at the client's sustained rate.
+
+    Args:
+        files: Uploaded image files (PNG, JPG, JPEG)
+        callback_url: Optional http(s) URL that receives the finished job as JSON
+
+    Returns:
+        Job ID and the URL to poll
+    """
+    store = get_job_store()
+    client_id = get_client_id(request)
+
+    if not files:
+        raise HTTPException(status_code=400, detail={"error": "No file provided"})
+    if len(files) > Config.JOB_MAX_IMAGES:
+        raise HTTPException(
+            status_code=400,
+            detail={"error": "Too many files", "message": f"At most {Config.JOB_MAX_IMAGES} images per job"}
+        )
+    if callback_url:
+        try:
+            await run_in_worker(validate_callback_url, callback_url, Config.JOB_CALLBACK_HOSTS,
+                                Config.JOB_CALLBACK_ALLOW_PRIVATE)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail={"error": "Invalid callback URL", "message": str(e)})
+
+    check_rate_limit(client_id)
+
+    items = []
+    for file in files:
+        file_ext = Path(file.filename or '').suffix.lower().replace('.', '')
+        if file_ext not in Config.ALLOWED_EXTENSIONS:
+            raise HTTPException(
+                status_code=400,
+                detail={
+                    "error": "Invalid file type",
+                    "message": f"{file.filename}: allowed types are {', '.join(Config.ALLOWED_EXTENSIONS)}"
+                }
+            )
+        # Uploads are spooled to disk by the form parser; the store copies them
+        # into the database in chunks instead of reading them into memory
+        size = file.file.seek(0, os.SEEK_END)
+        file.file.seek(0)
+        if not size:
+            raise HTTPException(status_code=400, detail={"error": "No image data provided", "message": file.filename})
+        if size > Config.MAX_CONTENT_LENGTH:
+            raise HTTPException(status_code=413, detail={"error": "Payload too large", "message": file.filename})
+        items.append((file.filename, file.file))
+
+    job_id = await run_in_worker(store.create, client_id, items, callback_url or None)
+    if job_runner is not None:
+        job_runner.notify()
+    logger.info("Job %s queued with %d images", job_id, len(items))
+
+    return JobSubmitResponse(job_id=job_id, status='queued', total=len(items), status_url=f"/api/jobs/{job_id}")
+
+
+@app.get("/api/jobs/{job_id}", response_model=JobStatusResponse, tags=["Jobs"])
+async def get_job(job_id: str):
+    """
+    Progress and results of an asynchronous job.
+
+    Results are listed per image in submission order; images that were
+    rejected (e.g. not a chest X-ray) carry an error instead of a result.
+    """
+    store = get_job_store()
+    job = await run_in_worker(store.get, job_id) if JOB_ID_PATTERN.match(job_id) else None
+    if job is None:
+        raise HTTPException(status_code=404, detail={"error": "Job not found"})
+    return JobStatusResponse(**job)
+
+
 # Startup event
 @app.on_event("startup")
 async def startup_event():
-    """Load model at startup."""
+    """Load model at startup and start the job workers."""
+    global job_runner
+
     try:
         load_ml_model()
         logger.info("Model preloaded successfully")
@@ -378,6 +1869,36 @@ async def startup_event():
         logger.error(f"Failed to preload model: {e}")
         logger.warning("Server starting without model - it will be loaded on first request")
 
+    load_shadow_model()
+
+    if job_store is not None:
+        job_runner = JobRunner(
+            job_store,
+            process_job_item,
+            workers=Config.JOB_WORKERS,
+            retention_seconds=Config.JOB_RETENTION_HOURS * 3600,
+            callback_secret=Config.JOB_CALLBACK_SECRET,
+            callback_hosts=Config.JOB_CALLBACK_HOSTS,
+            callback_allow_private=Config.JOB_CALLBACK_ALLOW_PRIVATE,
+        )
+        await job_runner.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background workers and flush queued log records before the process exits."""
+    if job_runner is not None:
+        await job_runner.stop()
+    if shadow_evaluator is not None:
+        shadow_evaluator.stop()
+    if result_cache is not None:
+        result_cache.close()
+    if explanation_store is not None:
+        explanation_store.close()
+    if model_client is not None:
+        model_client.close()
+    stop_logging()
+
 
 # Main execution
 if __name__ == "__main__":
@@ -0,0 +1,164 @@
+"""
+Shared helpers for the PneumoScan backend benchmarks.
+
+Benchmarks run from the backend directory and fall back to a randomly
+initialized copy of the notebook's final architecture when the trained model
+is not available, so timings stay representative without the weights.
+"""
+
+import os
+import sys
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Any
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+DEFAULT_MODEL_PATH = os.getenv(
+    'MODEL_PATH',
+    str(BACKEND_DIR / '..' / 'model' / 'final_model.keras')
+)
+
+
+def build_reference_model(input_shape: tuple = (150, 150, 3)):
+    """
+    Build the notebook's final CNN architecture with random weights.
+
+    Args:
+        input_shape: Model input shape (height, width, channels)
+
+    Returns:
+        Uncompiled Keras model
+    """
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import (
+        Input, Conv2D, MaxPool2D, Dropout, Flatten, Dense, BatchNormalization
+    )
+
+    return Sequential([
+        Input(shape=input_shape),
+        Conv2D(32, (3, 3), strides=1, activation='relu', padding='same'),
+        BatchNormalization(),
+        Conv2D(64, (3, 3), activation='relu'),
+        MaxPool2D((3, 3)),
+        BatchNormalization(),
+        Conv2D(64, (3, 3), activation='relu'),
+        Dropout(0.2),
+        BatchNormalization(),
+        Conv2D(128, (3, 3), strides=2, activation='relu', padding='same'),
+        MaxPool2D((2, 2)),
+        BatchNormalization(),
+        Conv2D(256, (2, 2), activation='relu', padding='same'),
+        MaxPool2D((2, 2)),
+        BatchNormalization(),
+        Flatten(),
+        Dense(256, activation='selu'),
+        BatchNormalization(),
+        Dense(1, activation='sigmoid'),
+    ])
+
+
+def load_benchmark_model(model_path: str = DEFAULT_MODEL_PATH):
+    """
+    Load the trained model, or the reference architecture if it is missing.
+
+    Args:
+        model_path: Path to a saved Keras model
+
+    Returns:
+        Keras model
+    """
+    if os.path.exists(model_path):
+        from tensorflow.keras.models import load_model
+        return load_model(model_path)
+
+    print(f"Model not found at {model_path}, using randomly initialized reference model",
+          file=sys.stderr)
+    return build_reference_model()
+
+
+def synthetic_xray(size: int = 512, mode: str = 'L', seed: int = 0):
+    """
+    Generate a synthetic chest X-ray-like image.
+
+    Produces a smooth gradient with two darker elliptical "lung" fields and
+    mild noise, which passes the validator's grayscale and histogram checks.
+
+    Args:
+        size: Width and height in pixels
+        mode: PIL image mode ('L' or 'RGB')
+        seed: Random seed for the noise
+
+    Returns:
+        PIL Image
+    """
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    img = 150 + 60 * np.sin(np.pi * x) * np.cos(np.pi * (y - 0.5))
+    for cx in (0.32, 0.68):
+        lung = ((x - cx) / 0.16) ** 2 + ((y - 0.5) / 0.3) ** 2 < 1
+        img[lung] -= 80
+    img += rng.normal(0, 8, img.shape)
+    gray = Image.fromarray(np.clip(img, 0, 255).astype(np.uint8), mode='L')
+    return gray.convert(mode) if mode != 'L' else gray
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Return the q-th percentile of a list of values."""
+    return float(np.percentile(np.asarray(values), q)) if values else 0.0
+
+
+def latency_summary(latencies: List[float], elapsed: float) -> Dict[str, Any]:
+    """
+    Summarize request latencies (seconds) into throughput and percentiles (ms).
+
+    Args:
+        latencies: Per-request latencies in seconds
+        elapsed: Total wall time of the run in seconds
+
+    Returns:
+        dict with request count, throughput and latency percentiles
+    """
+    return {
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def print_table(rows: List[Dict[str, Any]]) -> None:
+    """Print a list of dicts as an aligned text table."""
+    if not rows:
+        return
+    columns = list(rows[0].keys())
+    widths = {c: max(len(c), *(len(str(r.get(c, ''))) for r in rows)) for c in columns}
+    print('  '.join(c.ljust(widths[c]) for c in columns))
+    print('  '.join('-' * widths[c] for c in columns))
+    for row in rows:
+        print('  '.join(str(row.get(c, '')).ljust(widths[c]) for c in columns))
+
+
+def write_json(path: str, payload: Any) -> None:
+    """Write benchmark results as indented JSON."""
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=2)
+
+
+class Timer:
+    """Context manager measuring wall time in seconds."""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        return False
@@ -0,0 +1,126 @@
+"""
+Compare PIL decoding with TensorFlow decoding (PREPROCESS_MODE=graph).
+
+Both paths are run the way the app serves them: the upload is decoded once
+at UPLOAD_MAX_DIMENSION, validated, and resized into the model input. The
+benchmark first checks that the graph path gives the same validation
+outcome and scores within a tolerance of the PIL path on PNG and JPEG
+uploads, then measures the throughput of both at several client
+concurrency levels.
+
+Usage (from the backend directory):
+    python benchmarks/bench_graph_preprocess.py --size 2048 --max-dimension 512 --concurrency 1 2 4 8
+"""
+
+import argparse
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from _common import load_benchmark_model, synthetic_xray, latency_summary, print_table, write_json
+
+TARGET_SIZE = (150, 150)
+
+
+def encode(image, fmt: str) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **({'quality': 90} if fmt == 'JPEG' else {}))
+    return buffer.getvalue()
+
+
+def run_concurrent(fn, items, concurrency: int):
+    """Call fn on every item from `concurrency` threads; return latencies and wall time."""
+    def timed(item):
+        start = time.perf_counter()
+        fn(item)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        latencies = list(pool.map(timed, items))
+        elapsed = time.perf_counter() - start
+    return latencies, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=16, help='Distinct synthetic uploads')
+    parser.add_argument('--size', type=int, default=2048, help='Synthetic image size (px)')
+    parser.add_argument('--max-dimension', type=int, default=512,
+                        help='UPLOAD_MAX_DIMENSION both paths decode at (0 = full resolution)')
+    parser.add_argument('--requests', type=int, default=128, help='Requests per measurement')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--tolerance', type=float, default=0.02,
+                        help='Largest accepted score difference between the two paths')
+    parser.add_argument('--output', help='Write results as JSON to this path')
+    args = parser.parse_args()
+
+    from serving_config import build_inference_function, build_graph_decoder
+    from inference import BatchBufferPool, decode_image, write_image_into
+    from image_validator import ChestXRayValidator
+
+    model = load_benchmark_model()
+    infer = build_inference_function(model)
+    graph_decode = build_graph_decoder(args.max_dimension)
+    pool = BatchBufferPool(max_batch_size=1, image_shape=TARGET_SIZE + (3,), pool_size=max(args.concurrency))
+
+    uploads = []
+    for i in range(args.images):
+        image = synthetic_xray(args.size, mode='RGB' if i % 2 else 'L', seed=i)
+        uploads.append(encode(image, 'JPEG' if i % 4 < 2 else 'PNG'))
+
+    # The same decode paths as app.decode_upload
+    def decode_pil(content: bytes) -> Image.Image:
+        return decode_image(content, args.max_dimension)
+
+    def decode_graph(content: bytes) -> Image.Image:
+        pixels = graph_decode(content)
+        return Image.fromarray(pixels[..., 0] if pixels.shape[-1] == 1 else pixels)
+
+    def analyze(decode, content: bytes):
+        image = decode(content)
+        accepted = ChestXRayValidator.validate_image(image)['is_likely_xray']
+        with pool.acquire() as buffer:
+            write_image_into(image, buffer[0])
+            return accepted, float(infer(buffer[:1])[0][0])
+
+    # Parity with the path the app serves by default
+    pil = [analyze(decode_pil, c) for c in uploads]
+    graph = [analyze(decode_graph, c) for c in uploads]
+    max_diff = float(np.max(np.abs([p[1] - g[1] for p, g in zip(pil, graph)])))
+    validation_mismatches = sum(p[0] != g[0] for p, g in zip(pil, graph))
+    print(f"Parity at max dimension {args.max_dimension}: max |PIL - graph| score difference "
+          f"{max_diff:.5f} (tolerance {args.tolerance}), {validation_mismatches} validation "
+          f"mismatches over {len(uploads)} PNG/JPEG uploads")
+
+    requests = [uploads[i % len(uploads)] for i in range(args.requests)]
+    paths = (('pil', lambda c: analyze(decode_pil, c)), ('graph', lambda c: analyze(decode_graph, c)))
+    for _, fn in paths:
+        run_concurrent(fn, uploads, 1)  # warm up traces and lazy initialization
+
+    rows = []
+    for concurrency in args.concurrency:
+        for name, fn in paths:
+            latencies, elapsed = run_concurrent(fn, requests, concurrency)
+            row = {'path': name, 'concurrency': concurrency}
+            row.update(latency_summary(latencies, elapsed))
+            row['images_per_s'] = round(len(requests) / elapsed, 2)
+            rows.append(row)
+    print_table(rows)
+
+    if args.output:
+        write_json(args.output, {'max_dimension': args.max_dimension, 'max_score_diff': max_diff,
+                                 'validation_mismatches': validation_mismatches,
+                                 'tolerance': args.tolerance, 'results': rows})
+
+    if max_diff > args.tolerance or validation_mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
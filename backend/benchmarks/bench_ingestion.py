@@ -0,0 +1,91 @@
+"""
+Per-image server CPU time of the multipart, raw-binary and NPY tensor endpoints.
+
+Drives the FastAPI app in-process with TestClient and measures process CPU
+time per image. Request bodies are prepared before timing; client-side work
+that remains (HTTP framing, multipart encoding by the test client) is
+included for every path, so the differences understate the server savings
+of the leaner endpoints. Rate limiting and the near-duplicate index are
+disabled so every request does the full work.
+
+Usage (from the backend directory):
+    python benchmarks/bench_ingestion.py --requests 50 --size 2048 --batch 16
+"""
+
+import argparse
+import io
+import time
+
+import numpy as np
+
+from _common import load_benchmark_model, synthetic_xray, print_table
+
+
+def cpu_per_image(fn, requests: int, images_per_request: int) -> float:
+    fn()  # warm up
+    start = time.process_time()
+    for _ in range(requests):
+        response = fn()
+        assert response.status_code == 200, response.text
+    return 1000 * (time.process_time() - start) / (requests * images_per_request)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--size', type=int, default=2048, help='Encoded image size (px)')
+    parser.add_argument('--batch', type=int, default=16, help='Images per NPY request')
+    args = parser.parse_args()
+
+    from fastapi.testclient import TestClient
+    import app as app_module
+    from serving_config import build_inference_function
+
+    app_module.model = load_benchmark_model()
+    app_module.inference_fn = build_inference_function(app_module.model)
+    app_module.admission.rate = 0
+    app_module.near_duplicate_index = None
+    client = TestClient(app_module.app)
+
+    image = synthetic_xray(args.size)
+    encoded = io.BytesIO()
+    image.save(encoded, format='JPEG', quality=90)
+    jpeg = encoded.getvalue()
+
+    small = np.asarray(image.convert('RGB').resize(app_module.Config.TARGET_SIZE), dtype=np.uint8)
+
+    def npy(n, channels):
+        batch = np.repeat(small[None, :, :, :channels], n, axis=0)
+        buffer = io.BytesIO()
+        np.save(buffer, batch)
+        return buffer.getvalue()
+
+    npy_rgb_1, npy_rgb_n, npy_gray_n = npy(1, 3), npy(args.batch, 3), npy(args.batch, 1)
+
+    cases = [
+        ('multipart /api/predict', 1,
+         lambda: client.post('/api/predict', files={'file': ('xray.jpg', jpeg, 'image/jpeg')})),
+        ('raw /api/predict/raw', 1,
+         lambda: client.post('/api/predict/raw', content=jpeg,
+                             headers={'Content-Type': 'application/octet-stream'})),
+        ('npy N=1 RGB', 1,
+         lambda: client.post('/api/predict/tensor', content=npy_rgb_1,
+                             headers={'Content-Type': 'application/x-npy'})),
+        (f'npy N={args.batch} RGB', args.batch,
+         lambda: client.post('/api/predict/tensor', content=npy_rgb_n,
+                             headers={'Content-Type': 'application/x-npy'})),
+        (f'npy N={args.batch} gray', args.batch,
+         lambda: client.post('/api/predict/tensor', content=npy_gray_n,
+                             headers={'Content-Type': 'application/x-npy'})),
+    ]
+
+    rows = []
+    for name, per_request, fn in cases:
+        rows.append({'endpoint': name,
+                     'cpu_ms_per_image': round(cpu_per_image(fn, args.requests, per_request), 2)})
+    print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
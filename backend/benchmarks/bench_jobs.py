@@ -0,0 +1,123 @@
+"""
+Submit a study through the asynchronous job API and wait for its callback.
+
+Starts a local stand-in callback receiver, submits studies of synthetic
+chest X-rays to /api/jobs on the in-process app, and reports how long the
+submission took to return, when each job's callback arrived, and the
+resulting image throughput. Every study is also polled once to check that
+the callback body matches /api/jobs/{job_id}.
+
+Usage (from the backend directory):
+    python benchmarks/bench_jobs.py --jobs 4 --images 25 --size 2048
+"""
+
+import argparse
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from _common import load_benchmark_model, synthetic_xray, print_table
+
+
+class CallbackReceiver(ThreadingHTTPServer):
+    """Local HTTP server recording the jobs POSTed to it."""
+
+    def __init__(self):
+        self.received = {}
+        self.arrived = threading.Condition()
+
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with receiver.arrived:
+                    receiver.received[body['job_id']] = (time.perf_counter(), body)
+                    receiver.arrived.notify_all()
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        super().__init__(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/callback"
+
+    def wait_for(self, job_ids, timeout: float) -> bool:
+        with self.arrived:
+            return self.arrived.wait_for(lambda: all(j in self.received for j in job_ids), timeout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=4, help='Studies submitted back to back')
+    parser.add_argument('--images', type=int, default=25, help='Images per study')
+    parser.add_argument('--size', type=int, default=2048, help='Encoded image size (px)')
+    parser.add_argument('--timeout', type=float, default=600, help='Seconds to wait for callbacks')
+    args = parser.parse_args()
+
+    os.environ['JOB_DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'jobs.sqlite3')
+    os.environ.setdefault('JOB_MAX_IMAGES', str(args.images))
+    # The stand-in receiver listens on loopback
+    os.environ['JOB_CALLBACK_HOSTS'] = '127.0.0.1'
+    os.environ['JOB_CALLBACK_ALLOW_PRIVATE'] = 'true'
+
+    from fastapi.testclient import TestClient
+    import app as app_module
+    from serving_config import build_inference_function
+
+    app_module.model = load_benchmark_model()
+    app_module.inference_fn = build_inference_function(app_module.model)
+    app_module.admission.rate = 0
+    app_module.near_duplicate_index = None
+    receiver = CallbackReceiver()
+
+    study = []
+    for i in range(args.images):
+        encoded = io.BytesIO()
+        synthetic_xray(args.size, seed=i).save(encoded, format='JPEG', quality=90)
+        study.append(('files', (f'image_{i}.jpg', encoded.getvalue(), 'image/jpeg')))
+
+    with TestClient(app_module.app) as client:
+        submitted = {}
+        for _ in range(args.jobs):
+            start = time.perf_counter()
+            response = client.post('/api/jobs', files=study, data={'callback_url': receiver.url})
+            assert response.status_code == 202, response.text
+            submitted[response.json()['job_id']] = (start, time.perf_counter() - start)
+
+        first_submit = min(start for start, _ in submitted.values())
+        if not receiver.wait_for(submitted, args.timeout):
+            raise SystemExit(f"Timed out: {len(receiver.received)}/{len(submitted)} callbacks received")
+
+        rows = []
+        for job_id, (start, submit_seconds) in submitted.items():
+            arrived, body = receiver.received[job_id]
+            polled = client.get(f'/api/jobs/{job_id}').json()
+            assert polled['results'] == body['results'], "callback and poll disagree"
+            rows.append({
+                'job': job_id[:8],
+                'submit_ms': round(1000 * submit_seconds, 1),
+                'callback_after_s': round(arrived - start, 2),
+                'completed': body['completed'],
+                'failed': body['failed'],
+            })
+        print_table(rows)
+
+        last_callback = max(arrived for arrived, _ in receiver.received.values())
+        total_images = args.jobs * args.images
+        print(f"{total_images} images in {last_callback - first_submit:.2f}s "
+              f"({total_images / (last_callback - first_submit):.2f} images/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+Memory and throughput of a shared model server against independent workers.
+
+'independent' starts N worker processes that each import TensorFlow and
+load the model, as `uvicorn app:app --workers N` does. 'shared' starts one
+model server process and N client processes that only hold a shared-memory
+ring and a socket, as with MODEL_SERVER_SOCKET. In both, every worker runs
+several threads issuing single-image inference calls for a fixed duration.
+
+Memory is reported per process as RSS and PSS (proportional set size, which
+splits shared pages between the processes mapping them, so PSS adds up to
+the real total). Linux only.
+
+Usage (from the backend directory):
+    python benchmarks/bench_model_server.py --workers 1 2 4 --threads 4 --duration 10
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from _common import print_table
+
+IMAGE_SHAPE = (150, 150, 3)
+
+
+def memory_kib(pid: int) -> dict:
+    """RSS and PSS of a process in KiB, from /proc."""
+    values = {}
+    for path, key in ((f'/proc/{pid}/status', 'VmRSS:'), (f'/proc/{pid}/smaps_rollup', 'Pss:')):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith(key):
+                        values[key.strip(':').lower()] = int(line.split()[1])
+                        break
+        except OSError:
+            pass
+    return {'rss': values.get('vmrss', 0), 'pss': values.get('pss', 0)}
+
+
+def drive(infer, threads: int, duration: float, start_at) -> int:
+    """
+    Call infer on single images from several threads; return the number of calls.
+
+    start_at is a shared value the parent sets once every worker is ready.
+    """
+    counts = [0] * threads
+    image = np.random.default_rng(0).integers(0, 256, (1, *IMAGE_SHAPE), dtype=np.uint8)
+
+    while not start_at.value or time.time() < start_at.value:
+        time.sleep(0.001)
+    deadline = start_at.value + duration
+
+    def loop(i):
+        while time.time() < deadline:
+            np.asarray(infer(image))
+            counts[i] += 1
+
+    workers = [threading.Thread(target=loop, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(counts)
+
+
+def independent_worker(threads, duration, start_at, ready, results):
+    from _common import load_benchmark_model
+    from serving_config import build_inference_function
+
+    infer = build_inference_function(load_benchmark_model())
+    infer(np.zeros((1, *IMAGE_SHAPE), dtype=np.uint8))
+    ready.put(os.getpid())
+    calls = drive(infer, threads, duration, start_at)
+    results.put((calls, memory_kib(os.getpid())))
+
+
+def model_server(address, max_batch_size, ready):
+    from _common import load_benchmark_model
+    from serving_config import build_inference_function
+    from model_server import ModelServer
+
+    infer = build_inference_function(load_benchmark_model())
+    for size in range(1, max_batch_size + 1):
+        infer(np.zeros((size, *IMAGE_SHAPE), dtype=np.uint8))  # trace every batch size up front
+    server = ModelServer(infer, IMAGE_SHAPE, address, max_batch_size=max_batch_size)
+    ready.put(os.getpid())
+    server.serve_forever()
+
+
+def shared_worker(address, threads, duration, start_at, ready, results):
+    from model_server import ModelServerClient
+
+    for _ in range(100):  # the server may still be binding its socket
+        try:
+            client = ModelServerClient(address, IMAGE_SHAPE, slots=max(threads, 1))
+            break
+        except OSError:
+            time.sleep(0.1)
+    else:
+        raise RuntimeError(f"Model server at {address} did not come up")
+    ready.put(os.getpid())
+    calls = drive(client.infer, threads, duration, start_at)
+    results.put((calls, memory_kib(os.getpid())))
+    client.close()
+
+
+def run(mode: str, workers: int, args, ctx) -> dict:
+    ready, results = ctx.Queue(), ctx.Queue()
+    start_at = ctx.Value('d', 0.0)
+    server, server_memory = None, None
+
+    if mode == 'shared':
+        address = os.path.join(tempfile.mkdtemp(), 'model.sock')
+        server = ctx.Process(target=model_server, args=(address, args.max_batch_size, ready), daemon=True)
+        server.start()
+        ready.get()
+        target, extra = shared_worker, (address,)
+    else:
+        target, extra = independent_worker, ()
+
+    procs = [ctx.Process(target=target, args=(*extra, args.threads, args.duration, start_at, ready, results))
+             for _ in range(workers)]
+    for proc in procs:
+        proc.start()
+    for _ in procs:
+        ready.get()
+    start_at.value = time.time() + 0.5
+
+    if server is not None:
+        time.sleep(0.5 + args.duration / 2)
+        server_memory = memory_kib(server.pid)
+    collected = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+    if server is not None:
+        server.terminate()
+        server.join()
+
+    worker_pss = [memory['pss'] for _, memory in collected]
+    total_pss = sum(worker_pss) + (server_memory['pss'] if server_memory else 0)
+    return {
+        'mode': mode,
+        'workers': workers,
+        'images_per_s': round(sum(calls for calls, _ in collected) / args.duration, 1),
+        'worker_rss_mib': round(np.mean([m['rss'] for _, m in collected]) / 1024, 1),
+        'worker_pss_mib': round(np.mean(worker_pss) / 1024, 1),
+        'server_rss_mib': round(server_memory['rss'] / 1024, 1) if server_memory else None,
+        'total_pss_mib': round(total_pss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=4, help='Concurrent calls per worker')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per run')
+    parser.add_argument('--max-batch-size', type=int, default=16)
+    parser.add_argument('--modes', nargs='+', choices=['independent', 'shared'],
+                        default=['independent', 'shared'])
+    args = parser.parse_args()
+
+    # Fresh interpreters, so no worker inherits a parent's TensorFlow state
+    ctx = multiprocessing.get_context('spawn')
+    rows = [run(mode, workers, args, ctx) for workers in args.workers for mode in args.modes]
+    print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Near-duplicate detection benchmark for the perceptual-hash index.
+
+1. Hit rate: indexes distinct synthetic radiographs, then queries
+   re-encoded, resized and "screenshotted" copies (true near-duplicates),
+   unrelated images, and same-anatomy negatives: the same base image with
+   a different patient's noise and a local opacity, which must not reuse
+   the indexed result. Hits are reported on the hash alone and after the
+   thumbnail verification the server applies.
+2. Lookup latency: fills the index with random hashes at several sizes and
+   times lookups against a brute-force scan of the same hashes.
+
+Usage (from the backend directory):
+    python benchmarks/bench_phash_index.py --sizes 10000 100000 500000
+"""
+
+import argparse
+import io
+import time
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from _common import percentile, print_table
+from phash import (NearDuplicateIndex, compute_phash, compute_thumbnail, hamming_distances,
+                   thumbnails_match)
+
+
+def varied_radiograph(seed: int, size: int = 1024) -> Image.Image:
+    """Smooth random field standing in for a distinct radiograph."""
+    rng = np.random.default_rng(seed)
+    coarse = rng.normal(128, 40, (8, 8)).clip(0, 255).astype(np.uint8)
+    field = np.asarray(Image.fromarray(coarse).resize((size, size), Image.BICUBIC), dtype=np.float32)
+    field += rng.normal(0, 6, field.shape)
+    return Image.fromarray(field.clip(0, 255).astype(np.uint8), mode='L')
+
+
+def same_anatomy_negative(seed: int, size: int = 1024) -> Image.Image:
+    """
+    Another patient with the same anatomy as varied_radiograph(seed).
+
+    Same smooth field, different fine noise, plus a bright blob standing in
+    for a consolidation in one lung field.
+    """
+    base = np.asarray(varied_radiograph(seed, size), dtype=np.float32)
+    rng = np.random.default_rng(100_000 + seed)
+    base = base + rng.normal(0, 6, base.shape)
+    y, x = np.mgrid[:size, :size]
+    cy, cx = rng.uniform(0.3, 0.7) * size, rng.choice([0.3, 0.7]) * size
+    base += 60 * np.exp(-((y - cy) ** 2 + (x - cx) ** 2) / (2 * (size / 14) ** 2))
+    return Image.fromarray(base.clip(0, 255).astype(np.uint8), mode='L')
+
+
+def variants(image: Image.Image):
+    """Typical re-uploads of the same radiograph."""
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=60)
+    yield 'jpeg_q60', Image.open(io.BytesIO(buffer.getvalue()))
+
+    yield 'resized_50pct', image.resize((image.width // 2, image.height // 2), Image.BILINEAR)
+
+    # Screenshot: RGB, slightly scaled, with a thin UI border
+    shot = image.convert('RGB').resize((int(image.width * 0.9), int(image.height * 0.9)))
+    yield 'screenshot', ImageOps.expand(shot, border=12, fill=(240, 240, 240))
+
+
+def hit_rate_benchmark(n_images: int, max_distance: int) -> list:
+    index = NearDuplicateIndex()
+    for seed in range(n_images):
+        image = varied_radiograph(seed)
+        index.add(compute_phash(image), (seed, compute_thumbnail(image)))
+
+    def query(image):
+        match = index.lookup(compute_phash(image), max_distance)
+        verified = match is not None and thumbnails_match(match.value[1], compute_thumbnail(image))
+        return match, verified
+
+    counts = {}
+    for seed in range(n_images):
+        queries = [*variants(varied_radiograph(seed)),
+                   ('unrelated', varied_radiograph(10_000 + seed)),
+                   ('same_anatomy', same_anatomy_negative(seed))]
+        for name, image in queries:
+            match, verified = query(image)
+            hit, reused, correct = counts.get(name, (0, 0, 0))
+            counts[name] = (hit + (match is not None), reused + verified,
+                            correct + (verified and match.value[0] == seed))
+
+    rows = []
+    for name, (hit, reused, correct) in counts.items():
+        negative = name in ('unrelated', 'same_anatomy')
+        rows.append({'queries': name, 'hash_hit_rate': round(hit / n_images, 3),
+                     'verified_hit_rate': round(reused / n_images, 3),
+                     'correct_match_rate': '-' if negative else round(correct / n_images, 3)})
+    return rows
+
+
+def latency_benchmark(sizes, queries: int, max_distance: int) -> list:
+    rng = np.random.default_rng(0)
+    rows = []
+    for size in sizes:
+        hashes = rng.integers(0, np.iinfo(np.uint64).max, size, dtype=np.uint64, endpoint=True)
+        index = NearDuplicateIndex(max_entries=size + 1)
+        for i, h in enumerate(hashes):
+            index.add(int(h), i)
+
+        # Half near-duplicates of indexed hashes (a few flipped bits), half random
+        probes = []
+        for q in range(queries):
+            if q % 2:
+                h = int(hashes[rng.integers(size)])
+                for bit in rng.choice(64, size=rng.integers(0, max_distance + 1), replace=False):
+                    h ^= 1 << int(bit)
+            else:
+                h = int(rng.integers(0, np.iinfo(np.uint64).max, dtype=np.uint64, endpoint=True))
+            probes.append(h)
+
+        index_times, scan_times = [], []
+        for h in probes:
+            start = time.perf_counter()
+            index.lookup(h, max_distance)
+            index_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            int(np.min(hamming_distances(hashes, h)))
+            scan_times.append(time.perf_counter() - start)
+
+        rows.append({
+            'entries': size,
+            'index_mean_ms': round(1000 * float(np.mean(index_times)), 4),
+            'index_p99_ms': round(1000 * percentile(index_times, 99), 4),
+            'scan_mean_ms': round(1000 * float(np.mean(scan_times)), 4),
+            'hit_rate': index.stats()['hit_rate'],
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=50, help='Distinct images for hit rate')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 500_000])
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--max-distance', type=int, default=0)
+    args = parser.parse_args()
+
+    print("Hit rate")
+    print_table(hit_rate_benchmark(args.images, args.max_distance))
+    print("\nLookup latency")
+    print_table(latency_benchmark(args.sizes, args.queries, args.max_distance))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Compare request latency of the sequential and concurrent pipeline modes.
+
+Drives `app.validate_and_predict` directly (no HTTP) over a mix of synthetic
+chest X-rays and non-X-ray images, issuing requests with a fixed concurrency
+in each PIPELINE_MODE.
+
+Usage (from the backend directory):
+    python benchmarks/bench_pipeline_modes.py --requests 200 --concurrency 4
+"""
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+from PIL import Image
+
+from _common import load_benchmark_model, synthetic_xray, latency_summary, print_table
+
+
+def synthetic_photo(size: int, seed: int) -> Image.Image:
+    """A colourful noise image that the validator rejects."""
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 256, (size, size, 3), dtype=np.uint8), mode='RGB')
+
+
+async def run_mode(app_module, images, requests: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await app_module.validate_and_predict(images[i % len(images)])
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return latency_summary(latencies, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--size', type=int, default=1024, help='Synthetic image size (px)')
+    parser.add_argument('--reject-ratio', type=float, default=0.25,
+                        help='Fraction of images the validator should reject')
+    args = parser.parse_args()
+
+    import app as app_module
+    from serving_config import build_inference_function
+
+    app_module.model = load_benchmark_model()
+    app_module.inference_fn = build_inference_function(app_module.model)
+
+    n_reject = int(round(10 * args.reject_ratio))
+    images = [synthetic_xray(args.size, seed=i) for i in range(10 - n_reject)]
+    images += [synthetic_photo(args.size, seed=i) for i in range(n_reject)]
+    for image in images:
+        image.load()
+
+    # Warm up tracing
+    asyncio.run(run_mode(app_module, images, 4, 1))
+
+    rows = []
+    for mode in ('sequential', 'concurrent'):
+        app_module.Config.PIPELINE_MODE = mode
+        row = {'mode': mode}
+        row.update(asyncio.run(run_mode(app_module, images, args.requests, args.concurrency)))
+        rows.append(row)
+    print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
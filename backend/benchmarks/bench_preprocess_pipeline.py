@@ -0,0 +1,113 @@
+"""
+Compare the float32 preprocessing pipeline with the uint8 buffer pipeline.
+
+Reports per-request Python allocations (traced with tracemalloc) for both
+preprocessing paths and checks that predictions are bit-identical when the
+`/ 255` normalization moves into the inference graph.
+
+Usage (from the backend directory):
+    python benchmarks/bench_preprocess_pipeline.py --images 20 --size 1024
+"""
+
+import argparse
+import os
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+from _common import load_benchmark_model, synthetic_xray, print_table
+
+
+def legacy_preprocess(image_path: str) -> np.ndarray:
+    """The previous float32 pipeline (load_img, img_to_array, / 255, expand_dims)."""
+    from tensorflow.keras.preprocessing.image import load_img, img_to_array
+
+    img = load_img(image_path, target_size=(150, 150))
+    img_array = img_to_array(img)
+    img_array = img_array / 255.0
+    return np.expand_dims(img_array, axis=0)
+
+
+def measure_allocations(fn, repeats: int) -> dict:
+    """
+    Measure transient Python-level allocations made by repeated calls of fn.
+
+    NumPy reports its array buffers to tracemalloc, so the per-call peak
+    above the starting point captures every intermediate array.
+
+    Returns:
+        dict with mean peak KiB per call and how many float32 150x150x3
+        image copies that peak corresponds to
+    """
+    fn()  # warm up lazy imports and caches
+    float_image_bytes = 150 * 150 * 3 * 4
+    peaks = []
+    tracemalloc.start()
+    for _ in range(repeats):
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+        del result
+        peaks.append(peak - base)
+    tracemalloc.stop()
+    mean_peak = sum(peaks) / len(peaks)
+    return {
+        'peak_kib_per_request': round(mean_peak / 1024, 1),
+        'float_image_copies': round(mean_peak / float_image_bytes, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=20, help='Number of synthetic images')
+    parser.add_argument('--size', type=int, default=1024, help='Synthetic image size (px)')
+    parser.add_argument('--repeats', type=int, default=50, help='Calls per allocation measurement')
+    args = parser.parse_args()
+
+    from serving_config import build_inference_function
+    from inference import BatchBufferPool, load_image_into
+
+    model = load_benchmark_model()
+    infer = build_inference_function(model)
+    pool = BatchBufferPool(max_batch_size=1, image_shape=(150, 150, 3), pool_size=1)
+
+    tmpdir = tempfile.mkdtemp()
+    paths = []
+    for i in range(args.images):
+        path = os.path.join(tmpdir, f'xray_{i}.png')
+        synthetic_xray(args.size, mode='RGB' if i % 2 else 'L', seed=i).save(path)
+        paths.append(path)
+
+    # Bit-level parity of predictions
+    mismatches = 0
+    max_abs_diff = 0.0
+    for path in paths:
+        legacy = model(legacy_preprocess(path), training=False).numpy()
+        with pool.acquire() as buffer:
+            load_image_into(path, buffer[0])
+            current = infer(buffer[:1]).numpy()
+        if not np.array_equal(legacy.view(np.uint32), current.view(np.uint32)):
+            mismatches += 1
+            max_abs_diff = max(max_abs_diff, float(np.max(np.abs(legacy - current))))
+    print(f"Parity: {len(paths) - mismatches}/{len(paths)} predictions bit-identical "
+          f"(max abs diff {max_abs_diff:.3g})")
+
+    def run_uint8():
+        with pool.acquire() as buffer:
+            load_image_into(paths[0], buffer[0])
+            return buffer[:1]
+
+    rows = []
+    for name, fn in (('float32 (legacy)', lambda: legacy_preprocess(paths[0])),
+                     ('uint8 buffer', run_uint8)):
+        row = {'pipeline': name}
+        row.update(measure_allocations(fn, args.repeats))
+        rows.append(row)
+    print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
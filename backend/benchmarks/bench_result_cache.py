@@ -0,0 +1,129 @@
+"""
+Lookup latency of the persistent result cache under multi-process contention.
+
+Fills a result cache database, then starts N processes (standing in for
+uvicorn workers) that open it concurrently and run a mix of lookups and
+stores for a fixed duration: a share of lookups hit existing entries, and
+every miss is followed by a store, as in the server. Reports per-lookup and
+per-store latency percentiles, throughput, and writes skipped because
+another process held the write lock.
+
+Usage (from the backend directory):
+    python benchmarks/bench_result_cache.py --processes 1 2 4 8 --entries 50000
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from _common import percentile, print_table
+from result_cache import ResultCache
+
+MODEL_VERSION = 'bench:0.5:512:pil'
+
+SAMPLE_VALUE = {
+    'validation': {
+        'is_likely_xray': True,
+        'confidence': 100,
+        'checks': {'is_grayscale': True, 'has_medical_histogram': True, 'has_text_content': False},
+        'message': 'Image appears to be a valid chest X-ray',
+    },
+    'result': {'prediction': 'Pneumonia', 'confidence': 0.9731, 'raw_score': 0.9731,
+               'case_id': '0123456789abcdef0123456789abcdef'},
+}
+
+
+def upload(i: int) -> bytes:
+    """Stand-in for upload bytes; only its hash is used."""
+    return b'upload-%d' % i
+
+
+def fill(path: str, entries: int) -> None:
+    cache = ResultCache(path, MODEL_VERSION, max_entries=entries * 2)
+    for i in range(entries):
+        cache.put(cache.key(upload(i)), SAMPLE_VALUE)
+    cache.close()
+
+
+def worker(path: str, entries: int, max_entries: int, hit_rate: float, duration: float,
+           seed: int, start_at: float, results):
+    rng = np.random.default_rng(seed)
+    cache = ResultCache(path, MODEL_VERSION, max_entries=max_entries)
+    lookups, stores = [], []
+    fresh = 0
+    while time.time() < start_at:
+        time.sleep(0.001)
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        if rng.random() < hit_rate:
+            content = upload(int(rng.integers(0, entries)))
+        else:
+            fresh += 1
+            content = upload(entries + seed * 10_000_000 + fresh)
+        start = time.perf_counter()
+        key, value = cache.lookup(content)
+        lookups.append(time.perf_counter() - start)
+        if value is None:
+            start = time.perf_counter()
+            cache.put(key, SAMPLE_VALUE)
+            stores.append(time.perf_counter() - start)
+    stats = cache.stats()
+    cache.close()
+    results.put((lookups, stores, stats['hits'], stats['skipped_writes'], stats['errors']))
+
+
+def run(path: str, processes: int, args) -> dict:
+    results = multiprocessing.Queue()
+    start_at = time.time() + 1.0  # all processes open the database before the clock starts
+    procs = [
+        multiprocessing.Process(target=worker, args=(
+            path, args.entries, args.max_entries, args.hit_rate, args.duration, seed, start_at, results
+        ))
+        for seed in range(processes)
+    ]
+    for proc in procs:
+        proc.start()
+    collected = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+
+    lookups = [t for c in collected for t in c[0]]
+    stores = [t for c in collected for t in c[1]]
+    return {
+        'processes': processes,
+        'lookups_per_s': round(len(lookups) / args.duration),
+        'hit_rate': round(sum(c[2] for c in collected) / max(len(lookups), 1), 3),
+        'lookup_p50_us': round(percentile(lookups, 50) * 1e6, 1),
+        'lookup_p99_us': round(percentile(lookups, 99) * 1e6, 1),
+        'store_p50_us': round(percentile(stores, 50) * 1e6, 1) if stores else None,
+        'store_p99_us': round(percentile(stores, 99) * 1e6, 1) if stores else None,
+        'skipped_writes': sum(c[3] for c in collected),
+        'errors': sum(c[4] for c in collected),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--entries', type=int, default=50000, help='Entries before the run')
+    parser.add_argument('--max-entries', type=int, default=100000, help='Eviction bound')
+    parser.add_argument('--hit-rate', type=float, default=0.8, help='Share of lookups for cached uploads')
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds per run')
+    args = parser.parse_args()
+
+    rows = []
+    for processes in args.processes:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.sqlite3')
+            fill(path, args.entries)
+            rows.append(run(path, processes, args))
+    print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
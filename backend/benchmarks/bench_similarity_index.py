@@ -0,0 +1,91 @@
+"""
+Search latency and recall of the similar-case embedding index.
+
+Fills the index with clustered synthetic 256-d embeddings (standing in for
+the penultimate layer of the served CNN) at several sizes and times top-k
+queries. Above the IVF threshold the index is timed twice: with the coarse
+quantizer, and as an exhaustive scan of the same float16 vectors. Recall@k
+compares the quantized results with the exhaustive ones.
+
+Usage (from the backend directory):
+    python benchmarks/bench_similarity_index.py --sizes 5000 50000 200000
+"""
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from _common import percentile, print_table
+from similarity import SimilarityIndex
+
+
+def clustered_embeddings(n: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    return centers[rng.integers(0, clusters, n)] + 0.5 * rng.normal(size=(n, dim)).astype(np.float32)
+
+
+def time_queries(index: SimilarityIndex, queries: np.ndarray, k: int):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append([hit['case_id'] for hit in index.search(query, k)])
+        latencies.append(time.perf_counter() - start)
+    return latencies, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5000, 50000, 200000])
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--ivf-threshold', type=int, default=20000)
+    parser.add_argument('--nprobe', type=int, default=8)
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        vectors = clustered_embeddings(size, args.dim, clusters=max(16, size // 500), seed=size)
+        queries = vectors[np.random.default_rng(0).choice(size, args.queries)] + 0.1
+
+        index = SimilarityIndex(tempfile.mkdtemp(), args.dim, 'bench', max_entries=size,
+                                ivf_threshold=args.ivf_threshold, nprobe=args.nprobe)
+        start = time.perf_counter()
+        for vector in vectors:
+            index.add(vector, {'prediction': 'Normal', 'confidence': 0.9, 'raw_score': 0.1})
+        add_us = 1e6 * (time.perf_counter() - start) / size
+        while index._training:
+            time.sleep(0.1)
+
+        modes = [('flat', None)]
+        if index.stats()['ivf_lists']:
+            modes = [('ivf', None), ('flat', 'disable')]
+        exact = None
+        for mode, action in modes:
+            if action == 'disable':
+                index._centroids = None
+            latencies, results = time_queries(index, queries, args.k)
+            if mode == 'flat':
+                exact = results
+            rows.append({
+                'entries': size,
+                'mode': mode,
+                'add_us': round(add_us, 1),
+                'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+                '_results': results,
+            })
+        for row in rows[-len(modes):]:
+            got = row.pop('_results')
+            hits = sum(len(set(a) & set(b)) for a, b in zip(got, exact))
+            row[f'recall@{args.k}'] = round(hits / (len(exact) * args.k), 4)
+
+    print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
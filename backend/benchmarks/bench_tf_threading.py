@@ -0,0 +1,114 @@
+"""
+Benchmark matrix for TensorFlow thread pool and XLA settings.
+
+Each configuration runs in its own subprocess because TensorFlow's thread
+pools can only be sized once per process. Every simulated request runs the
+chest X-ray validator on a synthetic image followed by a single-image
+inference call, so the matrix reflects contention between TensorFlow and
+the NumPy work on the request path.
+
+Usage (from the backend directory):
+    python benchmarks/bench_tf_threading.py
+    python benchmarks/bench_tf_threading.py --intra 0 1 2 4 --inter 0 1 --concurrency 4
+"""
+
+import argparse
+import itertools
+import json
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from _common import (
+    load_benchmark_model, synthetic_xray, latency_summary, print_table, write_json
+)
+
+
+def run_worker(args) -> dict:
+    """Run one configuration in the current process and return its summary."""
+    from serving_config import configure_tensorflow, build_inference_function
+    from image_validator import ChestXRayValidator
+
+    settings = configure_tensorflow(args.intra[0], args.inter[0], args.xla[0] == 'on')
+
+    model = load_benchmark_model()
+    infer = build_inference_function(model, jit_compile=settings['xla_jit'])
+    image = synthetic_xray(args.image_size)
+    batch = np.random.default_rng(0).integers(0, 256, (1, 150, 150, 3), dtype=np.uint8)
+
+    # Warm up tracing and (when enabled) XLA compilation
+    for _ in range(3):
+        infer(batch)
+
+    def request(_):
+        start = time.perf_counter()
+        if not args.skip_validation:
+            ChestXRayValidator.is_grayscale_like(image)
+            ChestXRayValidator.has_medical_histogram(image)
+            ChestXRayValidator.has_text_content(image)
+        infer(batch).numpy()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies = list(pool.map(request, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    summary = {
+        'intra': settings['intra_op_threads'],
+        'inter': settings['inter_op_threads'],
+        'xla': 'on' if settings['xla_jit'] else 'off',
+    }
+    summary.update(latency_summary(latencies, elapsed))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--intra', type=int, nargs='+', default=[0, 1, 2, 4],
+                        help='Intra-op thread counts to test (0 = auto)')
+    parser.add_argument('--inter', type=int, nargs='+', default=[0, 1, 2],
+                        help='Inter-op thread counts to test (0 = auto)')
+    parser.add_argument('--xla', nargs='+', choices=['on', 'off'], default=['off', 'on'])
+    parser.add_argument('--concurrency', type=int, default=4, help='Concurrent requests')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per configuration')
+    parser.add_argument('--image-size', type=int, default=1024, help='Synthetic upload size (px)')
+    parser.add_argument('--skip-validation', action='store_true',
+                        help='Benchmark inference only, without validator contention')
+    parser.add_argument('--output', help='Write results to this JSON file')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args)))
+        return
+
+    passthrough = ['--concurrency', str(args.concurrency), '--requests', str(args.requests),
+                   '--image-size', str(args.image_size)]
+    if args.skip_validation:
+        passthrough.append('--skip-validation')
+
+    rows = []
+    for intra, inter, xla in itertools.product(args.intra, args.inter, args.xla):
+        cmd = [sys.executable, __file__, '--worker', '--intra', str(intra),
+               '--inter', str(inter), '--xla', xla] + passthrough
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"intra={intra} inter={inter} xla={xla} failed:\n{proc.stderr}", file=sys.stderr)
+            continue
+        row = json.loads(proc.stdout.strip().splitlines()[-1])
+        rows.append(row)
+        print(f"intra={row['intra']} inter={row['inter']} xla={row['xla']}: "
+              f"{row['throughput_rps']} req/s, p99 {row['p99_ms']} ms", file=sys.stderr)
+
+    print_table(rows)
+    if args.output:
+        write_json(args.output, rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Cost of test-time augmentation (TTA) per prediction.
+
+Times, per image, a plain single-image inference, TTA on request (the input
+and its K-1 augmented copies in one batch) and automatic TTA for a
+borderline score (the plain inference followed by one batch of K-1
+copies), against K separate single-image predictions. The expected average
+cost of automatic TTA is the plain cost plus the share of borderline
+traffic times the extra batch.
+
+Usage (from the backend directory):
+    python benchmarks/bench_tta.py --samples 4 8 16 --borderline-share 0.1
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from _common import load_benchmark_model, percentile, print_table
+from serving_config import build_inference_function
+from tta import TestTimeAugmentation
+
+
+def time_calls(fn, iterations: int) -> float:
+    """Median latency of fn() in milliseconds."""
+    for _ in range(3):
+        fn()
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return percentile(latencies, 50) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, nargs='+', default=[4, 8, 16], help='K values to test')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--borderline-share', type=float, default=0.1,
+                        help='Share of requests whose raw score falls in the TTA band')
+    args = parser.parse_args()
+
+    infer = build_inference_function(load_benchmark_model())
+    rng = np.random.default_rng(0)
+    buffer = rng.integers(0, 256, (max(args.samples), 150, 150, 3), dtype=np.uint8)
+    plain_ms = time_calls(lambda: infer(buffer[:1]).numpy(), args.iterations)
+
+    rows = []
+    for samples in args.samples:
+        tta = TestTimeAugmentation((150, 150), samples=samples)
+        copies = buffer[1:samples]
+
+        def on_request():
+            tta.augment_into(buffer[0], copies)
+            return infer(buffer[:samples]).numpy()
+
+        def extra_batch():
+            tta.augment_into(buffer[0], copies)
+            return infer(copies).numpy()
+
+        augment_ms = time_calls(lambda: tta.augment_into(buffer[0], copies), args.iterations)
+        on_request_ms = time_calls(on_request, args.iterations)
+        extra_ms = time_calls(extra_batch, args.iterations)
+        rows.append({
+            'K': samples,
+            'plain_ms': round(plain_ms, 2),
+            'augment_ms': round(augment_ms, 2),
+            'tta_on_request_ms': round(on_request_ms, 2),
+            'tta_auto_borderline_ms': round(plain_ms + extra_ms, 2),
+            'k_separate_calls_ms': round(samples * plain_ms, 2),
+            'auto_average_ms': round(plain_ms + args.borderline_share * extra_ms, 2),
+        })
+
+    print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
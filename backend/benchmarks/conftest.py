@@ -0,0 +1,119 @@
+"""
+pytest configuration for the hot-path micro-benchmark suite.
+
+Wall times depend on the machine and on its load at the moment, so each
+session first times a fixed calibration workload (image resizing and NumPy
+arithmetic, like the hot paths). Baselines record that calibration time,
+and wall times are compared after scaling the baseline by the ratio of the
+two calibration times.
+
+Options (also settable through the environment, which works however pytest
+is invoked):
+    --microbench-baseline PATH   MICROBENCH_BASELINE      baseline JSON file
+    --microbench-update          MICROBENCH_UPDATE=1      rewrite the baseline
+    --microbench-max-ratio R     MICROBENCH_MAX_RATIO     allowed slowdown (default 1.5)
+    --microbench-repeats N       MICROBENCH_REPEATS       timed calls per case (default 5)
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / 'microbench_baseline.json'
+CALIBRATION_RUNS = 15
+
+
+def calibrate(runs: int = CALIBRATION_RUNS) -> float:
+    """Fastest of several runs of a fixed PIL/NumPy workload, in milliseconds."""
+    rng = np.random.default_rng(0)
+    image = Image.fromarray(rng.integers(0, 256, (1024, 1024), dtype=np.uint8), mode='L')
+    times = []
+    for _ in range(runs + 1):
+        start = time.perf_counter()
+        pixels = np.asarray(image.resize((512, 512), Image.BILINEAR), dtype=np.float32)
+        np.histogram(pixels, bins=256, range=(0, 256))
+        np.corrcoef(pixels[::2].ravel(), pixels[1::2].ravel())
+        times.append(time.perf_counter() - start)
+    return round(1000 * min(times[1:]), 3)  # the first run warms up
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('microbench', 'hot-path micro-benchmarks')
+    group.addoption('--microbench-baseline', default=None, help='Baseline JSON file')
+    group.addoption('--microbench-update', action='store_true', default=False,
+                    help='Record results as the new baseline instead of comparing')
+    group.addoption('--microbench-max-ratio', type=float, default=None,
+                    help='Fail when a metric exceeds baseline by this factor')
+    group.addoption('--microbench-repeats', type=int, default=None, help='Timed calls per case')
+
+
+def _option(config, name: str, env: str, default):
+    value = config.getoption(name, default=None)
+    if value is None or value is False:
+        value = os.getenv(env)
+    return default if value in (None, '') else value
+
+
+class MicrobenchSession:
+    """Baseline lookup, regression thresholds and result collection for one run."""
+
+    def __init__(self, config):
+        self.baseline_path = Path(_option(config, '--microbench-baseline', 'MICROBENCH_BASELINE',
+                                          DEFAULT_BASELINE))
+        self.update = str(_option(config, '--microbench-update', 'MICROBENCH_UPDATE', False)).lower() in (
+            'true', '1', 'yes')
+        self.max_ratio = float(_option(config, '--microbench-max-ratio', 'MICROBENCH_MAX_RATIO', 1.5))
+        self.repeats = int(_option(config, '--microbench-repeats', 'MICROBENCH_REPEATS', 5))
+        self.baseline = {}
+        self.baseline_calibration_ms = None
+        if self.baseline_path.exists() and not self.update:
+            stored = json.loads(self.baseline_path.read_text())
+            self.baseline = stored.get('cases', {})
+            self.baseline_calibration_ms = stored.get('calibration_ms')
+        self.calibration_ms = calibrate()
+        self.results = {}
+
+    @property
+    def speed_factor(self) -> float:
+        """How much slower this session runs than the baseline's (1.0 without a recorded calibration)."""
+        if not self.baseline_calibration_ms:
+            return 1.0
+        return self.calibration_ms / self.baseline_calibration_ms
+
+    def save(self) -> None:
+        """Write the baseline: every result when updating, otherwise only cases it lacks."""
+        if self.update or not self.baseline:
+            # Results of a partial update run are scaled to one calibration with the rest
+            existing = (json.loads(self.baseline_path.read_text()) if self.baseline_path.exists() else {})
+            scale = (existing['calibration_ms'] / self.calibration_ms
+                     if existing.get('calibration_ms') and existing.get('cases') else 1.0)
+            calibration = self.calibration_ms * scale
+            cases = {**existing.get('cases', {}),
+                     **{k: self._scaled(v, scale) for k, v in self.results.items()}}
+        else:
+            new_cases = {k: v for k, v in self.results.items() if k not in self.baseline}
+            if not new_cases:
+                return
+            calibration = self.baseline_calibration_ms or self.calibration_ms
+            scale = calibration / self.calibration_ms
+            cases = {**self.baseline, **{k: self._scaled(v, scale) for k, v in new_cases.items()}}
+        self.baseline_path.write_text(json.dumps(
+            {'calibration_ms': round(calibration, 3), 'cases': dict(sorted(cases.items()))}, indent=2
+        ))
+
+    @staticmethod
+    def _scaled(result: dict, scale: float) -> dict:
+        """A result with its wall times converted to another session's speed."""
+        return {k: round(v * scale, 3) if k.endswith('_ms') else v for k, v in result.items()}
+
+
+@pytest.fixture(scope='session')
+def microbench(request):
+    session = MicrobenchSession(request.config)
+    yield session
+    session.save()
@@ -0,0 +1,151 @@
+"""
+Micro-benchmark regression suite for the validator and preprocessing hot paths.
+
+Times the ChestXRayValidator checks and the model-input preprocessing over a
+fixed set of synthetic radiographs (512 to 3000 px, RGB and L, PNG and
+JPEG), records wall time and traced allocations, and compares them with a
+baseline JSON. A case fails when its fastest wall time (relative to the
+session's calibration workload, see conftest.py) or its peak traced
+allocation grows past the allowed ratio; the fastest of several calls is
+the timing least disturbed by other load on the machine. Runs offline and never loads
+TensorFlow or the model; preprocessing is measured through the `inference`
+helpers that `app.preprocess_image` delegates to.
+
+Usage (from the backend directory):
+    python -m pytest benchmarks/test_hot_paths.py -q                      # compare
+    python -m pytest benchmarks/test_hot_paths.py -q --microbench-update  # new baseline
+    MICROBENCH_MAX_RATIO=2.0 python -m pytest benchmarks/test_hot_paths.py
+
+The first run on a machine (no baseline file) records the baseline and passes.
+"""
+
+import gc
+import io
+import statistics
+import time
+import tracemalloc
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from _common import synthetic_xray
+from image_validator import ChestXRayValidator
+from inference import decode_image, load_image_into
+
+SIZES = (512, 1024, 2048, 3000)
+MODES = ('RGB', 'L')
+FORMATS = ('PNG', 'JPEG')
+TARGET_SHAPE = (150, 150, 3)
+UPLOAD_MAX_DIMENSION = 512
+
+# Differences below these are noise, whatever the ratio
+ABSOLUTE_FLOORS = {'min_ms': 0.5, 'peak_kib': 64.0}
+
+_image_cache = {}
+
+
+def fixture_image(size: int, mode: str, fmt: str, directory) -> dict:
+    """Encoded bytes, file path and decoded image of one synthetic radiograph."""
+    key = (size, mode, fmt)
+    if key not in _image_cache:
+        buffer = io.BytesIO()
+        synthetic_xray(size, mode=mode, seed=size).save(
+            buffer, format=fmt, **({'quality': 90} if fmt == 'JPEG' else {})
+        )
+        data = buffer.getvalue()
+        path = directory / f"xray_{size}_{mode}.{fmt.lower()}"
+        path.write_bytes(data)
+        decoded = Image.open(io.BytesIO(data))
+        decoded.load()
+        _image_cache[key] = {'data': data, 'path': str(path), 'image': decoded}
+    return _image_cache[key]
+
+
+def _preprocess(sample: dict):
+    out = np.empty(TARGET_SHAPE, dtype=np.uint8)
+    load_image_into(sample['path'], out)
+    return out
+
+
+HOT_PATHS = {
+    'is_grayscale_like': lambda sample: ChestXRayValidator.is_grayscale_like(sample['image']),
+    'has_medical_histogram': lambda sample: ChestXRayValidator.has_medical_histogram(sample['image']),
+    'has_text_content': lambda sample: ChestXRayValidator.has_text_content(sample['image']),
+    # app.preprocess_image(path): decode the file and resize into the uint8 input buffer
+    'preprocess_image': _preprocess,
+    # Upload decode feeding validation and inference (JPEG draft + thumbnail)
+    'decode_upload': lambda sample: decode_image(sample['data'], UPLOAD_MAX_DIMENSION),
+}
+
+CASES = [
+    pytest.param(name, size, mode, fmt, id=f"{name}-{size}-{mode}-{fmt}")
+    for name in HOT_PATHS
+    for size in SIZES
+    for mode in MODES
+    for fmt in FORMATS
+]
+
+
+def measure(fn, repeats: int) -> dict:
+    """
+    Wall time of repeated calls, then traced allocations of one more call.
+
+    Timing runs without tracemalloc, which would distort it. NumPy reports
+    its buffers to tracemalloc, so the traced peak includes array memory.
+
+    Returns:
+        dict with median/min wall time (ms), peak traced allocation during
+        the call and allocation still held after it (KiB)
+    """
+    fn()  # warm up lazy imports and caches
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        base, _ = tracemalloc.get_traced_memory()
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+        del result
+        gc.collect()
+        retained, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'wall_ms': round(1000 * statistics.median(times), 3),
+        'min_ms': round(1000 * min(times), 3),
+        'peak_kib': round((peak - base) / 1024, 1),
+        'retained_kib': round((retained - base) / 1024, 1),
+    }
+
+
+@pytest.mark.parametrize('name, size, mode, fmt', CASES)
+def test_hot_path(name, size, mode, fmt, microbench, tmp_path_factory):
+    sample = fixture_image(size, mode, fmt, tmp_path_factory.getbasetemp())
+    fn = HOT_PATHS[name]
+    case_id = f"{name}-{size}-{mode}-{fmt}"
+
+    result = measure(lambda: fn(sample), microbench.repeats)
+    microbench.results[case_id] = result
+
+    baseline = microbench.baseline.get(case_id)
+    if baseline is None:
+        return
+
+    # Wall time is compared at this session's speed; allocations need no scaling
+    scale = {'min_ms': microbench.speed_factor, 'peak_kib': 1.0}
+    regressions = []
+    for metric, floor in ABSOLUTE_FLOORS.items():
+        before, after = round(baseline[metric] * scale[metric], 3), result[metric]
+        if after > before * microbench.max_ratio and after - before > floor:
+            regressions.append(f"{metric} {before} -> {after} ({after / max(before, 1e-9):.2f}x)")
+    assert not regressions, (
+        f"{case_id} regressed past {microbench.max_ratio}x baseline "
+        f"(session speed factor {microbench.speed_factor:.2f}): {'; '.join(regressions)}"
+    )
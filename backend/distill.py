@@ -0,0 +1,386 @@
+"""
+Knowledge Distillation
+
+Trains a small depthwise-separable CNN (the student) to reproduce the served
+model (the teacher) on the chest X-ray dataset, then reports parameter
+count, CPU latency and accuracy of both. The student is trained on a mix of
+the labels and the teacher's temperature-softened scores, which carry more
+information per image than the hard label (how close a case is to the
+threshold).
+
+The student keeps the teacher's 150x150x3 input and resizes internally when
+trained at a lower resolution, so the saved .keras file is served as is:
+
+    MODEL_PATH=../model/student_model.keras uvicorn app:app
+
+Its pointwise convolutions are regular Conv2D layers, so Grad-CAM and the
+similar-case embedding (input of the final Dense layer) keep working.
+
+Usage (from the backend directory):
+    python distill.py --data-dir /data/chest_xray --output ../model/student_model.keras
+    python distill.py --data-dir /data/chest_xray --input-resolution 112 --widths 16 32 64 128
+
+The data directory has the notebook's layout: train/, val/ and test/, each
+with NORMAL/ and PNEUMONIA/ subdirectories.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, Any, Sequence
+
+import numpy as np
+
+from serving_config import build_inference_function
+
+DEFAULT_TEACHER_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'model', 'final_model.keras'
+)
+CLASS_NAMES = ['NORMAL', 'PNEUMONIA']  # label 1 is pneumonia, as served
+INPUT_SIZE = (150, 150)
+MIN_VALIDATION_IMAGES = 100  # the dataset's val/ split has 16 images; below this, split train/
+
+
+def build_student(input_size: Sequence[int] = INPUT_SIZE, input_resolution: int = 112,
+                  widths: Sequence[int] = (16, 32, 64, 128), dropout: float = 0.2):
+    """
+    Build the depthwise-separable student CNN.
+
+    A strided Conv2D stem is followed by one block per width: a 3x3
+    depthwise convolution (stride 2) and a 1x1 pointwise Conv2D, each with
+    BatchNorm and ReLU. Global average pooling replaces the teacher's
+    Flatten + Dense(256) head, which holds most of the teacher's parameters.
+
+    Args:
+        input_size: Served input (height, width); images arrive normalized to [0, 1]
+        input_resolution: Side length the student works at; resized in-graph
+            when it differs from input_size
+        widths: Pointwise filters of each block
+        dropout: Dropout rate before the output layer
+
+    Returns:
+        Uncompiled Keras Sequential model with a sigmoid output
+    """
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import (
+        Input, Resizing, Conv2D, DepthwiseConv2D, BatchNormalization, ReLU,
+        GlobalAveragePooling2D, Dropout, Dense
+    )
+
+    layers = [Input(shape=(*input_size, 3))]
+    if tuple(input_size) != (input_resolution, input_resolution):
+        layers.append(Resizing(input_resolution, input_resolution, interpolation='bilinear'))
+    layers += [
+        Conv2D(widths[0], (3, 3), strides=2, padding='same', use_bias=False),
+        BatchNormalization(),
+        ReLU(),
+    ]
+    for filters in widths:
+        layers += [
+            DepthwiseConv2D((3, 3), strides=2, padding='same', use_bias=False),
+            BatchNormalization(),
+            ReLU(),
+            Conv2D(filters, (1, 1), use_bias=False),
+            BatchNormalization(),
+            ReLU(),
+        ]
+    layers += [
+        GlobalAveragePooling2D(),
+        Dropout(dropout),
+        Dense(1, activation='sigmoid'),
+    ]
+    return Sequential(layers, name='student')
+
+
+def load_datasets(data_dir: str, batch_size: int, seed: int = 0):
+    """
+    Load train/validation/test splits as batched tf.data datasets.
+
+    Images are resized to the served input size with nearest-neighbour
+    interpolation (as the notebook's generators and the server do) and
+    scaled to [0, 1]. Labels are float32 with shape (batch, 1).
+
+    Returns:
+        (train, validation, test) datasets
+    """
+    import tensorflow as tf
+
+    common = dict(image_size=INPUT_SIZE, batch_size=batch_size, label_mode='binary',
+                  class_names=CLASS_NAMES, interpolation='nearest', color_mode='rgb')
+    train_dir = os.path.join(data_dir, 'train')
+    val_dir = os.path.join(data_dir, 'val')
+    val_count = sum(
+        len(files) for _, _, files in os.walk(val_dir)
+    ) if os.path.isdir(val_dir) else 0
+
+    if val_count >= MIN_VALIDATION_IMAGES:
+        train = tf.keras.utils.image_dataset_from_directory(train_dir, shuffle=True, seed=seed, **common)
+        validation = tf.keras.utils.image_dataset_from_directory(val_dir, shuffle=False, **common)
+    else:
+        print(f"{val_dir} has {val_count} images; holding out 10% of train/ for validation",
+              file=sys.stderr)
+        train, validation = tf.keras.utils.image_dataset_from_directory(
+            train_dir, shuffle=True, seed=seed, validation_split=0.1, subset='both', **common
+        )
+    test = tf.keras.utils.image_dataset_from_directory(
+        os.path.join(data_dir, 'test'), shuffle=False, **common
+    )
+
+    def normalize(images, labels):
+        return images / 255.0, labels
+
+    return tuple(
+        ds.map(normalize, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+        for ds in (train, validation, test)
+    )
+
+
+def balanced_class_weights(dataset) -> np.ndarray:
+    """Per-class weights n_samples / (2 * n_class), as sklearn's 'balanced' in the notebook."""
+    counts = np.zeros(2)
+    for _, labels in dataset:
+        counts += np.bincount(labels.numpy().astype(int).ravel(), minlength=2)
+    return counts.sum() / (2 * np.maximum(counts, 1))
+
+
+def distillation_loss(labels, teacher_scores, student_scores, class_weights,
+                      temperature: float, alpha: float):
+    """
+    Weighted sum of the label loss and the soft-target loss.
+
+    Both models end in a sigmoid, so their logits are recovered from the
+    scores, divided by the temperature and compared with binary
+    cross-entropy. The soft term is scaled by temperature**2 to keep its
+    gradients comparable to the label term (Hinton et al., 2015).
+
+    Args:
+        labels: (batch, 1) float labels
+        teacher_scores: (batch, 1) teacher sigmoid outputs
+        student_scores: (batch, 1) student sigmoid outputs
+        class_weights: (2,) per-class weights of the label loss
+        temperature: Softening temperature (1 = raw scores)
+        alpha: Weight of the label loss; 1 - alpha goes to the soft targets
+    """
+    import tensorflow as tf
+
+    eps = 1e-7
+
+    def logits(scores):
+        scores = tf.clip_by_value(scores, eps, 1 - eps)
+        return tf.math.log(scores) - tf.math.log1p(-scores)
+
+    weights = tf.gather(class_weights, tf.cast(labels[:, 0], tf.int32))
+    student_logits = logits(student_scores)
+    hard = tf.nn.sigmoid_cross_entropy_with_logits(labels=labels, logits=student_logits)[:, 0]
+    soft_targets = tf.sigmoid(logits(teacher_scores) / temperature)
+    soft = tf.nn.sigmoid_cross_entropy_with_logits(
+        labels=soft_targets, logits=student_logits / temperature
+    )[:, 0]
+    return tf.reduce_mean(alpha * weights * hard + (1 - alpha) * temperature ** 2 * soft)
+
+
+def train_student(teacher, student, train, validation, epochs: int = 20,
+                  learning_rate: float = 1e-3, temperature: float = 4.0, alpha: float = 0.3,
+                  patience: int = 5, class_weights=None):
+    """
+    Distill the teacher into the student.
+
+    The student's weights are restored to the epoch with the lowest
+    validation loss (labels only) when training ends.
+
+    Returns:
+        List of per-epoch metric dicts
+    """
+    import tensorflow as tf
+
+    optimizer = tf.keras.optimizers.Adam(learning_rate)
+    class_weights = tf.constant(
+        class_weights if class_weights is not None else [1.0, 1.0], dtype=tf.float32
+    )
+    bce = tf.keras.losses.BinaryCrossentropy()
+
+    @tf.function
+    def train_step(images, labels):
+        teacher_scores = teacher(images, training=False)
+        with tf.GradientTape() as tape:
+            student_scores = student(images, training=True)
+            loss = distillation_loss(labels, teacher_scores, student_scores, class_weights,
+                                     temperature, alpha)
+        gradients = tape.gradient(loss, student.trainable_variables)
+        optimizer.apply_gradients(zip(gradients, student.trainable_variables))
+        return loss
+
+    @tf.function
+    def eval_step(images):
+        return student(images, training=False)
+
+    history = []
+    best_loss, best_weights, stale = np.inf, student.get_weights(), 0
+    for epoch in range(1, epochs + 1):
+        start = time.perf_counter()
+        losses = [float(train_step(images, labels)) for images, labels in train]
+
+        labels, scores = [], []
+        for images, batch_labels in validation:
+            scores.append(eval_step(images).numpy())
+            labels.append(batch_labels.numpy())
+        labels, scores = np.concatenate(labels), np.concatenate(scores)
+        val_loss = float(bce(labels, scores))
+        val_accuracy = float(np.mean((scores > 0.5) == (labels > 0.5)))
+
+        history.append({
+            'epoch': epoch,
+            'loss': round(float(np.mean(losses)), 5),
+            'val_loss': round(val_loss, 5),
+            'val_accuracy': round(val_accuracy, 4),
+            'seconds': round(time.perf_counter() - start, 1),
+        })
+        print(json.dumps(history[-1]), file=sys.stderr)
+
+        if val_loss < best_loss:
+            best_loss, best_weights, stale = val_loss, student.get_weights(), 0
+        else:
+            stale += 1
+            if stale >= patience:
+                break
+
+    student.set_weights(best_weights)
+    return history
+
+
+def predict_scores(model, dataset):
+    """Scores and labels of a whole dataset as flat arrays."""
+    labels, scores = [], []
+    for images, batch_labels in dataset:
+        scores.append(model(images, training=False).numpy())
+        labels.append(batch_labels.numpy())
+    return np.concatenate(labels).ravel(), np.concatenate(scores).ravel()
+
+
+def cpu_latency(model, batch_size: int, iterations: int = 50, warmup: int = 5) -> Dict[str, float]:
+    """
+    Latency of the served inference function on CPU.
+
+    Times `serving_config.build_inference_function` (uint8 input, in-graph
+    normalization), the function the server calls, on random pixels.
+    """
+    import tensorflow as tf
+
+    images = np.random.default_rng(0).integers(0, 256, (batch_size, *INPUT_SIZE, 3), dtype=np.uint8)
+    with tf.device('/CPU:0'):
+        infer = build_inference_function(model)
+        for _ in range(warmup):
+            infer(images).numpy()
+        times = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            infer(images).numpy()
+            times.append(time.perf_counter() - start)
+
+    times = np.asarray(times) * 1000
+    return {
+        f'batch{batch_size}_p50_ms': round(float(np.percentile(times, 50)), 2),
+        f'batch{batch_size}_p99_ms': round(float(np.percentile(times, 99)), 2),
+        f'batch{batch_size}_images_per_s': round(batch_size * 1000 / float(np.median(times)), 1),
+    }
+
+
+def build_report(teacher, student, test, threshold: float = 0.5,
+                 latency_batch_sizes: Sequence[int] = (1, 16)) -> Dict[str, Any]:
+    """
+    Compare teacher and student on the test split and on CPU latency.
+
+    Returns:
+        dict with 'teacher' and 'student' entries (parameters, latency,
+        accuracy, AUC) and 'agreement' (label agreement and score deltas of
+        the student against the teacher)
+    """
+    from sklearn.metrics import roc_auc_score
+
+    labels, teacher_scores = predict_scores(teacher, test)
+    _, student_scores = predict_scores(student, test)
+    report = {}
+    for name, model, scores in (('teacher', teacher, teacher_scores),
+                                ('student', student, student_scores)):
+        entry = {
+            'parameters': int(model.count_params()),
+            'accuracy': round(float(np.mean((scores > threshold) == (labels > 0.5))), 4),
+            'auc': round(float(roc_auc_score(labels, scores)), 4),
+        }
+        for batch_size in latency_batch_sizes:
+            entry.update(cpu_latency(model, batch_size))
+        report[name] = entry
+
+    deltas = np.abs(student_scores - teacher_scores)
+    report['agreement'] = {
+        'test_images': int(len(labels)),
+        'label_agreement': round(float(np.mean((student_scores > threshold) == (teacher_scores > threshold))), 4),
+        'mean_abs_score_delta': round(float(deltas.mean()), 5),
+        'max_abs_score_delta': round(float(deltas.max()), 5),
+        'parameter_ratio': round(report['student']['parameters'] / report['teacher']['parameters'], 4),
+        'batch1_speedup': round(report['teacher']['batch1_p50_ms'] / report['student']['batch1_p50_ms'], 2)
+        if 1 in latency_batch_sizes else None,
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data-dir', required=True, help='Directory with train/, val/ and test/')
+    parser.add_argument('--teacher', default=os.getenv('MODEL_PATH', DEFAULT_TEACHER_PATH))
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(DEFAULT_TEACHER_PATH),
+                                                         'student_model.keras'))
+    parser.add_argument('--report', default=None, help='Report JSON path (default: next to --output)')
+    parser.add_argument('--input-resolution', type=int, default=112)
+    parser.add_argument('--widths', type=int, nargs='+', default=[16, 32, 64, 128])
+    parser.add_argument('--dropout', type=float, default=0.2)
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--learning-rate', type=float, default=1e-3)
+    parser.add_argument('--temperature', type=float, default=4.0)
+    parser.add_argument('--alpha', type=float, default=0.3, help='Weight of the label loss')
+    parser.add_argument('--patience', type=int, default=5)
+    parser.add_argument('--threshold', type=float,
+                        default=float(os.getenv('PREDICTION_THRESHOLD', '0.5')))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    import tensorflow as tf
+    from tensorflow.keras.models import load_model
+
+    tf.keras.utils.set_random_seed(args.seed)
+    teacher = load_model(args.teacher)
+    student = build_student(INPUT_SIZE, args.input_resolution, args.widths, args.dropout)
+    train, validation, test = load_datasets(args.data_dir, args.batch_size, args.seed)
+
+    history = train_student(
+        teacher, student, train, validation,
+        epochs=args.epochs, learning_rate=args.learning_rate, temperature=args.temperature,
+        alpha=args.alpha, patience=args.patience, class_weights=balanced_class_weights(train),
+    )
+    student.save(args.output)
+
+    report = build_report(teacher, student, test, threshold=args.threshold)
+    report['config'] = {
+        'teacher': args.teacher,
+        'student': args.output,
+        **{k: getattr(args, k) for k in ('input_resolution', 'widths', 'dropout', 'epochs',
+                                          'batch_size', 'learning_rate', 'temperature', 'alpha')},
+    }
+    report['history'] = history
+
+    report_path = args.report or os.path.splitext(args.output)[0] + '_report.json'
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for name in ('teacher', 'student'):
+        print(f"{name:8} " + '  '.join(f"{k}={v}" for k, v in report[name].items()))
+    print('agreement ' + '  '.join(f"{k}={v}" for k, v in report['agreement'].items()))
+    print(f"Student saved to {args.output}, report to {report_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+"""
+Grad-CAM Explanations
+
+Computes Grad-CAM heatmaps over the last Conv2D layer of the served CNN. The
+gradient pass also yields the model's scores, so an explained request needs
+no separate inference call. Raw heatmaps are cached by image hash and the
+JPEG overlay is rendered lazily, only when the explanation is fetched.
+
+The model input of every accepted prediction is kept in a small SQLite
+store shared by all worker processes, so a heatmap asked for after a plain
+prediction is one Grad-CAM pass on any worker, with no re-upload, decode,
+validation or inference of the original request.
+"""
+
+import base64
+import io
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+def find_last_conv_layer(model):
+    """
+    Find the last Conv2D layer of a Keras model.
+
+    Raises:
+        ValueError: If the model has no Conv2D layer
+    """
+    import tensorflow as tf
+
+    for layer in reversed(model.layers):
+        if isinstance(layer, tf.keras.layers.Conv2D):
+            return layer
+    raise ValueError("Model has no Conv2D layer to explain")
+
+
+def build_gradcam_function(model, threshold: float = 0.5, layer=None):
+    """
+    Build a batched Grad-CAM function for a binary sigmoid classifier.
+
+    The heatmap explains the predicted class: gradients of the score for
+    images predicted as pneumonia, and of (1 - score) for normal ones.
+
+    Args:
+        model: Loaded Keras model
+        threshold: Score above which the prediction is pneumonia
+        layer: Conv layer to explain (defaults to the last Conv2D)
+
+    Returns:
+        tf.function mapping a uint8 batch to (scores [N], heatmaps [N, h, w])
+        with heatmaps scaled to [0, 1]
+    """
+    import tensorflow as tf
+
+    layer = layer or find_last_conv_layer(model)
+    logger.info(f"Grad-CAM target layer: {layer.name}")
+
+    if isinstance(model, tf.keras.Sequential):
+        def forward(x):
+            activation = None
+            for current in model.layers:
+                x = current(x, training=False)
+                if current is layer:
+                    activation = x
+            return activation, x
+    else:
+        grad_model = tf.keras.Model(model.inputs, [layer.output, model.outputs[0]])
+
+        def forward(x):
+            return grad_model(x, training=False)
+
+    @tf.function(reduce_retracing=True)
+    def gradcam(images):
+        x = tf.cast(images, tf.float32) / 255.0
+        with tf.GradientTape() as tape:
+            activation, outputs = forward(x)
+            tape.watch(activation)
+            scores = outputs[:, 0]
+            target = tf.where(scores > threshold, scores, 1.0 - scores)
+
+        grads = tape.gradient(target, activation)
+        weights = tf.reduce_mean(grads, axis=(1, 2), keepdims=True)
+        cams = tf.nn.relu(tf.reduce_sum(weights * activation, axis=-1))
+        peak = tf.reduce_max(cams, axis=(1, 2), keepdims=True)
+        cams = tf.math.divide_no_nan(cams, peak)
+        return scores, cams
+
+    return gradcam
+
+
+def jet_colormap(values: np.ndarray) -> np.ndarray:
+    """
+    Map values in [0, 1] to RGB using the jet colormap.
+
+    Args:
+        values: float array of any shape
+
+    Returns:
+        uint8 array with a trailing RGB axis
+    """
+    v = np.clip(values, 0.0, 1.0)[..., None]
+    channels = np.array([0.75, 0.5, 0.25], dtype=np.float32)  # centres of R, G, B ramps
+    rgb = np.clip(1.5 - np.abs(4.0 * (v - channels)), 0.0, 1.0)
+    return (rgb * 255).astype(np.uint8)
+
+
+def render_overlay(image: np.ndarray, heatmap: np.ndarray, alpha: float = 0.4,
+                   quality: int = 85) -> bytes:
+    """
+    Blend a heatmap over the model input image and encode it as JPEG.
+
+    Args:
+        image: uint8 array (height, width, 3) the model saw
+        heatmap: float array (h, w) in [0, 1]
+        alpha: Heatmap opacity
+        quality: JPEG quality
+
+    Returns:
+        JPEG-encoded overlay
+    """
+    height, width = image.shape[:2]
+    resized = Image.fromarray(heatmap.astype(np.float32), mode='F').resize(
+        (width, height), Image.BILINEAR
+    )
+    colored = jet_colormap(np.asarray(resized))
+    blended = (1 - alpha) * image.astype(np.float32) + alpha * colored
+    overlay = Image.fromarray(blended.astype(np.uint8), mode='RGB')
+
+    buffer = io.BytesIO()
+    overlay.save(buffer, format='JPEG', quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+@dataclass
+class Explanation:
+    """Cached Grad-CAM result for one image."""
+
+    image: np.ndarray
+    heatmap: np.ndarray
+    result: Dict[str, Any]
+    overlay: Optional[bytes] = None
+
+
+class ExplanationCache:
+    """
+    Thread-safe LRU cache of explanations keyed by image hash.
+
+    The cache lives in the memory of one server process and saves repeat
+    fetches the Grad-CAM pass and overlay rendering. Another worker serving
+    the same explanation_id recomputes it from the ExplanationInputStore.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Explanation]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, key: str, explanation: Explanation) -> None:
+        with self._lock:
+            self._entries[key] = explanation
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Explanation]:
+        with self._lock:
+            explanation = self._entries.get(key)
+            if explanation is not None:
+                self._entries.move_to_end(key)
+            return explanation
+
+    def overlay_data_url(self, key: str) -> Optional[str]:
+        """
+        Return the overlay for an explanation as a JPEG data URL.
+
+        The overlay is rendered on first access and kept with the entry.
+        """
+        explanation = self.get(key)
+        if explanation is None:
+            return None
+        if explanation.overlay is None:
+            explanation.overlay = render_overlay(explanation.image, explanation.heatmap)
+        encoded = base64.b64encode(explanation.overlay).decode('ascii')
+        return f"data:image/jpeg;base64,{encoded}"
+
+
+INPUT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS inputs (
+    key TEXT PRIMARY KEY,
+    shape TEXT NOT NULL,
+    pixels BLOB NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS inputs_created ON inputs (created);
+"""
+
+
+def default_explanation_store_path() -> str:
+    """Default database location, next to the result cache under backend/data."""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'explanations.sqlite3')
+
+
+class ExplanationInputStore:
+    """
+    Disk-backed store of uint8 model inputs keyed by explanation_id.
+
+    Shared by all server processes through SQLite in WAL mode, like the
+    result cache. Writes that cannot get the database lock within a short
+    timeout are skipped and lookups that hit an error count as misses; the
+    client then asks for an explained prediction instead. The oldest inputs
+    are evicted once the entry count exceeds its bound.
+    """
+
+    EVICT_EVERY = 64  # puts between entry-count checks in this process
+
+    def __init__(self, path: str, max_entries: int = 2000, lock_timeout: float = 0.05):
+        """
+        Args:
+            path: Database file, created if missing
+            max_entries: Inputs kept before the oldest are evicted
+            lock_timeout: Seconds a write waits for the database lock before
+                it is skipped
+        """
+        self.path = path
+        self.max_entries = max_entries
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # Stored inputs can be recomputed by analysing the image again
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(INPUT_SCHEMA)
+        self._conn.execute(f'PRAGMA busy_timeout={int(lock_timeout * 1000)}')
+        self._puts = 0
+
+    def put(self, key: str, model_input: np.ndarray) -> None:
+        """Store the model input of an accepted prediction; skipped if the database stays locked."""
+        shape = ','.join(str(size) for size in model_input.shape)
+        pixels = np.ascontiguousarray(model_input, dtype=np.uint8).tobytes()
+        with self._lock:
+            try:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO inputs (key, shape, pixels, created) VALUES (?, ?, ?, ?)',
+                    (key, shape, pixels, time.time()),
+                )
+                self._puts += 1
+                if self._puts % self.EVICT_EVERY == 0:
+                    self._evict()
+            except sqlite3.Error as e:
+                logger.warning("Explanation input store write skipped: %s", e)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """The stored model input, or None if it was never stored or has been evicted."""
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    'SELECT shape, pixels FROM inputs WHERE key = ?', (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Explanation input lookup failed: %s", e)
+            return None
+        if row is None:
+            return None
+        shape, pixels = row
+        return np.frombuffer(pixels, dtype=np.uint8).reshape(
+            [int(size) for size in shape.split(',')]
+        ).copy()
+
+    def _evict(self) -> None:
+        """Trim to 90% of max_entries, oldest first. Caller holds _lock."""
+        (count,) = self._conn.execute('SELECT count(*) FROM inputs').fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            excess += self.max_entries // 10
+            self._conn.execute(
+                'DELETE FROM inputs WHERE key IN (SELECT key FROM inputs ORDER BY created LIMIT ?)',
+                (excess,),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
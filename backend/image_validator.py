@@ -45,7 +45,7 @@ class ChestXRayValidator:
 
             avg_corr = (rg_corr + rb_corr + gb_corr) / 3
 
-            logger.info(f"Grayscale correlation: {avg_corr:.4f}")
+            logger.info("Grayscale correlation: %.4f", avg_corr)
 
             return avg_corr >= threshold
 
@@ -88,7 +88,7 @@ class ChestXRayValidator:
             # Check for reasonable standard deviation
             std_dev = np.std(img_array)
 
-            logger.info(f"Histogram - Spread: {spread_ratio:.2f}, Peak: {peak_intensity}, StdDev: {std_dev:.2f}")
+            logger.info("Histogram - Spread: %.2f, Peak: %d, StdDev: %.2f", spread_ratio, peak_intensity, std_dev)
 
             # Medical X-rays typically have good spread and mid-range peak
             has_good_spread = spread_ratio > 0.3
@@ -129,7 +129,7 @@ class ChestXRayValidator:
 
             total_edge_density = (edge_density_h + edge_density_v) / 2
 
-            logger.info(f"Edge density: {total_edge_density:.4f}")
+            logger.info("Edge density: %.4f", total_edge_density)
 
             # Documents/IDs typically have high edge density due to text
             # X-rays have smoother transitions
@@ -152,7 +152,27 @@ class ChestXRayValidator:
         """
         try:
             image = Image.open(image_path)
+        except Exception as e:
+            logger.error(f"Error opening image: {e}")
+            return ChestXRayValidator._failed_result()
+
+        return ChestXRayValidator.validate_image(image)
+
+    @staticmethod
+    def validate_image(image: Image.Image) -> dict:
+        """
+        Validate an already decoded image.
+
+        Only reads from the image, so it can run while the same image is
+        being preprocessed for inference on another thread.
+
+        Args:
+            image: PIL Image object
 
+        Returns:
+            dict with validation results and confidence score
+        """
+        try:
             # Run all checks
             is_grayscale = ChestXRayValidator.is_grayscale_like(image)
             has_medical_hist = ChestXRayValidator.has_medical_histogram(image)
@@ -185,17 +205,22 @@ class ChestXRayValidator:
                 )
             }
 
-            logger.info(f"Validation result: {result}")
+            logger.info("Validation result: %s", result)
             return result
 
         except Exception as e:
             logger.error(f"Error validating image: {e}")
-            return {
-                'is_likely_xray': False,
-                'confidence': 0,
-                'checks': {},
-                'message': 'Failed to validate image format'
-            }
+            return ChestXRayValidator._failed_result()
+
+    @staticmethod
+    def _failed_result() -> dict:
+        """Validation result for images that could not be analysed."""
+        return {
+            'is_likely_xray': False,
+            'confidence': 0,
+            'checks': {},
+            'message': 'Failed to validate image format'
+        }
 
     @staticmethod
     def _get_validation_message(is_xray: bool, confidence: int,
@@ -0,0 +1,144 @@
+"""
+Inference Input Pipeline
+
+Keeps decoded images as uint8 and writes them straight into reusable,
+preallocated batch buffers. Normalization to [0, 1] happens inside the
+TensorFlow serving function, so the request path no longer allocates the
+float32 copies that `img_to_array`, `/ 255.0` and `np.expand_dims` used to.
+"""
+
+import io
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+class BatchBufferPool:
+    """Pool of preallocated uint8 batch buffers shared across requests."""
+
+    def __init__(self, max_batch_size: int, image_shape: Tuple[int, int, int],
+                 pool_size: int = 4):
+        """
+        Args:
+            max_batch_size: Largest batch a single buffer can hold
+            image_shape: Per-image shape (height, width, channels)
+            pool_size: Number of buffers to preallocate
+        """
+        self.max_batch_size = max_batch_size
+        self.image_shape = tuple(image_shape)
+        self._buffers: "queue.LifoQueue[np.ndarray]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._allocated = 0
+        for _ in range(pool_size):
+            self._buffers.put(self._allocate())
+
+    def _allocate(self) -> np.ndarray:
+        with self._lock:
+            self._allocated += 1
+        return np.empty((self.max_batch_size,) + self.image_shape, dtype=np.uint8)
+
+    @property
+    def allocated(self) -> int:
+        """Total number of buffers allocated over the pool's lifetime."""
+        return self._allocated
+
+    @contextmanager
+    def acquire(self) -> Iterator[np.ndarray]:
+        """
+        Borrow a buffer for the duration of a `with` block.
+
+        When every buffer is in use a new one is allocated and kept, so the
+        pool grows to the peak concurrency instead of blocking requests.
+
+        Yields:
+            uint8 array of shape (max_batch_size, height, width, channels)
+        """
+        try:
+            buffer = self._buffers.get_nowait()
+        except queue.Empty:
+            buffer = self._allocate()
+            logger.debug(f"Batch buffer pool grown to {self._allocated} buffers")
+        try:
+            yield buffer
+        finally:
+            self._buffers.put(buffer)
+
+
+def decode_image(source: Union[str, bytes], max_dimension: int = 0) -> Image.Image:
+    """
+    Decode an image once so it can be shared by several stages.
+
+    The pixel data is loaded eagerly; PIL's lazy loading is not safe when
+    the validator and preprocessing read the same image from two threads.
+    With `max_dimension` set, large images are reduced to that size: JPEGs
+    are decoded directly at a reduced DCT scale, which is far cheaper than
+    decoding at full resolution, so full-size and client-reduced uploads
+    are analysed at the same resolution.
+
+    Args:
+        source: Path to the image file, or the encoded image bytes
+        max_dimension: Longest side to keep, in pixels (0 = full resolution)
+
+    Returns:
+        Fully loaded PIL Image
+
+    Raises:
+        ValueError: If the file cannot be decoded as an image
+    """
+    try:
+        img = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+        if max_dimension and max(img.size) > max_dimension:
+            img.draft(img.mode, (max_dimension, max_dimension))
+            img.load()
+            if max(img.size) > max_dimension:
+                img.thumbnail((max_dimension, max_dimension), reducing_gap=3.0)
+            return img
+        img.load()  # also releases the file handle for single-frame formats
+        return img
+    except Exception as e:
+        raise ValueError(f"Failed to decode image: {str(e)}")
+
+
+def write_image_into(image: Image.Image, out: np.ndarray) -> np.ndarray:
+    """
+    Resize a decoded image directly into a slot of a batch buffer.
+
+    Mirrors Keras `load_img(path, target_size=...)` (RGB conversion followed
+    by nearest-neighbour resize) so predictions match the previous pipeline.
+
+    Args:
+        image: Decoded PIL Image
+        out: uint8 array of shape (height, width, channels) to fill
+
+    Returns:
+        The filled `out` array
+    """
+    height, width = out.shape[:2]
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    if image.size != (width, height):
+        image = image.resize((width, height), Image.NEAREST)
+    out[...] = image
+    return out
+
+
+def load_image_into(image_path: str, out: np.ndarray) -> np.ndarray:
+    """
+    Decode and resize an image file directly into a slot of a batch buffer.
+
+    Args:
+        image_path: Path to the image file
+        out: uint8 array of shape (height, width, channels) to fill
+
+    Returns:
+        The filled `out` array
+    """
+    with Image.open(image_path) as img:
+        return write_image_into(img, out)
@@ -0,0 +1,548 @@
+"""
+Asynchronous Prediction Jobs
+
+Persistent job queue for study uploads too large to finish within one
+request behind a proxy. Submitted images are stored in a local SQLite
+database and processed by background workers running the same validation
+and inference pipeline as /api/predict. Clients poll the job, or receive
+the finished job at a callback URL.
+
+Items are claimed with a lease: an item whose worker died (process restart,
+crash) becomes claimable again once its lease expires, so queued and
+in-flight work survives restarts. Several server processes may share one
+database file; claims are atomic across processes.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import re
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, List, Optional, Set, Tuple, Union
+from urllib.parse import urlparse
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+UPLOAD_CHUNK_BYTES = 1 << 20  # images given as files are copied into the database this much at a time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    client_id TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    total INTEGER NOT NULL,
+    finished INTEGER NOT NULL DEFAULT 0,
+    callback_url TEXT,
+    callback_status TEXT,
+    callback_lease REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    filename TEXT,
+    status TEXT NOT NULL,
+    content BLOB,
+    not_before REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS job_items_claimable ON job_items (status, not_before);
+"""
+
+# Item status: queued -> running -> completed | failed. A 'running' item whose
+# lease (not_before) has expired is claimable again. Callback deliveries are
+# leased the same way (callback_lease), so one process posts each callback.
+
+
+class RetryLater(Exception):
+    """Raised by a job processor to put an item back in the queue for a while."""
+
+    def __init__(self, delay: float):
+        super().__init__(f"retry in {delay}s")
+        self.delay = delay
+
+
+@dataclass
+class JobItem:
+    """One claimed image of a job."""
+
+    job_id: str
+    index: int
+    filename: Optional[str]
+    content: bytes
+    client_id: str
+
+
+ItemOutcome = Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]
+ProcessFn = Callable[[JobItem], Awaitable[ItemOutcome]]
+
+
+def validate_callback_url(url: str, allowed_hosts: List[str], allow_private: bool = False) -> str:
+    """
+    Check a callback URL before it is stored with a job, and again before delivery.
+
+    The host name is resolved and every address it resolves to must be
+    public, so a callback can never be pointed at the server's own network
+    (loopback, private ranges, link-local cloud metadata endpoints).
+
+    Args:
+        url: URL supplied by the client
+        allowed_hosts: Host names callbacks may be sent to; '*' allows any
+            public host, and an empty list disables callbacks
+        allow_private: Also accept hosts resolving to non-public addresses
+
+    Returns:
+        The URL, unchanged
+
+    Raises:
+        ValueError: If the URL is malformed, or its host is not allowed or
+            does not resolve to public addresses only
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        raise ValueError("Callback URL must be an absolute http(s) URL")
+    if not allowed_hosts:
+        raise ValueError("Callbacks are disabled on this server")
+    if '*' not in allowed_hosts and parsed.hostname.lower() not in allowed_hosts:
+        raise ValueError(f"Callbacks to {parsed.hostname} are not allowed")
+
+    try:
+        port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        addresses = socket.getaddrinfo(parsed.hostname, port, type=socket.SOCK_STREAM)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Cannot resolve callback host {parsed.hostname}: {e}")
+    if not allow_private:
+        for *_, sockaddr in addresses:
+            address = ipaddress.ip_address(sockaddr[0].split('%')[0])
+            if address.version == 6 and address.ipv4_mapped:
+                address = address.ipv4_mapped
+            if not address.is_global or address.is_multicast:
+                raise ValueError(f"Callbacks to {parsed.hostname} ({address}) are not allowed: not a public address")
+    return url
+
+
+class JobStore:
+    """SQLite-backed job and item storage, safe to share between threads and processes."""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Database file, created if missing
+        """
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA foreign_keys=ON')
+        self._conn.execute('PRAGMA busy_timeout=5000')
+        self._conn.executescript(SCHEMA)
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(jobs)')}
+        if 'callback_lease' not in columns:
+            try:
+                # Databases created before callback deliveries were leased
+                self._conn.execute('ALTER TABLE jobs ADD COLUMN callback_lease REAL NOT NULL DEFAULT 0')
+            except sqlite3.OperationalError:
+                pass  # added by another process starting at the same time
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction; BEGIN IMMEDIATE takes the database write lock up front."""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def create(self, client_id: str, items: List[Tuple[Optional[str], Union[bytes, BinaryIO]]],
+               callback_url: Optional[str] = None) -> str:
+        """
+        Store a new job and queue its images.
+
+        Images given as binary files are copied into the database in chunks,
+        one image per transaction, so a large study is never held in memory
+        and never holds the database write lock for long. Items become
+        claimable as they are stored; if storing fails, the job is deleted.
+
+        Args:
+            client_id: Submitting client, used for fair scheduling of the work
+            items: (filename, encoded image bytes or a binary file) per image
+            callback_url: URL the finished job is POSTed to, if any
+
+        Returns:
+            The new job ID
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                'INSERT INTO jobs (id, client_id, created, updated, total, callback_url, callback_status) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, client_id, now, now, len(items), callback_url,
+                 'pending' if callback_url else None),
+            )
+        try:
+            for index, (filename, content) in enumerate(items):
+                with self._transaction() as db:
+                    self._insert_item(db, job_id, index, filename, content)
+        except BaseException:
+            with self._transaction() as db:
+                db.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+            raise
+        return job_id
+
+    @staticmethod
+    def _insert_item(db: sqlite3.Connection, job_id: str, index: int, filename: Optional[str],
+                     content: Union[bytes, BinaryIO]) -> None:
+        """Queue one image, streaming it into the row when it is a file."""
+        insert = "INSERT INTO job_items (job_id, idx, filename, status, content) VALUES (?, ?, ?, 'queued', {})"
+        if isinstance(content, bytes):
+            db.execute(insert.format('?'), (job_id, index, filename, content))
+            return
+        size = content.seek(0, os.SEEK_END)
+        content.seek(0)
+        row = db.execute(insert.format('zeroblob(?)'), (job_id, index, filename, size)).lastrowid
+        with db.blobopen('job_items', 'content', row) as blob:
+            for chunk in iter(lambda: content.read(UPLOAD_CHUNK_BYTES), b''):
+                blob.write(chunk)
+
+    def claim(self, lease_seconds: float, max_attempts: int) -> Optional[JobItem]:
+        """
+        Take the oldest claimable item, leasing it to the caller.
+
+        Items whose lease ran out max_attempts times are failed instead of
+        being handed out again, so an image that crashes the worker cannot
+        loop forever.
+
+        Returns:
+            The claimed item, or None if nothing is ready
+        """
+        now = time.time()
+        with self._transaction() as db:
+            while True:
+                row = db.execute(
+                    "SELECT i.job_id, i.idx, i.filename, i.content, j.client_id, i.attempts "
+                    "FROM job_items i JOIN jobs j ON j.id = i.job_id "
+                    "WHERE i.status IN ('queued', 'running') AND i.not_before <= ? "
+                    "ORDER BY i.rowid LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    return None
+                job_id, index, filename, content, client_id, attempts = row
+                if attempts < max_attempts:
+                    break
+                self._finish(db, job_id, index, None,
+                             {'status': 500, 'detail': {'error': 'Processing abandoned after repeated failures'}},
+                             now)
+
+            db.execute(
+                "UPDATE job_items SET status = 'running', not_before = ?, attempts = attempts + 1 "
+                "WHERE job_id = ? AND idx = ?",
+                (now + lease_seconds, job_id, index),
+            )
+            db.execute('UPDATE jobs SET updated = ? WHERE id = ?', (now, job_id))
+        return JobItem(job_id, index, filename, content, client_id)
+
+    def release(self, item: JobItem, delay: float) -> None:
+        """Put a claimed item back in the queue without counting the attempt."""
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE job_items SET status = 'queued', not_before = ?, attempts = attempts - 1 "
+                "WHERE job_id = ? AND idx = ? AND status = 'running'",
+                (time.time() + delay, item.job_id, item.index),
+            )
+
+    def finish(self, item: JobItem, result: Optional[Dict[str, Any]],
+               error: Optional[Dict[str, Any]]) -> bool:
+        """
+        Record the outcome of an item and drop its image bytes.
+
+        Returns:
+            True if this was the last unfinished item of its job
+        """
+        with self._transaction() as db:
+            return self._finish(db, item.job_id, item.index, result, error, time.time())
+
+    @staticmethod
+    def _finish(db: sqlite3.Connection, job_id: str, index: int, result, error, now: float) -> bool:
+        updated = db.execute(
+            "UPDATE job_items SET status = ?, content = NULL, result = ?, error = ? "
+            "WHERE job_id = ? AND idx = ? AND status IN ('queued', 'running')",
+            ('failed' if error is not None else 'completed',
+             json.dumps(result) if result is not None else None,
+             json.dumps(error) if error is not None else None,
+             job_id, index),
+        ).rowcount
+        if not updated:
+            return False  # finished already by a worker whose lease had expired
+        db.execute('UPDATE jobs SET finished = finished + 1, updated = ? WHERE id = ?', (now, job_id))
+        finished, total = db.execute('SELECT finished, total FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return finished == total
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job status with per-image results, or None if the job does not exist."""
+        with self._lock:
+            job = self._conn.execute(
+                'SELECT created, updated, total, finished, callback_status FROM jobs WHERE id = ?', (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+            items = self._conn.execute(
+                'SELECT idx, filename, status, result, error FROM job_items WHERE job_id = ? ORDER BY idx',
+                (job_id,),
+            ).fetchall()
+
+        created, updated, total, finished, callback_status = job
+        counts = {'completed': 0, 'failed': 0, 'running': 0}
+        for item in items:
+            counts[item[2]] = counts.get(item[2], 0) + 1
+
+        if finished == total:
+            status = 'completed'
+        elif finished or counts['running']:
+            status = 'running'
+        else:
+            status = 'queued'
+
+        return {
+            'job_id': job_id,
+            'status': status,
+            'total': total,
+            'completed': counts['completed'],
+            'failed': counts['failed'],
+            'created': created,
+            'updated': updated,
+            'callback_status': callback_status,
+            'results': [
+                {
+                    'index': index,
+                    'filename': filename,
+                    'status': item_status,
+                    'result': json.loads(result) if result else None,
+                    'error': json.loads(error) if error else None,
+                }
+                for index, filename, item_status, result, error in items
+            ],
+        }
+
+    def claim_callback(self, job_id: str, lease_seconds: float) -> Optional[str]:
+        """
+        Lease the callback delivery of a finished job to the caller.
+
+        Every process runs a janitor that retries undelivered callbacks, so a
+        delivery is only attempted by the process holding its lease. A lease
+        left by a process that died mid-delivery expires and the callback is
+        delivered again.
+
+        Returns:
+            The callback URL, or None if the job has no pending callback or
+            another worker holds its lease
+        """
+        now = time.time()
+        with self._transaction() as db:
+            claimed = db.execute(
+                "UPDATE jobs SET callback_lease = ? WHERE id = ? AND callback_status = 'pending' "
+                "AND finished = total AND callback_lease <= ?",
+                (now + lease_seconds, job_id, now),
+            ).rowcount
+            if not claimed:
+                return None
+            return db.execute('SELECT callback_url FROM jobs WHERE id = ?', (job_id,)).fetchone()[0]
+
+    def set_callback_status(self, job_id: str, status: str) -> None:
+        with self._transaction() as db:
+            db.execute('UPDATE jobs SET callback_status = ? WHERE id = ?', (status, job_id))
+
+    def pending_callbacks(self) -> List[str]:
+        """Finished jobs whose callback is undelivered and not being delivered (e.g. after a restart)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE callback_status = 'pending' AND finished = total "
+                "AND callback_lease <= ?",
+                (time.time(),),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def purge(self, older_than: float) -> int:
+        """Delete finished jobs last updated before `older_than` (epoch seconds)."""
+        with self._transaction() as db:
+            return db.execute(
+                'DELETE FROM jobs WHERE finished = total AND updated < ?', (older_than,)
+            ).rowcount
+
+    def stats(self) -> Dict[str, int]:
+        """Number of items in each status."""
+        with self._lock:
+            rows = self._conn.execute('SELECT status, COUNT(*) FROM job_items GROUP BY status').fetchall()
+        return dict(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class JobRunner:
+    """Pool of asyncio workers draining a JobStore through a processing coroutine."""
+
+    CALLBACK_ATTEMPTS = 3
+    CALLBACK_TIMEOUT = 10
+    CALLBACK_LEASE = 120  # seconds; covers all attempts with their timeouts and backoff
+    JANITOR_INTERVAL = 300
+
+    def __init__(self, store: JobStore, process: ProcessFn, workers: int = 2,
+                 poll_interval: float = 1.0, lease_seconds: float = 300.0, max_attempts: int = 3,
+                 retention_seconds: float = 72 * 3600, callback_secret: Optional[str] = None,
+                 callback_hosts: Optional[List[str]] = None, callback_allow_private: bool = False):
+        """
+        Args:
+            store: Job storage
+            process: Coroutine turning a claimed item into (result, error);
+                may raise RetryLater to requeue the item
+            workers: Items processed concurrently by this process
+            poll_interval: Seconds between queue checks when idle (picks up
+                work submitted to other processes sharing the database)
+            lease_seconds: Time an item may run before another worker may take it over
+            max_attempts: Leases an item may use up before it is failed
+            retention_seconds: Age after which finished jobs are deleted
+            callback_secret: When set, callbacks carry an HMAC-SHA256 signature
+                of the body in the X-Signature header
+            callback_hosts: Hosts callbacks may go to, rechecked (with DNS
+                resolution) before every delivery attempt; see `validate_callback_url`
+            callback_allow_private: Allow callbacks to non-public addresses
+        """
+        self.store = store
+        self.process = process
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retention_seconds = retention_seconds
+        self.callback_secret = callback_secret
+        self.callback_hosts = callback_hosts or []
+        self.callback_allow_private = callback_allow_private
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        """Start the workers and the janitor on the running event loop."""
+        self._wakeup = asyncio.Event()
+        for _ in range(self.workers):
+            self._spawn(self._worker())
+        self._spawn(self._janitor())
+        logger.info("Job runner started with %d workers (%s)", self.workers, self.store.path)
+
+    async def stop(self) -> None:
+        """Cancel workers; items in flight are picked up again after their lease expires."""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def notify(self) -> None:
+        """Wake idle workers after a submission."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _idle(self) -> None:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                item = await asyncio.to_thread(self.store.claim, self.lease_seconds, self.max_attempts)
+            except sqlite3.Error as e:
+                logger.error("Job queue unavailable: %s", e)
+                await asyncio.sleep(self.poll_interval)
+                continue
+            if item is None:
+                await self._idle()
+                continue
+
+            try:
+                result, error = await self.process(item)
+            except RetryLater as e:
+                await asyncio.to_thread(self.store.release, item, e.delay)
+                continue
+            except Exception as e:
+                logger.error("Job %s item %d failed: %s", item.job_id, item.index, e, exc_info=True)
+                result, error = None, {'status': 500, 'detail': {'error': 'Internal server error'}}
+
+            if await asyncio.to_thread(self.store.finish, item, result, error):
+                logger.info("Job %s completed", item.job_id)
+                self._spawn(self._deliver(item.job_id))
+
+    async def _janitor(self) -> None:
+        while True:
+            for job_id in await asyncio.to_thread(self.store.pending_callbacks):
+                self._spawn(self._deliver(job_id))
+            purged = await asyncio.to_thread(self.store.purge, time.time() - self.retention_seconds)
+            if purged:
+                logger.info("Purged %d expired jobs", purged)
+            await asyncio.sleep(self.JANITOR_INTERVAL)
+
+    async def _deliver(self, job_id: str) -> None:
+        """POST the finished job to its callback URL, retrying with backoff."""
+        url = await asyncio.to_thread(self.store.claim_callback, job_id, self.CALLBACK_LEASE)
+        if not url:
+            return  # no callback, already delivered, or being delivered by another worker
+        body = json.dumps(await asyncio.to_thread(self.store.get, job_id)).encode()
+        headers = {'Content-Type': 'application/json', 'X-Job-ID': job_id}
+        if self.callback_secret:
+            signature = hmac.new(self.callback_secret.encode(), body, hashlib.sha256).hexdigest()
+            headers['X-Signature'] = f"sha256={signature}"
+
+        for attempt in range(self.CALLBACK_ATTEMPTS):
+            try:
+                # Resolve again right before sending: the host's DNS may have changed since submission
+                await asyncio.to_thread(validate_callback_url, url, self.callback_hosts,
+                                        self.callback_allow_private)
+                # Redirects are not followed; they could lead to a host that was never checked
+                response = await asyncio.to_thread(
+                    requests.post, url, data=body, headers=headers, timeout=self.CALLBACK_TIMEOUT,
+                    allow_redirects=False,
+                )
+                if response.status_code < 300:
+                    await asyncio.to_thread(self.store.set_callback_status, job_id, 'delivered')
+                    return
+                logger.warning("Callback for job %s returned %d", job_id, response.status_code)
+            except requests.RequestException as e:
+                logger.warning("Callback for job %s failed: %s", job_id, e)
+            except ValueError as e:
+                logger.warning("Callback for job %s refused: %s", job_id, e)
+            await asyncio.sleep(2 ** attempt)
+
+        await asyncio.to_thread(self.store.set_callback_status, job_id, 'failed')
+
+
+def default_job_db_path() -> str:
+    """Default database location next to the backend code."""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'jobs.sqlite3')
@@ -0,0 +1,449 @@
+"""
+Shared Model Server
+
+Runs the model in one process for all uvicorn workers. Without it, every
+worker imports TensorFlow and loads its own copy of the model, which
+multiplies memory use, and each worker can only batch its own requests.
+
+Each HTTP worker (a ModelServerClient) creates a shared-memory ring of
+uint8 image slots and connects to the server over a Unix domain socket.
+To score images it copies them into free slots and sends only the slot
+indices; the server gathers the slots of requests from all workers into
+one batch, runs the model, and sends the scores back over the socket.
+Pixels never pass through the socket.
+
+Usage (from the backend directory):
+    python model_server.py --socket /tmp/pneumoscan-model.sock
+    MODEL_SERVER_SOCKET=/tmp/pneumoscan-model.sock uvicorn app:app --workers 4
+
+The server reads MODEL_PATH, MODEL_URL, MAX_BATCH_SIZE and the TF_*
+thread settings from the environment, like the app.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+REQUEST_HEADER = struct.Struct('<IH')  # request id, image count; then one uint16 slot index per image
+RESPONSE_HEADER = struct.Struct('<IBH')  # request id, status, score count (or error message length)
+STATUS_OK, STATUS_ERROR = 0, 1
+
+_attach_lock = threading.Lock()
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    """Read exactly size bytes; raises ConnectionError if the peer closes first."""
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        data += chunk
+    return bytes(data)
+
+
+def _recv_line(sock: socket.socket, limit: int = 4096) -> bytes:
+    """Read one newline-terminated handshake message."""
+    data = bytearray()
+    while not data.endswith(b'\n'):
+        data += _recv_exactly(sock, 1)
+        if len(data) > limit:
+            raise ConnectionError("Handshake too long")
+    return bytes(data)
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """
+    Attach to a segment created by another process without taking ownership.
+
+    Before Python 3.13, attaching registers the segment with this process's
+    resource tracker, which would unlink it when the server exits; the
+    registration is suppressed instead.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    with _attach_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args, **kwargs: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+@dataclass
+class _Connection:
+    """One connected HTTP worker and its ring of image slots."""
+
+    sock: socket.socket
+    ring: np.ndarray
+    shm: shared_memory.SharedMemory
+    send_lock: threading.Lock = field(default_factory=threading.Lock)
+    closed: bool = False
+
+    def reply(self, request_id: int, status: int, payload: bytes, count: int) -> None:
+        if self.closed:
+            return
+        try:
+            with self.send_lock:
+                self.sock.sendall(RESPONSE_HEADER.pack(request_id, status, count) + payload)
+        except OSError:
+            self.closed = True
+
+
+class ModelServer:
+    """Batches inference requests from all connected workers onto one model."""
+
+    def __init__(self, infer: Callable[[np.ndarray], np.ndarray], image_shape: Tuple[int, int, int],
+                 address: str, max_batch_size: int = 16, batch_timeout: float = 0.002,
+                 info: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            infer: Maps a uint8 image batch to model outputs of shape (N, 1)
+            image_shape: (height, width, channels) of one model input
+            address: Path of the Unix domain socket to listen on
+            max_batch_size: Most images run in one forward pass
+            batch_timeout: Seconds the first request of a batch waits for more
+            info: Sent to clients on connect (e.g. the model version)
+        """
+        self.infer = infer
+        self.info = info or {}
+        self.image_shape = tuple(image_shape)
+        self.address = address
+        self.max_batch_size = max_batch_size
+        self.batch_timeout = batch_timeout
+        self._requests: "queue.Queue" = queue.Queue()
+        self._batch = np.empty((max_batch_size, *self.image_shape), dtype=np.uint8)
+        self._stop = threading.Event()
+        self._listener: Optional[socket.socket] = None
+        self.batches = 0
+        self.images = 0
+
+    def serve_forever(self) -> None:
+        """Accept worker connections and run the batching loop until stop() is called."""
+        if os.path.exists(self.address):
+            os.unlink(self.address)  # left behind by a previous run
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.address)
+        self._listener.listen()
+        threading.Thread(target=self._batch_loop, name='model-server-batch', daemon=True).start()
+        logger.info("Model server listening on %s", self.address)
+
+        while not self._stop.is_set():
+            try:
+                sock, _ = self._listener.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve_connection, args=(sock,),
+                             name='model-server-conn', daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._listener is not None:
+            self._listener.close()
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def _serve_connection(self, sock: socket.socket) -> None:
+        try:
+            hello = json.loads(_recv_line(sock))
+            shm = _attach_shared_memory(hello['shm'])
+            ring = np.ndarray((hello['slots'], *self.image_shape), dtype=np.uint8, buffer=shm.buf)
+        except Exception as e:
+            logger.warning("Rejected model server client: %s", e)
+            sock.close()
+            return
+
+        conn = _Connection(sock, ring, shm)
+        sock.sendall(json.dumps({
+            **self.info,
+            'max_batch_size': self.max_batch_size,
+            'image_shape': self.image_shape,
+            'pid': os.getpid(),
+        }).encode() + b'\n')
+        logger.info("Model server client connected (%d slots)", len(ring))
+
+        try:
+            while True:
+                request_id, count = REQUEST_HEADER.unpack(_recv_exactly(sock, REQUEST_HEADER.size))
+                slots = np.frombuffer(_recv_exactly(sock, 2 * count), dtype='<u2').astype(np.intp)
+                if not 0 < count <= self.max_batch_size or slots.max() >= len(ring):
+                    message = b'invalid request'
+                    conn.reply(request_id, STATUS_ERROR, message, len(message))
+                    continue
+                self._requests.put((conn, request_id, slots))
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            conn.closed = True
+            sock.close()
+            logger.info("Model server client disconnected")
+            # The segment is unmapped once the batch loop drops its last view of the ring
+            del ring, conn
+
+    def _next_batch(self, pending: deque) -> List[tuple]:
+        """Collect requests until the batch is full or the first one has waited batch_timeout."""
+        first = pending.popleft() if pending else self._requests.get(timeout=0.5)
+        batch, size = [first], len(first[2])
+        deadline = time.monotonic() + self.batch_timeout
+        while size < self.max_batch_size:
+            try:
+                request = self._requests.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if size + len(request[2]) > self.max_batch_size:
+                pending.append(request)
+                break
+            batch.append(request)
+            size += len(request[2])
+        return batch
+
+    def _batch_loop(self) -> None:
+        pending: deque = deque()
+        while not self._stop.is_set():
+            try:
+                batch = self._next_batch(pending)
+            except queue.Empty:
+                continue
+
+            batch = [request for request in batch if not request[0].closed]
+            size = 0
+            for conn, _, slots in batch:
+                np.take(conn.ring, slots, axis=0, out=self._batch[size:size + len(slots)])
+                size += len(slots)
+            if not size:
+                continue
+
+            try:
+                scores = np.asarray(self.infer(self._batch[:size]), dtype='<f4').reshape(size, -1)[:, 0]
+            except Exception as e:
+                logger.error("Model server inference failed: %s", e)
+                message = str(e).encode()[:1024]
+                for conn, request_id, _ in batch:
+                    conn.reply(request_id, STATUS_ERROR, message, len(message))
+                continue
+
+            self.batches += 1
+            self.images += size
+            offset = 0
+            for conn, request_id, slots in batch:
+                conn.reply(request_id, STATUS_OK, scores[offset:offset + len(slots)].tobytes(), len(slots))
+                offset += len(slots)
+
+
+class _PendingRequest:
+    def __init__(self):
+        self.done = threading.Event()
+        self.scores: Optional[np.ndarray] = None
+        self.error: Optional[str] = None
+
+
+class ModelServerClient:
+    """
+    Scores images on a ModelServer; a drop-in for the app's inference function.
+
+    Thread-safe: requests from several worker threads share one connection
+    and are answered out of order.
+    """
+
+    def __init__(self, address: str, image_shape: Tuple[int, int, int], slots: int = 32,
+                 timeout: float = 30.0):
+        """
+        Args:
+            address: Path of the server's Unix domain socket
+            image_shape: (height, width, channels) of one model input
+            slots: Images this process can have in flight at once
+            timeout: Seconds to wait for a free slot or for the scores
+        """
+        self.address = address
+        self.image_shape = tuple(image_shape)
+        self.timeout = timeout
+        self.max_batch_size = slots
+        self.server_info: Dict[str, str] = {}
+        self._shm = shared_memory.SharedMemory(create=True, size=slots * int(np.prod(self.image_shape)))
+        self._ring = np.ndarray((slots, *self.image_shape), dtype=np.uint8, buffer=self._shm.buf)
+        self._free: "queue.Queue" = queue.Queue()
+        for slot in range(slots):
+            self._free.put(slot)
+        self._acquire_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._pending: Dict[int, _PendingRequest] = {}
+        self._ids = itertools.count()
+        self._sock: Optional[socket.socket] = None
+        try:
+            self._connect()
+        except BaseException:
+            del self._ring
+            self._shm.close()
+            self._shm.unlink()
+            raise
+
+    def _connect(self) -> None:
+        """Connect (or reconnect after a server restart) and start reading replies. Caller holds _lock or is __init__."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.address)
+        sock.sendall(json.dumps({'shm': self._shm.name, 'slots': len(self._ring)}).encode() + b'\n')
+        info = json.loads(_recv_line(sock))
+        if tuple(info['image_shape']) != self.image_shape:
+            sock.close()
+            raise ValueError(f"Model server expects images of shape {info['image_shape']}")
+        sock.settimeout(None)
+        self.max_batch_size = min(len(self._ring), info['max_batch_size'])
+        self.server_info = info
+        self._sock = sock
+        threading.Thread(target=self._read_replies, args=(sock,), name='model-client', daemon=True).start()
+        logger.info("Connected to model server at %s (pid %s)", self.address, info.get('pid'))
+
+    def _read_replies(self, sock: socket.socket) -> None:
+        try:
+            while True:
+                request_id, status, count = RESPONSE_HEADER.unpack(_recv_exactly(sock, RESPONSE_HEADER.size))
+                payload = _recv_exactly(sock, 4 * count if status == STATUS_OK else count)
+                with self._lock:
+                    pending = self._pending.pop(request_id, None)
+                if pending is None:
+                    continue  # the caller timed out
+                if status == STATUS_OK:
+                    pending.scores = np.frombuffer(payload, dtype='<f4')
+                else:
+                    pending.error = payload.decode(errors='replace')
+                pending.done.set()
+        except (ConnectionError, OSError) as e:
+            with self._lock:
+                if self._sock is sock:
+                    self._sock = None
+                failed, self._pending = self._pending, {}
+            for pending in failed.values():
+                pending.error = f"connection to model server lost ({e})"
+                pending.done.set()
+
+    def infer(self, images: np.ndarray) -> np.ndarray:
+        """
+        Score a uint8 image batch, in chunks of at most max_batch_size.
+
+        Returns:
+            float32 scores of shape (N, 1), like the model's output
+
+        Raises:
+            RuntimeError: If the server fails or cannot be reached
+            TimeoutError: If no slot frees up or no reply arrives in time
+        """
+        scores = [
+            self._infer_chunk(images[start:start + self.max_batch_size])
+            for start in range(0, len(images), self.max_batch_size)
+        ]
+        return np.concatenate(scores)[:, None]
+
+    def _infer_chunk(self, images: np.ndarray) -> np.ndarray:
+        # Take all slots of a chunk at once, so threads never hold partial sets
+        with self._acquire_lock:
+            slots = [self._free.get(timeout=self.timeout) for _ in range(len(images))]
+        try:
+            self._ring[slots] = images
+            pending = _PendingRequest()
+            with self._lock:
+                if self._sock is None:
+                    try:
+                        self._connect()
+                    except OSError as e:
+                        raise RuntimeError(f"Model server unavailable: {e}")
+                sock = self._sock
+                request_id = next(self._ids) & 0xFFFFFFFF
+                self._pending[request_id] = pending
+            try:
+                with self._send_lock:
+                    sock.sendall(REQUEST_HEADER.pack(request_id, len(slots))
+                                 + np.asarray(slots, dtype='<u2').tobytes())
+            except OSError as e:
+                with self._lock:
+                    self._pending.pop(request_id, None)
+                raise RuntimeError(f"Model server unavailable: {e}")
+
+            if not pending.done.wait(self.timeout):
+                with self._lock:
+                    self._pending.pop(request_id, None)
+                raise TimeoutError("Model server did not answer in time")
+            if pending.error is not None:
+                raise RuntimeError(f"Model server error: {pending.error}")
+            return pending.scores
+        finally:
+            for slot in slots:
+                self._free.put(slot)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+        del self._ring
+        self._shm.close()
+        self._shm.unlink()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--socket', default=os.getenv('MODEL_SERVER_SOCKET', '/tmp/pneumoscan-model.sock'))
+    parser.add_argument('--model', default=os.getenv(
+        'MODEL_PATH', os.path.join(os.path.dirname(__file__), '..', 'model', 'final_model.keras')
+    ))
+    parser.add_argument('--max-batch-size', type=int, default=int(os.getenv('MAX_BATCH_SIZE', 16)))
+    parser.add_argument('--batch-timeout-ms', type=float,
+                        default=float(os.getenv('MODEL_SERVER_BATCH_TIMEOUT_MS', 2)))
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from model_downloader import ensure_model_exists
+    from serving_config import configure_tensorflow, build_inference_function
+    from result_cache import model_file_version
+
+    load_dotenv()
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'),
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    settings = configure_tensorflow(
+        intra_op_threads=int(os.getenv('TF_INTRA_OP_THREADS', 0)),
+        inter_op_threads=int(os.getenv('TF_INTER_OP_THREADS', 0)),
+        enable_xla=os.getenv('TF_XLA_JIT', 'false').lower() == 'true',
+    )
+    if not ensure_model_exists(args.model, os.getenv('MODEL_URL')):
+        raise SystemExit(f"Model file not found at {args.model}")
+
+    from tensorflow.keras.models import load_model
+
+    model = load_model(args.model)
+    infer = build_inference_function(model, jit_compile=settings['xla_jit'])
+    image_shape = tuple(model.input_shape[1:])
+    infer(np.zeros((1, *image_shape), dtype=np.uint8))  # trace before the first request
+
+    server = ModelServer(infer, image_shape, args.socket, max_batch_size=args.max_batch_size,
+                         batch_timeout=args.batch_timeout_ms / 1000,
+                         info={'model_path': args.model, 'model_version': model_file_version(args.model)})
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
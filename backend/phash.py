@@ -0,0 +1,261 @@
+"""
+Perceptual Hashing for Near-Duplicate Uploads
+
+Computes a DCT-based perceptual hash (pHash) of an image and keeps an
+in-memory index supporting Hamming-distance lookup. Re-encoded, resized or
+screenshotted copies of the same radiograph hash to nearby values, so their
+earlier result can be reused instead of re-running validation and the model.
+
+Different patients with similar anatomy can also hash to nearby (or equal)
+values, so a hash match alone never justifies reusing a result: callers
+compare a small colour thumbnail of both images with `thumbnails_match`
+before trusting it.
+
+The index uses multi-index hashing: each 64-bit hash is split into four
+16-bit chunks kept in sorted arrays. By the pigeonhole principle, two hashes
+within distance d share at least one chunk within distance d // 4, so a
+lookup only probes a handful of sorted ranges instead of scanning every
+entry. Recent inserts sit in a small unsorted tail that is scanned directly
+and merged into the sorted arrays in amortized batches.
+"""
+
+import threading
+import time
+import logging
+from dataclasses import dataclass
+from itertools import combinations
+from typing import Any, List, Optional
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8       # 8x8 low-frequency block -> 64-bit hash
+DCT_SIZE = 32       # Image is downsampled to 32x32 before the DCT
+CHUNKS = 4
+CHUNK_BITS = 16
+THUMBNAIL_SIZE = 64  # RGB thumbnail compared pixel by pixel to confirm a match
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II basis as an (n, n) matrix."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    basis = np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    basis[0] *= 1 / np.sqrt(2)
+    return (basis * np.sqrt(2 / n)).astype(np.float32)
+
+
+_DCT = _dct_matrix(DCT_SIZE)[:HASH_SIZE]
+_BIT_WEIGHTS = (np.uint64(1) << np.arange(63, -1, -1, dtype=np.uint64))
+_POPCOUNT16 = np.array([bin(i).count('1') for i in range(1 << 16)], dtype=np.uint8)
+
+
+def compute_phash(image: Image.Image) -> int:
+    """
+    Compute the 64-bit DCT perceptual hash of an image.
+
+    Args:
+        image: PIL Image (any mode)
+
+    Returns:
+        Hash as a Python int
+    """
+    gray = image.convert('L').resize((DCT_SIZE, DCT_SIZE), Image.BOX, reducing_gap=2.0)
+    pixels = np.asarray(gray, dtype=np.float32)
+
+    # 2D DCT restricted to the 8x8 lowest frequencies: D @ X @ D.T
+    coeffs = _DCT @ pixels @ _DCT.T
+    median = np.median(coeffs.ravel()[1:])  # exclude the DC term
+    bits = (coeffs.ravel() > median).astype(np.uint64)
+    return int(np.sum(bits * _BIT_WEIGHTS, dtype=np.uint64))
+
+
+def compute_thumbnail(image: Image.Image) -> np.ndarray:
+    """
+    Downsample an image to the RGB thumbnail used to verify hash matches.
+
+    Colour is kept so that a colour photo never matches a grayscale X-ray
+    with the same luminance.
+
+    Returns:
+        uint8 array of shape (THUMBNAIL_SIZE, THUMBNAIL_SIZE, 3)
+    """
+    thumb = image.convert('RGB').resize((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.BOX, reducing_gap=2.0)
+    return np.asarray(thumb, dtype=np.uint8)
+
+
+def thumbnails_match(a: np.ndarray, b: np.ndarray, mean_tolerance: float = 2.0,
+                     max_tolerance: int = 24) -> bool:
+    """
+    Check that two thumbnails show the same pixels up to re-encoding noise.
+
+    Args:
+        a, b: Thumbnails from `compute_thumbnail`
+        mean_tolerance: Largest mean absolute difference, in 8-bit levels
+        max_tolerance: Largest difference of any single pixel, so a local
+            change such as an opacity in one lung is never averaged away
+
+    Returns:
+        True if the thumbnails match
+    """
+    diff = np.abs(a.astype(np.int16) - b.astype(np.int16))
+    return float(diff.mean()) <= mean_tolerance and int(diff.max()) <= max_tolerance
+
+
+def hamming_distances(hashes: np.ndarray, query: int) -> np.ndarray:
+    """Vectorized Hamming distance between a uint64 array and one hash."""
+    x = np.bitwise_xor(hashes, np.uint64(query))
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(x)
+    mask = np.uint64(0xFFFF)
+    total = _POPCOUNT16[(x & mask).astype(np.intp)].astype(np.uint8)
+    for shift in (16, 32, 48):
+        total += _POPCOUNT16[((x >> np.uint64(shift)) & mask).astype(np.intp)]
+    return total
+
+
+def _chunk(values, index: int):
+    shift = np.uint64(CHUNK_BITS * (CHUNKS - 1 - index))
+    return (values >> shift) & np.uint64((1 << CHUNK_BITS) - 1)
+
+
+def _neighbors(key: int, radius: int) -> np.ndarray:
+    """All 16-bit keys within Hamming distance `radius` of key."""
+    keys = [key]
+    for r in range(1, radius + 1):
+        for positions in combinations(range(CHUNK_BITS), r):
+            flipped = key
+            for p in positions:
+                flipped ^= 1 << p
+            keys.append(flipped)
+    return np.array(keys, dtype=np.uint64)
+
+
+@dataclass
+class Match:
+    """Nearest indexed entry for a lookup."""
+
+    value: Any
+    distance: int
+
+
+class NearDuplicateIndex:
+    """Thread-safe perceptual-hash index with Hamming-distance lookup."""
+
+    # Beyond this per-chunk radius enumerating neighbours costs more than a scan
+    MAX_PROBE_RADIUS = 2
+
+    def __init__(self, max_entries: int = 200000, merge_threshold: int = 4096):
+        """
+        Args:
+            max_entries: Entries kept before the oldest half is dropped
+            merge_threshold: Minimum unsorted tail size before merging
+        """
+        self.max_entries = max_entries
+        self.merge_threshold = merge_threshold
+        self._lock = threading.Lock()
+        self._hashes = np.empty(1024, dtype=np.uint64)
+        self._values: List[Any] = []
+        self._sorted_keys: List[np.ndarray] = [np.empty(0, dtype=np.uint64)] * CHUNKS
+        self._sorted_ids: List[np.ndarray] = [np.empty(0, dtype=np.int64)] * CHUNKS
+        self._indexed = 0
+        self.lookups = 0
+        self.hits = 0
+        self.lookup_seconds = 0.0
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def add(self, image_hash: int, value: Any) -> None:
+        """Index a hash with the value to return for near-duplicates."""
+        with self._lock:
+            count = len(self._values)
+            if count >= self.max_entries:
+                self._drop_oldest(count // 2)
+                count = len(self._values)
+            if count == len(self._hashes):
+                self._hashes = np.resize(self._hashes, count * 2)
+            self._hashes[count] = image_hash
+            self._values.append(value)
+
+            pending = count + 1 - self._indexed
+            if pending >= max(self.merge_threshold, self._indexed // 8):
+                self._rebuild()
+
+    def _drop_oldest(self, n: int) -> None:
+        count = len(self._values)
+        self._hashes[:count - n] = self._hashes[n:count]
+        del self._values[:n]
+        self._rebuild()
+
+    def _rebuild(self) -> None:
+        """Merge every entry into the sorted per-chunk arrays."""
+        count = len(self._values)
+        hashes = self._hashes[:count]
+        for c in range(CHUNKS):
+            keys = _chunk(hashes, c)
+            order = np.argsort(keys, kind='stable')
+            self._sorted_keys[c] = keys[order]
+            self._sorted_ids[c] = order
+        self._indexed = count
+
+    def _candidates(self, image_hash: int, radius: int) -> np.ndarray:
+        query = np.uint64(image_hash)
+        found = []
+        for c in range(CHUNKS):
+            keys = self._sorted_keys[c]
+            if not len(keys):
+                continue
+            probes = _neighbors(int(_chunk(query, c)), radius)
+            lo = np.searchsorted(keys, probes, side='left')
+            hi = np.searchsorted(keys, probes, side='right')
+            for start, end in zip(lo[hi > lo], hi[hi > lo]):
+                found.append(self._sorted_ids[c][start:end])
+        return np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+
+    def lookup(self, image_hash: int, max_distance: int) -> Optional[Match]:
+        """
+        Find the closest indexed entry within `max_distance` bits.
+
+        Args:
+            image_hash: 64-bit perceptual hash
+            max_distance: Largest Hamming distance counted as a near-duplicate
+
+        Returns:
+            Closest Match, or None if nothing is close enough
+        """
+        start = time.perf_counter()
+        with self._lock:
+            count = len(self._values)
+            radius = max_distance // CHUNKS
+            if radius > self.MAX_PROBE_RADIUS:
+                ids = np.arange(count)
+            else:
+                ids = np.concatenate([
+                    self._candidates(image_hash, radius),
+                    np.arange(self._indexed, count),
+                ])
+
+            match = None
+            if len(ids):
+                distances = hamming_distances(self._hashes[ids], image_hash)
+                best = int(np.argmin(distances))
+                if distances[best] <= max_distance:
+                    match = Match(self._values[ids[best]], int(distances[best]))
+
+            self.lookups += 1
+            self.hits += match is not None
+            self.lookup_seconds += time.perf_counter() - start
+        return match
+
+    def stats(self) -> dict:
+        """Entry count, hit rate and mean lookup latency."""
+        return {
+            'entries': len(self),
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'hit_rate': round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            'mean_lookup_ms': round(1000 * self.lookup_seconds / self.lookups, 4) if self.lookups else 0.0,
+        }
@@ -0,0 +1,159 @@
+"""
+Per-Request Profiling
+
+Stores cProfile (and optionally TensorFlow profiler) traces of individual
+requests in a bounded on-disk ring, so a slow upload seen in production can
+be examined afterwards. Profiling is opt-in per request and guarded by an
+environment switch; when it is off nothing in this module runs.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import shutil
+import threading
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACE_ID_PATTERN = re.compile(r'^[0-9]{14}-[0-9a-f]{8}$')
+
+
+class ProfileStore:
+    """Bounded ring of profile traces on disk, oldest evicted first."""
+
+    def __init__(self, directory: str, max_traces: int = 20):
+        """
+        Args:
+            directory: Directory holding the trace files
+            max_traces: Number of traces kept before the oldest are deleted
+        """
+        self.directory = Path(directory)
+        self.max_traces = max_traces
+        self._lock = threading.Lock()
+        self._tf_lock = threading.Lock()  # the TF profiler is process-global
+        # Python 3.12+ allows one active cProfile per process (sys.monitoring)
+        self._profile_lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def new_trace_id() -> str:
+        """Sortable trace ID: UTC timestamp plus a random suffix."""
+        return f"{time.strftime('%Y%m%d%H%M%S', time.gmtime())}-{uuid.uuid4().hex[:8]}"
+
+    def _paths(self, trace_id: str) -> Dict[str, Path]:
+        if not TRACE_ID_PATTERN.match(trace_id):
+            raise ValueError(f"Invalid trace ID: {trace_id}")
+        return {
+            'prof': self.directory / f"{trace_id}.prof",
+            'meta': self.directory / f"{trace_id}.json",
+            'tf': self.directory / f"{trace_id}_tf",
+        }
+
+    def try_begin_profile(self) -> bool:
+        """
+        Claim the process's profiler for one request.
+
+        Overlapping cProfile sessions fail on Python 3.12+, so only one
+        request is profiled at a time. Returns False if another request
+        holds the profiler; otherwise call `end_profile` when done.
+        """
+        return self._profile_lock.acquire(blocking=False)
+
+    def end_profile(self) -> None:
+        """Release the profiler claimed by `try_begin_profile`."""
+        self._profile_lock.release()
+
+    @contextmanager
+    def tensorflow_trace(self, trace_id: str):
+        """
+        Capture a TensorFlow profiler trace for the enclosed block.
+
+        Skipped (with a log message) if another request is already being
+        traced, since only one TF profiler session can run at a time.
+        """
+        if not self._tf_lock.acquire(blocking=False):
+            logger.info(f"TensorFlow profiler busy, trace {trace_id} has cProfile data only")
+            yield
+            return
+        try:
+            import tensorflow as tf
+
+            tf.profiler.experimental.start(str(self._paths(trace_id)['tf']))
+            try:
+                yield
+            finally:
+                tf.profiler.experimental.stop()
+        finally:
+            self._tf_lock.release()
+
+    def save(self, trace_id: str, profiler: cProfile.Profile, metadata: Dict[str, Any]) -> None:
+        """Write a finished profile and its metadata, then enforce the ring size."""
+        paths = self._paths(trace_id)
+        profiler.dump_stats(str(paths['prof']))
+        metadata = dict(metadata, trace_id=trace_id, created=time.time(),
+                        has_tensorflow_trace=paths['tf'].exists())
+        paths['meta'].write_text(json.dumps(metadata))
+        self._evict()
+
+    def _evict(self) -> None:
+        with self._lock:
+            traces = sorted(p.stem for p in self.directory.glob('*.json'))
+            for trace_id in traces[:max(0, len(traces) - self.max_traces)]:
+                self.delete(trace_id)
+
+    def delete(self, trace_id: str) -> None:
+        paths = self._paths(trace_id)
+        for key in ('prof', 'meta'):
+            paths[key].unlink(missing_ok=True)
+        shutil.rmtree(paths['tf'], ignore_errors=True)
+        (self.directory / f"{trace_id}_tf.zip").unlink(missing_ok=True)
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Metadata of every stored trace, newest first."""
+        traces = []
+        for meta in sorted(self.directory.glob('*.json'), reverse=True):
+            try:
+                traces.append(json.loads(meta.read_text()))
+            except (OSError, ValueError):
+                continue
+        return traces
+
+    def profile_path(self, trace_id: str) -> Optional[Path]:
+        """Path of the pstats dump for a trace, or None if it no longer exists."""
+        path = self._paths(trace_id)['prof']
+        return path if path.exists() else None
+
+    def summary(self, trace_id: str, limit: int = 40) -> Optional[str]:
+        """Text report of the slowest functions by cumulative time."""
+        path = self.profile_path(trace_id)
+        if path is None:
+            return None
+        out = io.StringIO()
+        stats = pstats.Stats(str(path), stream=out)
+        stats.sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+    def tensorflow_archive(self, trace_id: str) -> Optional[Path]:
+        """Zip the TensorFlow trace directory for download, if one was captured."""
+        tf_dir = self._paths(trace_id)['tf']
+        if not tf_dir.exists():
+            return None
+        archive = self.directory / f"{trace_id}_tf.zip"
+        if not archive.exists():
+            shutil.make_archive(str(archive.with_suffix('')), 'zip', str(tf_dir))
+        return archive
+
+
+def default_profile_dir() -> str:
+    """Default trace directory under the system temp folder."""
+    import tempfile
+    return os.path.join(tempfile.gettempdir(), 'pneumoscan-profiles')
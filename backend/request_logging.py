@@ -0,0 +1,176 @@
+"""
+Structured Request Logging
+
+Routes log records through a queue drained by a background thread, so the
+event loop and worker threads never block on writes to stderr. Records are
+emitted as JSON carrying the current request ID, and every request ends
+with one summary record holding its per-stage durations.
+
+Per-request detail logs (INFO and below emitted while handling a request)
+are sampled: only LOG_SAMPLE_RATE of requests keep them. Records whose
+arguments are plain strings and numbers are handed to the queue unformatted,
+so a dropped record never has its message built; any other argument could
+change before the listener thread reads it, so those messages are built on
+the caller's thread.
+"""
+
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Per-request state, propagated into worker threads via contextvars.copy_context()
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('request_id', default=None)
+sampled_var: contextvars.ContextVar[bool] = contextvars.ContextVar('sampled', default=True)
+stages_var: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar('stages', default=None)
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+# Immutable argument types that are safe to format later on the listener thread
+_LAZY_ARG_TYPES = (str, int, float)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class RequestContextFilter(logging.Filter):
+    """Tag records with the request ID and drop unsampled request detail."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        if record.levelno >= logging.WARNING or getattr(record, 'always', False):
+            return True
+        return record.request_id is None or sampled_var.get()
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock implementation formats here, on the caller's thread.
+        # Messages are only left unformatted when every argument is an
+        # immutable primitive; mutable objects (dicts, arrays, models) are
+        # rendered now, as they are when the call is made. Exception info is
+        # always rendered eagerly, since the traceback objects are not safe
+        # to hold across threads.
+        args = record.args
+        if args and not (isinstance(args, tuple) and all(isinstance(a, _LAZY_ARG_TYPES) for a in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including any `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and key != 'always':
+                payload[key] = value
+        if record.exc_text:
+            payload['exception'] = record.exc_text
+        return json.dumps(payload, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The previous plain-text format, with the request ID appended."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        request_id = getattr(record, 'request_id', None)
+        return f"{text} [request_id={request_id}]" if request_id else text
+
+
+def setup_logging(level: str = 'INFO', log_format: str = 'json') -> None:
+    """
+    Install the queue-based handler on the root logger.
+
+    Args:
+        level: Root log level name
+        log_format: 'json' for structured records, 'text' for the plain format
+    """
+    global _listener
+
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter() if log_format == 'json' else TextFormatter())
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    handler = LazyQueueHandler(log_queue)
+    handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def begin_request(request_id: Optional[str], sample_rate: float) -> Dict[str, float]:
+    """
+    Set up logging context for a new request.
+
+    Args:
+        request_id: Caller-supplied ID (e.g. X-Request-ID), or None to generate one
+        sample_rate: Fraction of requests whose detail logs are kept
+
+    Returns:
+        The dict that per-stage durations (ms) are recorded into
+    """
+    request_id_var.set(request_id or uuid.uuid4().hex[:16])
+    sampled_var.set(random.random() < sample_rate)
+    stages: Dict[str, float] = {}
+    stages_var.set(stages)
+    return stages
+
+
+@contextmanager
+def stage(name: str):
+    """Record the duration of a request stage, in milliseconds."""
+    stages = stages_var.get()
+    if stages is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[name] = round(stages.get(name, 0.0) + 1000 * (time.perf_counter() - start), 2)
+
+
+def detail_enabled() -> bool:
+    """Whether detail logs of the current request are sampled in."""
+    return sampled_var.get()
@@ -0,0 +1,211 @@
+"""
+Persistent Result Cache
+
+Stores analysis results (validation and prediction) of uploads in a SQLite
+database in WAL mode, keyed by the SHA-256 of the upload bytes and the
+model version. Every uvicorn worker opens the same file, so a result
+computed by one worker is reused by the others, and results survive
+restarts and redeploys of the same model.
+
+WAL lets readers run concurrently with one writer across processes. The
+cache never fails or noticeably delays a request: writes that cannot get
+the database lock within a short timeout are skipped, and lookups that hit
+an error count as misses. When the entry count exceeds its bound, the
+least recently used entries are evicted; entries of other model versions
+are never read again and age out first.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key BLOB PRIMARY KEY,
+    model_version TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed);
+"""
+
+
+def default_result_cache_path() -> str:
+    """Default database location, next to the job queue under backend/data."""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'results.sqlite3')
+
+
+def model_file_version(model_path: str) -> str:
+    """
+    Version string of a model file: the start of its SHA-256.
+
+    Hashing the file (rather than using its name or mtime) keeps cached
+    results valid across redeploys of the same model and invalidates them
+    when the weights change.
+    """
+    digest = hashlib.sha256()
+    with open(model_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def _to_json(value: Any) -> Any:
+    """json.dumps fallback for NumPy scalars in validation results."""
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class ResultCache:
+    """Disk-backed cache of analysis results shared by all server processes."""
+
+    EVICT_EVERY = 64  # puts between entry-count checks in this process
+    TOUCH_INTERVAL = 60.0  # seconds before a hit refreshes the entry's access time
+
+    def __init__(self, path: str, model_version: str, max_entries: int = 100000,
+                 lock_timeout: float = 0.05):
+        """
+        Args:
+            path: Database file, created if missing
+            model_version: Identifies the model and settings the results were
+                computed with; part of every key
+            max_entries: Entries kept before the least recently used are evicted
+            lock_timeout: Seconds a write waits for the database lock before
+                it is skipped
+        """
+        self.path = path
+        self.model_version = model_version
+        self.max_entries = max_entries
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # Cached results can be recomputed; losing the last commits on power loss is fine
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        # Workers starting together wait for the schema above; requests only briefly
+        self._conn.execute(f'PRAGMA busy_timeout={int(lock_timeout * 1000)}')
+        self._puts = 0
+        self._counts = dict.fromkeys(('hits', 'misses', 'stores', 'evicted', 'skipped_writes', 'errors'), 0)
+
+    def key(self, content: bytes, variant: str = '') -> bytes:
+        """Cache key of an upload (analysed with the options named by variant) under the current model version."""
+        digest = hashlib.sha256(content).digest()
+        return hashlib.sha256(f"{self.model_version}|{variant}|".encode() + digest).digest()
+
+    def lookup(self, content: bytes, variant: str = ''):
+        """
+        Key and cached value of an upload.
+
+        Args:
+            content: Encoded upload bytes
+            variant: Analysis options that change the result, e.g. 'tta'
+
+        Returns:
+            Tuple of (key, value or None); pass the key to `put` on a miss
+        """
+        key = self.key(content, variant)
+        return key, self.get(key)
+
+    def get(self, key: bytes) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached result.
+
+        Returns:
+            The stored value, or None on a miss
+        """
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    'SELECT value, accessed FROM results WHERE key = ?', (key,)
+                ).fetchone()
+                if row is None:
+                    self._counts['misses'] += 1
+                    return None
+                self._counts['hits'] += 1
+                value, accessed = row
+                if now - accessed > self.TOUCH_INTERVAL:
+                    # Refresh recency at most once per interval so hits rarely write
+                    self._write('UPDATE results SET accessed = ? WHERE key = ?', (now, key))
+            return json.loads(value)
+        except sqlite3.Error as e:
+            logger.warning("Result cache lookup failed: %s", e)
+            with self._lock:
+                self._counts['errors'] += 1
+            return None
+
+    def put(self, key: bytes, value: Dict[str, Any]) -> None:
+        """Store a result; skipped if another process holds the write lock too long."""
+        now = time.time()
+        data = json.dumps(value, default=_to_json)
+        with self._lock:
+            try:
+                if self._write(
+                    'INSERT OR REPLACE INTO results (key, model_version, value, created, accessed) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (key, self.model_version, data, now, now),
+                ):
+                    self._counts['stores'] += 1
+                    self._puts += 1
+                    if self._puts % self.EVICT_EVERY == 0:
+                        self._evict()
+            except sqlite3.Error as e:
+                logger.warning("Result cache store failed: %s", e)
+                self._counts['errors'] += 1
+
+    def _write(self, sql: str, params: tuple) -> bool:
+        """Run one write statement; False if the database stayed locked. Caller holds _lock."""
+        try:
+            self._conn.execute(sql, params)
+            return True
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                logger.warning("Result cache write failed: %s", e)
+                self._counts['errors'] += 1
+            else:
+                self._counts['skipped_writes'] += 1
+            return False
+
+    def _evict(self) -> None:
+        """Trim to 90% of max_entries, least recently used first. Caller holds _lock."""
+        (count,) = self._conn.execute('SELECT count(*) FROM results').fetchone()
+        excess = count - self.max_entries
+        if excess <= 0:
+            return
+        excess += self.max_entries // 10
+        if self._write(
+            'DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY accessed LIMIT ?)',
+            (excess,),
+        ):
+            self._counts['evicted'] += excess
+            logger.info("Result cache evicted %d entries", excess)
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry count and this process's hit/miss counters."""
+        with self._lock:
+            (entries,) = self._conn.execute('SELECT count(*) FROM results').fetchone()
+            counts = dict(self._counts)
+        lookups = counts['hits'] + counts['misses']
+        return {
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'model_version': self.model_version,
+            'db_bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            **counts,
+            'hit_rate': round(counts['hits'] / lookups, 4) if lookups else None,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,252 @@
+"""
+TensorFlow Serving Configuration
+
+Configures TensorFlow's CPU thread pools and optional XLA JIT compilation
+for model serving. In small containers TensorFlow's defaults size the thread
+pools from the host's core count rather than the container's CPU quota, which
+oversubscribes the cores and competes with uvicorn and the image validator.
+"""
+
+import math
+import os
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# cgroup v2 exposes "<quota> <period>" in a single file, v1 uses two files
+CGROUP_V2_CPU_MAX = '/sys/fs/cgroup/cpu.max'
+CGROUP_V1_QUOTA = '/sys/fs/cgroup/cpu/cpu.cfs_quota_us'
+CGROUP_V1_PERIOD = '/sys/fs/cgroup/cpu/cpu.cfs_period_us'
+
+
+def _read_first_line(path: str) -> Optional[str]:
+    """Read the first line of a file, returning None if it cannot be read."""
+    try:
+        with open(path) as f:
+            return f.readline().strip()
+    except OSError:
+        return None
+
+
+def detect_cpu_quota() -> Optional[float]:
+    """
+    Detect the container CPU quota from cgroup limits.
+
+    Returns:
+        Number of CPUs granted by the quota (may be fractional),
+        or None if no quota is set or it cannot be determined
+    """
+    # cgroup v2: "max 100000" or "200000 100000"
+    cpu_max = _read_first_line(CGROUP_V2_CPU_MAX)
+    if cpu_max:
+        parts = cpu_max.split()
+        if len(parts) == 2 and parts[0] != 'max':
+            try:
+                return int(parts[0]) / int(parts[1])
+            except (ValueError, ZeroDivisionError):
+                pass
+        return None
+
+    # cgroup v1: quota of -1 means unlimited
+    quota = _read_first_line(CGROUP_V1_QUOTA)
+    period = _read_first_line(CGROUP_V1_PERIOD)
+    if quota and period:
+        try:
+            quota_us, period_us = int(quota), int(period)
+            if quota_us > 0 and period_us > 0:
+                return quota_us / period_us
+        except ValueError:
+            pass
+
+    return None
+
+
+def available_cpus() -> int:
+    """
+    Number of CPUs this process can actually use.
+
+    Takes the smaller of the scheduler affinity mask and the cgroup quota,
+    rounded up so a 1.5 CPU quota still gets two threads.
+
+    Returns:
+        Usable CPU count (at least 1)
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+
+    quota = detect_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+
+    return max(1, cpus)
+
+
+def resolve_thread_settings(intra_op_threads: int = 0,
+                            inter_op_threads: int = 0) -> Dict[str, int]:
+    """
+    Resolve thread pool sizes, filling in automatic values for zeros.
+
+    Automatic sizing gives the intra-op pool one thread per usable CPU and
+    keeps the inter-op pool small, since the served CNN is a single chain of
+    ops with little inter-op parallelism to exploit.
+
+    Args:
+        intra_op_threads: Threads used inside a single op (0 = auto)
+        inter_op_threads: Threads used to run independent ops (0 = auto)
+
+    Returns:
+        dict with resolved 'cpus', 'intra_op_threads' and 'inter_op_threads'
+    """
+    cpus = available_cpus()
+    return {
+        'cpus': cpus,
+        'intra_op_threads': intra_op_threads or cpus,
+        'inter_op_threads': inter_op_threads or (1 if cpus <= 2 else 2),
+    }
+
+
+def configure_tensorflow(intra_op_threads: int = 0,
+                         inter_op_threads: int = 0,
+                         enable_xla: bool = False) -> Dict[str, Any]:
+    """
+    Apply thread pool settings to the TensorFlow runtime.
+
+    Must be called before TensorFlow executes its first op; afterwards the
+    thread pools are fixed and the call only logs a warning.
+
+    Args:
+        intra_op_threads: Threads used inside a single op (0 = auto)
+        inter_op_threads: Threads used to run independent ops (0 = auto)
+        enable_xla: Whether the inference function should be XLA compiled
+
+    Returns:
+        dict describing the effective serving configuration
+    """
+    settings = resolve_thread_settings(intra_op_threads, inter_op_threads)
+    settings['cpu_quota'] = detect_cpu_quota()
+    settings['xla_jit'] = enable_xla
+
+    # oneDNN kernels size their OpenMP pool from this variable
+    os.environ.setdefault('OMP_NUM_THREADS', str(settings['intra_op_threads']))
+
+    import tensorflow as tf
+
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(settings['intra_op_threads'])
+        tf.config.threading.set_inter_op_parallelism_threads(settings['inter_op_threads'])
+    except RuntimeError as e:
+        # Raised when the runtime has already been initialized
+        logger.warning(f"TensorFlow thread pools already initialized: {e}")
+
+    logger.info(f"TensorFlow serving configuration: {settings}")
+    return settings
+
+
+def build_inference_function(model, jit_compile: bool = False):
+    """
+    Wrap a Keras model in a traced inference function.
+
+    Calling the traced function directly avoids the per-call overhead of
+    `model.predict`, which builds a data pipeline for every invocation.
+    The function takes uint8 pixels and performs the `/ 255` normalization
+    in-graph; float32 division matches NumPy's bit for bit.
+
+    Args:
+        model: Loaded Keras model
+        jit_compile: Compile the function with XLA
+
+    Returns:
+        tf.function mapping a uint8 image batch to model outputs
+    """
+    import tensorflow as tf
+
+    @tf.function(jit_compile=jit_compile, reduce_retracing=True)
+    def infer(images):
+        images = tf.cast(images, tf.float32) / 255.0
+        return model(images, training=False)
+
+    return infer
+
+
+def build_embedding_inference_function(model, jit_compile: bool = False):
+    """
+    Like `build_inference_function`, but also return the penultimate-layer embedding.
+
+    The embedding is the input of the model's final layer, taken from the
+    same forward pass that produces the prediction.
+
+    Args:
+        model: Loaded Keras model
+        jit_compile: Compile the function with XLA
+
+    Returns:
+        tf.function mapping a uint8 image batch to (model outputs, embeddings)
+    """
+    import tensorflow as tf
+
+    head = model.layers[-1]
+    if isinstance(model, tf.keras.Sequential):
+        def forward(x):
+            for layer in model.layers[:-1]:
+                x = layer(x, training=False)
+            return head(x, training=False), x
+    else:
+        embedding_model = tf.keras.Model(model.inputs, [model.outputs[0], head.input])
+
+        def forward(x):
+            return embedding_model(x, training=False)
+
+    @tf.function(jit_compile=jit_compile, reduce_retracing=True)
+    def infer(images):
+        images = tf.cast(images, tf.float32) / 255.0
+        return forward(images)
+
+    return infer
+
+
+def embedding_size(model) -> int:
+    """Dimension of the penultimate-layer embedding of a Keras model."""
+    return int(model.layers[-1].input.shape[-1])
+
+
+def build_graph_decoder(max_dimension: int = 0):
+    """
+    Build an upload decoder that runs as TensorFlow ops (PREPROCESS_MODE=graph).
+
+    TensorFlow ops execute without holding the GIL, so concurrent uploads
+    decode in parallel. The pixels are returned to the caller and shared by
+    validation and preprocessing, so each upload is decoded once. Like
+    `inference.decode_image`, images larger than `max_dimension` are reduced
+    to that longest side (area averaging, aspect ratio kept).
+
+    Args:
+        max_dimension: Longest side to keep, in pixels (0 = full resolution)
+
+    Returns:
+        Function mapping PNG/JPEG/BMP/GIF bytes to a uint8 array of shape
+        (height, width, channels), with the channels as stored (1 to 4)
+    """
+    import tensorflow as tf
+
+    @tf.function(input_signature=[tf.TensorSpec([], tf.string)])
+    def decode(content):
+        image = tf.io.decode_image(content, expand_animations=False)
+        if not max_dimension:
+            return image
+        size = tf.shape(image)[:2]
+        scale = max_dimension / tf.cast(tf.reduce_max(size), tf.float32)
+
+        def reduce():
+            target = tf.maximum(tf.cast(tf.round(tf.cast(size, tf.float32) * scale), tf.int32), 1)
+            resized = tf.image.resize(image, target, method='area')
+            return tf.cast(tf.clip_by_value(tf.round(resized), 0, 255), tf.uint8)
+
+        return tf.cond(scale < 1, reduce, lambda: image)
+
+    def decode_upload(content: bytes):
+        return decode(content).numpy()
+
+    return decode_upload
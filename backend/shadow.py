@@ -0,0 +1,161 @@
+"""
+Shadow Model Evaluation
+
+Scores a sample of live requests with a candidate model next to the served
+one, to see how a retrained model behaves on real traffic before it is
+promoted. The primary request only pays for a non-blocking enqueue of its
+model input; the candidate runs later on a dedicated thread. The queue is
+bounded and work is dropped, never waited for, when it is full or when the
+server is busy, so shadow scoring cannot slow down primary traffic.
+"""
+
+import queue
+import random
+import threading
+import time
+import logging
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ShadowEvaluator:
+    """Samples model inputs and compares candidate scores with the primary model's."""
+
+    LATENCY_WINDOW = 1000  # recent candidate latencies kept for percentiles
+
+    def __init__(self, score: Callable[[Any], float], threshold: float = 0.5,
+                 sample_rate: float = 0.1, queue_size: int = 64, max_age: float = 30.0,
+                 busy: Optional[Callable[[], bool]] = None, name: str = 'candidate'):
+        """
+        Args:
+            score: Runs the candidate model on one model input, returning its score
+            threshold: Score above which a prediction is pneumonia
+            sample_rate: Fraction of requests also scored by the candidate
+            queue_size: Inputs waiting for the candidate before new ones are dropped
+            max_age: Seconds after which a waiting input is dropped as stale
+            busy: Returns True while primary traffic is queuing; the candidate
+                waits meanwhile (and its queue fills up and drops). Called from
+                the shadow thread, so it must be safe to call off the event loop
+            name: Label of the candidate in statistics (e.g. its model path)
+        """
+        self.score = score
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.max_age = max_age
+        self.busy = busy or (lambda: False)
+        self.name = name
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=self.LATENCY_WINDOW)
+        self._counts = dict.fromkeys(
+            ('sampled', 'scored', 'agreed', 'dropped_full', 'dropped_stale', 'errors',
+             'normal_to_pneumonia', 'pneumonia_to_normal'), 0
+        )
+        self._delta_sum = 0.0
+        self._abs_delta_sum = 0.0
+        self._max_abs_delta = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='shadow-model', daemon=True)
+        self._thread.start()
+
+    def should_sample(self) -> bool:
+        """Decide whether the current request is shadow-scored."""
+        if random.random() >= self.sample_rate:
+            return False
+        with self._lock:
+            self._counts['sampled'] += 1
+        return True
+
+    def submit(self, model_input: Any, primary_score: float) -> bool:
+        """
+        Queue a sampled request's model input for the candidate.
+
+        Never blocks. The caller must not modify model_input afterwards
+        (pass a copy of a pooled buffer).
+
+        Returns:
+            True if queued, False if dropped because the queue is full
+        """
+        try:
+            self._queue.put_nowait((time.monotonic(), model_input, primary_score))
+            return True
+        except queue.Full:
+            with self._lock:
+                self._counts['dropped_full'] += 1
+            return False
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                queued_at, model_input, primary_score = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            try:
+                while self.busy() and not self._stop.is_set():
+                    if time.monotonic() - queued_at > self.max_age:
+                        break
+                    time.sleep(0.01)
+            except Exception as e:
+                logger.error("Shadow busy check failed: %s", e)
+                with self._lock:
+                    self._counts['errors'] += 1
+                continue
+            if time.monotonic() - queued_at > self.max_age:
+                with self._lock:
+                    self._counts['dropped_stale'] += 1
+                continue
+
+            start = time.perf_counter()
+            try:
+                candidate_score = float(self.score(model_input))
+            except Exception as e:
+                logger.error("Shadow model failed: %s", e)
+                with self._lock:
+                    self._counts['errors'] += 1
+                continue
+            self._record(primary_score, candidate_score, time.perf_counter() - start)
+
+    def _record(self, primary: float, candidate: float, latency: float) -> None:
+        primary_positive = primary > self.threshold
+        candidate_positive = candidate > self.threshold
+        delta = candidate - primary
+        with self._lock:
+            self._counts['scored'] += 1
+            if primary_positive == candidate_positive:
+                self._counts['agreed'] += 1
+            elif candidate_positive:
+                self._counts['normal_to_pneumonia'] += 1
+            else:
+                self._counts['pneumonia_to_normal'] += 1
+            self._delta_sum += delta
+            self._abs_delta_sum += abs(delta)
+            self._max_abs_delta = max(self._max_abs_delta, abs(delta))
+            self._latencies.append(latency)
+
+    def stats(self) -> Dict[str, Any]:
+        """Agreement rate, score deltas (candidate - primary) and candidate latency."""
+        with self._lock:
+            counts = dict(self._counts)
+            scored = counts['scored']
+            latencies = np.asarray(self._latencies) * 1000
+            return {
+                'candidate': self.name,
+                'sample_rate': self.sample_rate,
+                'queued': self._queue.qsize(),
+                **counts,
+                'agreement_rate': round(counts['agreed'] / scored, 4) if scored else None,
+                'mean_score_delta': round(self._delta_sum / scored, 5) if scored else None,
+                'mean_abs_score_delta': round(self._abs_delta_sum / scored, 5) if scored else None,
+                'max_abs_score_delta': round(self._max_abs_delta, 5) if scored else None,
+                'latency_p50_ms': round(float(np.percentile(latencies, 50)), 2) if len(latencies) else None,
+                'latency_p99_ms': round(float(np.percentile(latencies, 99)), 2) if len(latencies) else None,
+            }
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=5)
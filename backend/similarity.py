@@ -0,0 +1,433 @@
+"""
+Similar-Case Search
+
+Keeps the penultimate-layer embedding of every analysed X-ray in a compact
+on-disk index and finds the past cases closest to a new one by cosine
+similarity. Embeddings come out of the same forward pass as the prediction,
+so indexing a case costs one row write.
+
+Vectors are L2-normalized and stored as float16 in a memory-mapped file, so
+cosine similarity is a dot product and the operating system keeps the hot
+part of the index in its page cache. Small indexes are searched exhaustively
+in vectorized blocks. Past IVF_THRESHOLD entries a coarse quantizer
+(spherical k-means) partitions the vectors into inverted lists and a search
+only scans the lists nearest the query. Rows added after the quantizer was
+trained are assigned to their nearest list as they arrive, and the
+quantizer is retrained in the background once the index has doubled.
+
+Several server processes may share one index directory. Writers take an
+exclusive `fcntl` lock on the directory's lock file and readers a shared
+one; each process catches up on rows appended by the others (reading the
+row count from disk) before every search and append, and reloads the index
+when another process has compacted it.
+"""
+
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CASE_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+SEARCH_BLOCK_ROWS = 8192  # float16 rows converted per step; keeps the float32 block in cache
+
+
+def spherical_kmeans(vectors: np.ndarray, clusters: int, iterations: int = 10,
+                     seed: int = 0) -> np.ndarray:
+    """
+    Cluster unit vectors by cosine similarity.
+
+    Args:
+        vectors: float32 array (n, dim) of unit vectors
+        clusters: Number of centroids
+        iterations: Lloyd iterations
+
+    Returns:
+        float32 array (clusters, dim) of unit centroids
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        # Re-seed empty clusters with random vectors
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        norms[empty] = 1.0
+        centroids = sums / norms
+    return centroids.astype(np.float32)
+
+
+class SimilarityIndex:
+    """Memory-mapped float16 embedding index with cosine top-k search."""
+
+    def __init__(self, directory: str, dim: int, model_id: str, max_entries: int = 100000,
+                 ivf_threshold: int = 20000, nprobe: int = 8):
+        """
+        Args:
+            directory: Directory holding the index files (created if missing)
+            dim: Embedding dimension
+            model_id: Identifier of the model producing the embeddings; an index
+                written by a different model is discarded
+            max_entries: Entries kept before the oldest half is dropped
+            ivf_threshold: Entry count from which searches use the coarse quantizer
+            nprobe: Inverted lists scanned per IVF search
+        """
+        self.directory = Path(directory)
+        self.dim = dim
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self._lock = threading.Lock()
+        self._vectors_path = self.directory / 'vectors.f16'
+        self._entries_path = self.directory / 'entries.jsonl'
+        self._meta_path = self.directory / 'meta.json'
+
+        self._entries: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        self._vectors: Optional[np.memmap] = None
+        self._entries_offset = 0  # bytes of entries.jsonl already loaded
+        self._disk_generation: Optional[str] = None  # changes when any process compacts the files
+        self._generation = 0  # bumped when rows move, invalidating the quantizer
+        self._centroids: Optional[np.ndarray] = None
+        self._list_order = np.empty(0, dtype=np.int64)
+        self._list_offsets = np.zeros(1, dtype=np.int64)
+        self._trained = 0
+        self._tail_lists = np.empty(1024, dtype=np.int32)  # list of each row added since training
+        self._tail_count = 0  # rows past _trained assigned a list so far
+        self._training = False
+        self.searches = 0
+        self.search_seconds = 0.0
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock_file = open(self.directory / 'index.lock', 'a')
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # Storage
+
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        """Hold the thread lock and the cross-process file lock."""
+        with self._lock:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _load(self) -> None:
+        with self._locked(exclusive=True):
+            meta = {}
+            if self._meta_path.exists():
+                try:
+                    meta = json.loads(self._meta_path.read_text())
+                except ValueError:
+                    pass
+            if meta.get('dim') != self.dim or meta.get('model_id') != self.model_id:
+                if meta:
+                    logger.warning("Similarity index was built by another model, starting a new one")
+                self._vectors_path.unlink(missing_ok=True)
+                self._entries_path.unlink(missing_ok=True)
+                self._write_meta()
+            self._entries_path.touch()
+            self._sync()
+            if self._vectors is None or len(self._vectors) < 1024:
+                self._map(1024)
+        if len(self._entries) >= self.ivf_threshold:
+            self._start_training()
+        logger.info("Similarity index loaded with %d cases", len(self._entries))
+
+    def _write_meta(self) -> None:
+        """Record a new generation, telling other processes to reload. Caller holds the exclusive lock."""
+        self._disk_generation = uuid.uuid4().hex
+        tmp = self._meta_path.with_suffix('.tmp')
+        tmp.write_text(json.dumps({'dim': self.dim, 'model_id': self.model_id,
+                                   'generation': self._disk_generation}))
+        os.replace(tmp, self._meta_path)
+
+    def _sync(self) -> None:
+        """
+        Catch up with rows other processes appended, or reload after a compaction.
+
+        Caller holds the file lock (shared or exclusive).
+        """
+        try:
+            generation = json.loads(self._meta_path.read_text()).get('generation')
+        except (OSError, ValueError):
+            generation = None
+        if generation != self._disk_generation:
+            self._disk_generation = generation
+            self._entries, self._rows, self._entries_offset = [], {}, 0
+            self._generation += 1
+            self._centroids = None
+            self._trained = 0
+            self._tail_count = 0
+
+        if os.path.getsize(self._entries_path) > self._entries_offset:
+            with open(self._entries_path, 'rb') as f:
+                f.seek(self._entries_offset)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # torn final line after a crash
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    self._entries_offset += len(line)
+                    self._rows[entry['case_id']] = len(self._entries)
+                    self._entries.append(entry)
+
+        capacity = self._vectors_path.stat().st_size // (2 * self.dim) if self._vectors_path.exists() else 0
+        if len(self._entries) > capacity:
+            for entry in self._entries[capacity:]:
+                del self._rows[entry['case_id']]
+            del self._entries[capacity:]
+        if capacity and (self._vectors is None or len(self._vectors) != capacity):
+            # Another process grew the file (or this is the first load)
+            self._map(capacity)
+        if self._centroids is not None:
+            self._assign_tail(len(self._entries))
+
+    def _map(self, capacity: int) -> None:
+        """(Re)map the vector file with room for `capacity` rows."""
+        size = capacity * self.dim * 2
+        with open(self._vectors_path, 'ab') as f:
+            if f.tell() < size:
+                f.truncate(size)
+        if self._vectors is not None:
+            self._vectors.flush()
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float16, mode='r+',
+                                  shape=(capacity, self.dim))
+
+    def _rewrite_entries(self) -> None:
+        tmp = self._entries_path.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            f.writelines((json.dumps(entry) + '\n').encode() for entry in self._entries)
+            self._entries_offset = f.tell()
+        os.replace(tmp, self._entries_path)
+
+    def _drop_oldest(self, n: int) -> None:
+        """Compact the index to its newest rows. Caller holds the exclusive lock."""
+        count = len(self._entries)
+        self._vectors[:count - n] = self._vectors[n:count]
+        del self._entries[:n]
+        self._rows = {entry['case_id']: row for row, entry in enumerate(self._entries)}
+        self._rewrite_entries()
+        self._write_meta()
+        self._generation += 1
+        self._centroids = None
+        self._trained = 0
+        self._tail_count = 0
+        if len(self._entries) >= self.ivf_threshold:
+            self._start_training()
+
+    def add(self, embedding: np.ndarray, metadata: Dict[str, Any]) -> str:
+        """
+        Index the embedding of an analysed case.
+
+        Args:
+            embedding: float vector of length dim
+            metadata: JSON-serializable fields returned with search hits
+                (e.g. the prediction result)
+
+        Returns:
+            The new case ID
+        """
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        if norm > 0:
+            vector = vector / norm
+        entry = dict(metadata, case_id=uuid.uuid4().hex, analysed_at=round(time.time(), 3))
+
+        with self._locked(exclusive=True):
+            self._sync()
+            if len(self._entries) >= self.max_entries:
+                self._drop_oldest(len(self._entries) // 2)
+            row = len(self._entries)
+            if row == len(self._vectors):
+                self._map(row * 2)
+            # The vector is in place before the entry line that makes the row visible
+            self._vectors[row] = vector
+            line = (json.dumps(entry) + '\n').encode()
+            with open(self._entries_path, 'ab') as f:
+                f.write(line)
+            self._entries_offset += len(line)
+            self._entries.append(entry)
+            self._rows[entry['case_id']] = row
+            if self._centroids is not None:
+                self._assign_tail(row + 1)
+
+            if row + 1 >= self.ivf_threshold and row + 1 >= 2 * self._trained:
+                self._start_training()
+        return entry['case_id']
+
+    # Coarse quantizer
+
+    def _assign_tail(self, total: int) -> None:
+        """Assign rows added since training, up to `total`, to their nearest list."""
+        begin = self._trained + self._tail_count
+        if total <= begin:
+            return
+        lists = np.argmax(self._vectors[begin:total].astype(np.float32) @ self._centroids.T, axis=1)
+        needed = total - self._trained
+        if needed > len(self._tail_lists):
+            self._tail_lists = np.resize(self._tail_lists, max(needed, 2 * len(self._tail_lists)))
+        self._tail_lists[self._tail_count:needed] = lists
+        self._tail_count = needed
+
+    def _start_training(self) -> None:
+        if self._training:
+            return
+        self._training = True
+        threading.Thread(target=self._train, name='similarity-ivf', daemon=True).start()
+
+    def _train(self) -> None:
+        """Train the coarse quantizer on a snapshot of the index (background thread)."""
+        try:
+            with self._lock:
+                count = len(self._entries)
+                generation = self._generation
+                rng = np.random.default_rng(count)
+                lists = int(np.clip(np.sqrt(count), 16, 4096))
+                sample_rows = np.sort(rng.choice(count, min(count, 64 * lists), replace=False))
+                sample = self._vectors[sample_rows].astype(np.float32)
+
+            start = time.perf_counter()
+            centroids = spherical_kmeans(sample, lists)
+            assignment = np.empty(count, dtype=np.int64)
+            for begin in range(0, count, SEARCH_BLOCK_ROWS):
+                # Rows below `count` are never rewritten unless the generation changes
+                block = self._vectors[begin:min(begin + SEARCH_BLOCK_ROWS, count)].astype(np.float32)
+                assignment[begin:begin + len(block)] = np.argmax(block @ centroids.T, axis=1)
+            order = np.argsort(assignment, kind='stable')
+            offsets = np.searchsorted(assignment[order], np.arange(lists + 1))
+
+            with self._lock:
+                if generation == self._generation:
+                    self._centroids = centroids
+                    self._list_order = order
+                    self._list_offsets = offsets
+                    self._trained = count
+                    self._tail_count = 0
+                    # Assign rows added while training ran
+                    self._assign_tail(len(self._entries))
+                    logger.info("Similarity index quantizer trained: %d lists over %d cases in %.1fs",
+                                lists, count, time.perf_counter() - start)
+        except Exception as e:
+            logger.error("Similarity index quantizer training failed: %s", e)
+        finally:
+            self._training = False
+
+    # Search
+
+    def _candidate_rows(self, query: np.ndarray, count: int) -> Optional[np.ndarray]:
+        """Rows in the inverted lists nearest the query, or None to scan everything."""
+        if self._centroids is None or count < self.ivf_threshold:
+            return None
+        probe = np.argsort(-(self._centroids @ query))[:self.nprobe]
+        rows = [self._list_order[self._list_offsets[c]:self._list_offsets[c + 1]] for c in probe]
+        tail = self._tail_lists[:count - self._trained]
+        rows.append(self._trained + np.flatnonzero(np.isin(tail, probe)))
+        return np.sort(np.concatenate(rows))
+
+    def _search(self, query: np.ndarray, k: int, exclude: Optional[int]) -> List[Dict[str, Any]]:
+        count = len(self._entries)
+        rows = self._candidate_rows(query, count)
+        if rows is None:
+            scores = np.empty(count, dtype=np.float32)
+            for begin in range(0, count, SEARCH_BLOCK_ROWS):
+                end = min(begin + SEARCH_BLOCK_ROWS, count)
+                scores[begin:end] = self._vectors[begin:end].astype(np.float32) @ query
+            rows = np.arange(count)
+        else:
+            scores = self._vectors[rows].astype(np.float32) @ query
+
+        if exclude is not None:
+            scores[rows == exclude] = -np.inf
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            dict(self._entries[int(rows[i])], similarity=round(float(scores[i]), 4))
+            for i in top if np.isfinite(scores[i])
+        ]
+
+    def search(self, embedding: np.ndarray, k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Find the k most similar indexed cases.
+
+        Args:
+            embedding: Query vector of length dim
+            k: Number of neighbours
+
+        Returns:
+            Entry metadata plus cosine 'similarity', most similar first
+        """
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        return self._timed_search(query, k)
+
+    def search_case(self, case_id: str, k: int = 5) -> Optional[List[Dict[str, Any]]]:
+        """
+        Find the k cases most similar to an indexed case, excluding itself.
+
+        Returns:
+            Neighbours as for search(), or None if the case is not indexed
+        """
+        return self._timed_search(None, k, case_id)
+
+    def get(self, case_id: str) -> Optional[Dict[str, Any]]:
+        """Stored metadata of an indexed case."""
+        with self._locked(exclusive=False):
+            self._sync()
+            row = self._rows.get(case_id)
+            return dict(self._entries[row]) if row is not None else None
+
+    def _timed_search(self, query: Optional[np.ndarray], k: int,
+                      case_id: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        start = time.perf_counter()
+        with self._locked(exclusive=False):
+            self._sync()
+            exclude = None
+            if case_id is not None:
+                exclude = self._rows.get(case_id)
+                if exclude is None:
+                    return None
+                query = self._vectors[exclude].astype(np.float32)
+            neighbors = self._search(query, k, exclude)
+            self.searches += 1
+            self.search_seconds += time.perf_counter() - start
+        return neighbors
+
+    def stats(self) -> dict:
+        """Entry count, quantizer state and mean search latency."""
+        return {
+            'entries': len(self),
+            'ivf_lists': 0 if self._centroids is None else len(self._centroids),
+            'ivf_trained_entries': self._trained,
+            'searches': self.searches,
+            'mean_search_ms': round(1000 * self.search_seconds / self.searches, 3) if self.searches else 0.0,
+        }
+
+
+def default_similarity_dir() -> str:
+    """Default index location next to the backend code."""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'similarity')
@@ -0,0 +1,129 @@
+"""
+WebSocket Prediction Streaming
+
+Keeps one WebSocket open per review session so a worklist of images can be
+analysed without a new HTTP request, multipart encoding and CORS preflight
+per image. Frames are pipelined into the inference path with a bounded
+number outstanding per session; results are pushed back as each one
+finishes, possibly out of order, tagged with the client's frame ID. A frame
+that has to wait (e.g. for the client's rate limit) keeps its credit, so
+the session reads no further frames until it proceeds.
+
+Protocol:
+    server -> {"type": "ready", "max_outstanding": N, "max_frame_bytes": M}
+    client -> optional text frame {"id": "<client id>"} naming the next image
+    client -> binary frame with the encoded PNG/JPEG bytes
+    server -> {"type": "result", "id": ..., <PredictionResponse fields>}
+           or {"type": "error", "id": ..., "status": <HTTP status>, "detail": {...}}
+"""
+
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Dict, Any, Optional, Set
+
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+
+logger = logging.getLogger(__name__)
+
+PredictFn = Callable[[bytes], Awaitable[Dict[str, Any]]]
+
+
+class StreamSession:
+    """One WebSocket session pipelining image frames into inference."""
+
+    def __init__(self, websocket: WebSocket, predict: PredictFn,
+                 max_outstanding: int = 8, max_frame_bytes: int = 16 * 1024 * 1024):
+        """
+        Args:
+            websocket: Accepted WebSocket connection
+            predict: Coroutine turning encoded image bytes into response fields;
+                raises HTTPException for per-image errors
+            max_outstanding: Frames in flight before the session stops reading
+            max_frame_bytes: Largest accepted image frame
+        """
+        self.websocket = websocket
+        self.predict = predict
+        self.max_outstanding = max_outstanding
+        self.max_frame_bytes = max_frame_bytes
+        self._credits = asyncio.Semaphore(max_outstanding)
+        self._send_lock = asyncio.Lock()
+        self._tasks: Set[asyncio.Task] = set()
+        self._sequence = 0
+        self.completed = 0
+
+    async def send(self, message: Dict[str, Any]) -> None:
+        async with self._send_lock:
+            await self.websocket.send_text(json.dumps(message))
+
+    async def run(self) -> None:
+        """Serve the session until the client disconnects."""
+        await self.send({
+            'type': 'ready',
+            'max_outstanding': self.max_outstanding,
+            'max_frame_bytes': self.max_frame_bytes,
+        })
+
+        pending_id: Optional[str] = None
+        try:
+            while True:
+                # Flow control: stop reading while too many frames are in flight,
+                # letting TCP backpressure slow the client down
+                await self._credits.acquire()
+                message = await self.websocket.receive()
+                if message['type'] == 'websocket.disconnect':
+                    self._credits.release()
+                    break
+
+                if message.get('text') is not None:
+                    self._credits.release()
+                    pending_id = self._parse_header(message['text'])
+                    continue
+
+                frame = message.get('bytes') or b''
+                frame_id = pending_id if pending_id is not None else str(self._sequence)
+                pending_id = None
+                self._sequence += 1
+
+                task = asyncio.create_task(self._process(frame_id, frame))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            logger.info("WebSocket session closed after %d frames", self.completed)
+
+    @staticmethod
+    def _parse_header(text: str) -> Optional[str]:
+        try:
+            header = json.loads(text)
+        except ValueError:
+            return None
+        frame_id = header.get('id') if isinstance(header, dict) else None
+        return str(frame_id) if frame_id is not None else None
+
+    async def _process(self, frame_id: str, frame: bytes) -> None:
+        try:
+            if not frame:
+                raise HTTPException(status_code=400, detail={"error": "No image data provided"})
+            if len(frame) > self.max_frame_bytes:
+                raise HTTPException(status_code=413, detail={"error": "Payload too large"})
+            result = await self.predict(frame)
+            message = {'type': 'result', 'id': frame_id, **result}
+        except HTTPException as e:
+            message = {'type': 'error', 'id': frame_id, 'status': e.status_code, 'detail': e.detail}
+        except Exception as e:
+            logger.error("WebSocket frame %s failed: %s", frame_id, e, exc_info=True)
+            message = {'type': 'error', 'id': frame_id, 'status': 500,
+                       'detail': {"error": "Internal server error", "message": "An unexpected error occurred"}}
+        finally:
+            self._credits.release()
+
+        self.completed += 1
+        try:
+            await self.send(message)
+        except (WebSocketDisconnect, RuntimeError):
+            # Client went away while this frame was in flight
+            pass
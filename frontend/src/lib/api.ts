@@ -1,4 +1,5 @@
 import axios from 'axios'
+import { downscaleForUpload } from './downscale'
 
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000'
 
@@ -16,6 +17,14 @@ export interface PredictionResponse {
   disclaimer: string
   validation_confidence?: number
   validation_warning?: string
+  explanation_id?: string
+}
+
+export interface ExplanationResponse {
+  explanation_id: string
+  prediction: 'Normal' | 'Pneumonia'
+  raw_score: number
+  overlay: string
 }
 
 export interface ModelInfo {
@@ -25,21 +34,48 @@ export interface ModelInfo {
   classes: string[]
   accuracy: string
   threshold: number
+  upload_max_dimension: number
+  upload_formats: string[]
 }
 
-export const predictPneumonia = async (file: File): Promise<PredictionResponse> => {
+// Fetched once; tells the client how far it can shrink uploads
+let modelInfoRequest: Promise<ModelInfo> | null = null
+
+const getUploadMaxDimension = async (): Promise<number> => {
+  modelInfoRequest ??= getModelInfo()
+  try {
+    return (await modelInfoRequest).upload_max_dimension ?? 0
+  } catch {
+    modelInfoRequest = null
+    return 0
+  }
+}
+
+export const predictPneumonia = async (
+  file: File,
+  options: { explain?: boolean } = {}
+): Promise<PredictionResponse> => {
+  // Upload a reduced copy; the backend never needs full resolution
+  const upload = await downscaleForUpload(file, await getUploadMaxDimension())
+
   const formData = new FormData()
-  formData.append('file', file)
+  formData.append('file', upload)
 
   const response = await api.post<PredictionResponse>('/api/predict', formData, {
     headers: {
       'Content-Type': 'multipart/form-data',
     },
+    params: options.explain ? { explain: true } : undefined,
   })
 
   return response.data
 }
 
+export const getExplanation = async (explanationId: string): Promise<ExplanationResponse> => {
+  const response = await api.get<ExplanationResponse>(`/api/explain/${explanationId}`)
+  return response.data
+}
+
 export const getModelInfo = async (): Promise<ModelInfo> => {
   const response = await api.get<ModelInfo>('/api/model/info')
   return response.data
@@ -49,3 +85,46 @@ export const checkHealth = async (): Promise<{ status: string }> => {
   const response = await api.get<{ status: string }>('/health')
   return response.data
 }
+
+export type StreamMessage =
+  | ({ type: 'result'; id: string } & PredictionResponse)
+  | { type: 'error'; id: string; status: number; detail: { error: string; message?: string } }
+
+/**
+ * Streams many images over one WebSocket (/ws/predict) instead of one
+ * HTTP request per image. Results arrive as each image finishes, possibly
+ * out of order, tagged with the id passed to `send`.
+ */
+export class PredictionStream {
+  private socket: WebSocket
+  private ready: Promise<void>
+
+  constructor(onMessage: (message: StreamMessage) => void) {
+    this.socket = new WebSocket(API_URL.replace(/^http/, 'ws') + '/ws/predict')
+    this.socket.binaryType = 'arraybuffer'
+    this.ready = new Promise((resolve, reject) => {
+      this.socket.addEventListener('error', () => reject(new Error('WebSocket connection failed')), { once: true })
+      this.socket.addEventListener('message', (event) => {
+        const message = JSON.parse(event.data)
+        if (message.type === 'ready') {
+          resolve()
+        } else {
+          onMessage(message as StreamMessage)
+        }
+      })
+    })
+  }
+
+  async send(id: string, file: Blob): Promise<void> {
+    const data = await file.arrayBuffer()
+    await this.ready
+    // No await between the frames, so concurrent sends cannot interleave a
+    // header with another upload's image
+    this.socket.send(JSON.stringify({ id }))
+    this.socket.send(data)
+  }
+
+  close(): void {
+    this.socket.close()
+  }
+}
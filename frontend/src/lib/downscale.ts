@@ -0,0 +1,38 @@
+import type { DownscaleRequest, DownscaleResult } from './downscale.worker'
+
+const supported =
+  typeof Worker !== 'undefined' &&
+  typeof OffscreenCanvas !== 'undefined' &&
+  typeof createImageBitmap !== 'undefined'
+
+/**
+ * Shrink an image so its longest side is at most `maxDimension` pixels and
+ * re-encode it as PNG or high-quality JPEG, in a Web Worker.
+ *
+ * Falls back to the original file when the browser lacks Worker or
+ * OffscreenCanvas support, when anything fails, or when the result would
+ * not be smaller than the original.
+ */
+export const downscaleForUpload = async (file: File, maxDimension: number): Promise<File> => {
+  if (!supported || maxDimension <= 0) return file
+
+  const worker = new Worker(new URL('./downscale.worker.ts', import.meta.url), { type: 'module' })
+  try {
+    const result = await new Promise<DownscaleResult>((resolve) => {
+      worker.onmessage = (event: MessageEvent<DownscaleResult>) => resolve(event.data)
+      worker.onerror = () => resolve({ error: 'Worker failed' })
+      const request: DownscaleRequest = { file, maxDimension }
+      worker.postMessage(request)
+    })
+
+    if ('error' in result || result.blob.size >= file.size) return file
+
+    const extension = result.blob.type === 'image/png' ? 'png' : 'jpg'
+    const name = file.name.replace(/\.[^.]+$/, '') + `.${extension}`
+    return new File([result.blob], name, { type: result.blob.type })
+  } catch {
+    return file
+  } finally {
+    worker.terminate()
+  }
+}
@@ -0,0 +1,41 @@
+// Downscales an X-ray off the main thread and re-encodes it. Colour channels
+// are kept as uploaded, so the server's grayscale check still sees the original.
+
+export interface DownscaleRequest {
+  file: Blob
+  maxDimension: number
+}
+
+export type DownscaleResult = { blob: Blob; width: number; height: number } | { error: string }
+
+// The worker global scope shares these members with Window
+const ctx = self as unknown as {
+  onmessage: ((event: MessageEvent<DownscaleRequest>) => void) | null
+  postMessage: (message: DownscaleResult) => void
+}
+
+ctx.onmessage = async (event) => {
+  try {
+    const { file, maxDimension } = event.data
+    const bitmap = await createImageBitmap(file)
+    const scale = Math.min(1, maxDimension / Math.max(bitmap.width, bitmap.height))
+    const width = Math.max(1, Math.round(bitmap.width * scale))
+    const height = Math.max(1, Math.round(bitmap.height * scale))
+
+    const canvas = new OffscreenCanvas(width, height)
+    const context = canvas.getContext('2d')
+    if (!context) throw new Error('2D context unavailable')
+    context.imageSmoothingQuality = 'high'
+    context.drawImage(bitmap, 0, 0, width, height)
+    bitmap.close()
+
+    // Keep whichever lossless or high-quality lossy encoding is smaller
+    const [png, jpeg] = await Promise.all([
+      canvas.convertToBlob({ type: 'image/png' }),
+      canvas.convertToBlob({ type: 'image/jpeg', quality: 0.92 }),
+    ])
+    ctx.postMessage({ blob: png.size <= jpeg.size ? png : jpeg, width, height })
+  } catch (error) {
+    ctx.postMessage({ error: error instanceof Error ? error.message : String(error) })
+  }
+}
@@ -1,18 +1,20 @@
 import { useState } from 'react'
 import { useDropzone } from 'react-dropzone'
-import { Upload, AlertCircle, CheckCircle2, XCircle, Info } from 'lucide-react'
+import { Upload, AlertCircle, CheckCircle2, XCircle, Info, Flame } from 'lucide-react'
 import { useMutation } from '@tanstack/react-query'
 import toast from 'react-hot-toast'
-import { predictPneumonia, type PredictionResponse } from '@/lib/api'
+import { predictPneumonia, getExplanation, type PredictionResponse } from '@/lib/api'
 import { formatConfidence, getConfidenceColor, cn } from '@/lib/utils'
 
 const AnalyzePage = () => {
   const [preview, setPreview] = useState<string | null>(null)
   const [result, setResult] = useState<PredictionResponse | null>(null)
   const [imageInfo, setImageInfo] = useState<{ width: number; height: number; size: number } | null>(null)
+  const [heatmap, setHeatmap] = useState<string | null>(null)
+  const [uploadedFile, setUploadedFile] = useState<File | null>(null)
 
   const mutation = useMutation({
-    mutationFn: predictPneumonia,
+    mutationFn: (file: File) => predictPneumonia(file),
     onSuccess: (data) => {
       setResult(data)
       toast.success('Analysis complete!')
@@ -44,6 +46,26 @@ const AnalyzePage = () => {
     },
   })
 
+  const explanation = useMutation({
+    // The Grad-CAM pass only runs when the user asks for the heatmap, on the
+    // model input the server kept from the prediction; the image is only sent
+    // again if that has expired
+    mutationFn: async ({ file, explanationId }: { file: File; explanationId?: string }) => {
+      if (explanationId) {
+        try {
+          return await getExplanation(explanationId)
+        } catch (error: any) {
+          if (error.response?.status !== 404) throw error
+        }
+      }
+      const explained = await predictPneumonia(file, { explain: true })
+      if (!explained.explanation_id) throw new Error('No explanation returned')
+      return getExplanation(explained.explanation_id)
+    },
+    onSuccess: (data) => setHeatmap(data.overlay),
+    onError: () => toast.error('Could not load the heatmap. Please analyze the image again.'),
+  })
+
   const validateImage = (file: File): Promise<boolean> => {
     return new Promise((resolve) => {
       const img = new Image()
@@ -138,6 +160,8 @@ const AnalyzePage = () => {
     setResult(null)
     setPreview(null)
     setImageInfo(null)
+    setHeatmap(null)
+    setUploadedFile(null)
 
     // Validate image
     const isValid = await validateImage(file)
@@ -151,6 +175,7 @@ const AnalyzePage = () => {
     reader.readAsDataURL(file)
 
     // Start analysis
+    setUploadedFile(file)
     try {
       mutation.mutate(file)
     } catch (error) {
@@ -225,6 +250,8 @@ const AnalyzePage = () => {
                   setPreview(null)
                   setResult(null)
                   setImageInfo(null)
+                  setHeatmap(null)
+                  setUploadedFile(null)
                 }}
                 className="px-4 py-2 border border-border rounded-lg hover:bg-muted transition-colors flex items-center gap-2"
               >
@@ -242,6 +269,32 @@ const AnalyzePage = () => {
                   alt="X-ray preview"
                   className="w-full rounded-lg border shadow-md"
                 />
+                {uploadedFile && (
+                  <div className="mt-4">
+                    {heatmap ? (
+                      <>
+                        <h3 className="text-lg font-semibold mb-2">Model Attention (Grad-CAM)</h3>
+                        <img
+                          src={heatmap}
+                          alt="Grad-CAM heatmap overlay"
+                          className="w-full rounded-lg border shadow-md"
+                        />
+                        <p className="text-xs text-muted-foreground mt-2">
+                          Warmer regions contributed most to the "{result.prediction}" prediction.
+                        </p>
+                      </>
+                    ) : (
+                      <button
+                        onClick={() => explanation.mutate({ file: uploadedFile, explanationId: result.explanation_id })}
+                        disabled={explanation.isPending}
+                        className="w-full px-4 py-2 border border-border rounded-lg hover:bg-muted transition-colors flex items-center justify-center gap-2 disabled:opacity-50"
+                      >
+                        <Flame className="h-4 w-4" />
+                        {explanation.isPending ? 'Loading heatmap...' : 'Show Heatmap'}
+                      </button>
+                    )}
+                  </div>
+                )}
                 {imageInfo && (
                   <div className="mt-4 p-4 bg-muted rounded-lg">
                     <p className="text-xs font-semibold mb-2">Image Information</p>